@@ -0,0 +1,6 @@
+"""
+Emulator benchmarks
+
+Run with `python -m benchmarks`; see `benchmarks.runner` for the options.
+
+"""
@@ -0,0 +1,128 @@
+import argparse
+import json
+from time import perf_counter
+
+from emulator import CPU, VM
+
+from .workloads import WORKLOADS
+
+# Benchmark runner
+#
+# Every workload is run to HLT on every engine; the best of `repeat`
+# timed runs is reported as instructions per second, cycles per second
+# and emulated clock in MHz. Instruction and cycle counts come from one
+# untimed reference run on CPU, so the timed runs carry no counting.
+
+ENGINES = {
+    "cpu":          CPU,
+    "reference":    lambda: CPU("reference"),
+    "vm":           VM,
+    "translator":   lambda: CPU("translated"),
+}
+
+
+def count(program):
+    """ Instructions and cycles of a program run to HLT """
+    cpu = CPU()
+    cpu.load(program)
+    instructions = cpu.step_n(1 << 62)
+    return instructions, cpu.cycles
+
+def measure(engine, program, repeat=3):
+    """ Best host seconds of repeat runs of program to HLT """
+    best = float("inf")
+    for _ in range(repeat):
+        machine = ENGINES[engine]()
+        cpu = getattr(machine, "cpu", machine)
+        cpu.load(program)
+        start = perf_counter()
+        machine.run()
+        best = min(best, perf_counter() - start)
+    return best
+
+def run(workloads=None, engines=None, scale=1, repeat=3):
+    """
+    Benchmark results as {workload: {engine: {"ips", "cps", "mhz"}}}
+    """
+    results = {}
+    for name in workloads or WORKLOADS:
+        program = WORKLOADS[name](scale)
+        instructions, cycles = count(program)
+        results[name] = {}
+        for engine in engines or ENGINES:
+            seconds = measure(engine, program, repeat)
+            results[name][engine] = {
+                "ips": instructions / seconds,
+                "cps": cycles / seconds,
+                "mhz": cycles / seconds / 1e6,
+            }
+    return results
+
+def compare(results, baseline, threshold=0.10):
+    """
+    Regressions against a baseline
+
+    Returns (workload, engine, baseline ips, ips, change) for every
+    result whose instructions per second dropped by more than
+    threshold.
+
+    """
+    regressions = []
+    for name, engines in results.items():
+        for engine, result in engines.items():
+            old = baseline.get(name, {}).get(engine)
+            if old is None:
+                continue
+            change = result["ips"] / old["ips"] - 1
+            if change < -threshold:
+                regressions.append((name, engine, old["ips"], result["ips"], change))
+    return regressions
+
+def report(results, baseline=None):
+    lines = ["%-12s %-11s %9s %9s %7s" % ("workload", "engine", "MIPS", "MHz", "change")]
+    for name, engines in results.items():
+        for engine, result in engines.items():
+            change = ""
+            old = (baseline or {}).get(name, {}).get(engine)
+            if old is not None:
+                change = "%+6.1f%%" % (100 * (result["ips"] / old["ips"] - 1))
+            lines.append("%-12s %-11s %9.3f %9.3f %7s" % (
+                name, engine, result["ips"] / 1e6, result["mhz"], change
+            ))
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Emulator benchmarks")
+    parser.add_argument("workloads", nargs="*", help="workloads to run, default all")
+    parser.add_argument("--engine", action="append", choices=list(ENGINES), help="engine to run, default all")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", metavar="PATH", help="save the results as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="tolerated slowdown, default 0.10")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error("unknown workloads: " + ", ".join(sorted(unknown)))
+
+    results = run(args.workloads, args.engine, args.scale, args.repeat)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(report(results, baseline))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, engine, old, new, change in regressions:
+            print("regression: %s on %s %.3f -> %.3f MIPS (%+.1f%%)" % (
+                name, engine, old / 1e6, new / 1e6, 100 * change
+            ))
+        if regressions:
+            return 1
+    return 0
@@ -0,0 +1,130 @@
+from emulator.assembler import *
+
+# Benchmark workloads
+#
+# Every workload is a function of a scale factor returning a program
+# that starts at 0x0000 and ends in HLT. Scale 1 runs for a few hundred
+# thousand instructions; loop counters are 16 bits, which bounds the
+# scale at 3.
+
+
+def _word(x):
+    if not 0 < x <= 0xffff:
+        raise ValueError("loop count out of range, lower the scale")
+    return x & 0xff, x >> 8
+
+def arithmetic(scale=1):
+    """ Tight 16-bit arithmetic loop """
+    return [
+        LXI_HL, 0x00,   0x00,
+        LXI_DE, 0x34,   0x12,
+        LXI_BC, *_word(20000 * scale),
+        DAD_DE,                 # 0x09
+        MOV_A_L,
+        ADD_H,
+        ADI,    0x11,
+        MOV_L_A,
+        DCX_BC,
+        MOV_A_B,
+        ORA_C,
+        JNZ,    0x09,   0x00,
+        HLT
+    ]
+
+def block_copy(scale=1):
+    """ Copy 4 KiB from 0x1000 to 0x3000, 4 * scale times """
+    return [
+        MVI_A,  4 * scale,
+        STA,    0x00,   0x0f,   # pass counter at 0x0f00
+        LXI_HL, 0x00,   0x10,   # 0x05
+        LXI_DE, 0x00,   0x30,
+        LXI_BC, 0x00,   0x10,
+        MOV_A_M,                # 0x0e
+        STAX_DE,
+        INX_HL,
+        INX_DE,
+        DCX_BC,
+        MOV_A_B,
+        ORA_C,
+        JNZ,    0x0e,   0x00,
+        LDA,    0x00,   0x0f,
+        DCR_A,
+        STA,    0x00,   0x0f,
+        JNZ,    0x05,   0x00,
+        HLT
+    ]
+
+def recursion(scale=1):
+    """ Doubly recursive Fibonacci, fib(17 + scale) ends up in HL """
+    return [
+        LXI_SP, 0x00,   0xf0,
+        LXI_HL, 0x00,   0x00,
+        MVI_A,  17 + scale,
+        CALL,   0x0c,   0x00,
+        HLT,
+        CPI,    0x02,           # 0x0c, fib: HL += fib(A)
+        JC,     0x1d,   0x00,
+        PUSH_PSW,
+        DCR_A,
+        CALL,   0x0c,   0x00,
+        POP_PSW,
+        SUI,    0x02,
+        CALL,   0x0c,   0x00,
+        RET,
+        MOV_E_A,                # 0x1d
+        MVI_D,  0x00,
+        DAD_DE,
+        RET
+    ]
+
+def stack_churn(scale=1):
+    """ PUSH, POP, XTHL and XCHG in a loop """
+    return [
+        LXI_SP, 0x00,   0xf0,
+        LXI_BC, *_word(10000 * scale),
+        LXI_DE, 0x22,   0x11,
+        LXI_HL, 0x44,   0x33,
+        PUSH_BC,                # 0x0c
+        PUSH_DE,
+        PUSH_HL,
+        PUSH_PSW,
+        POP_HL,
+        XTHL,
+        POP_DE,
+        XCHG,
+        POP_HL,
+        POP_BC,
+        DCX_BC,
+        MOV_A_B,
+        ORA_C,
+        JNZ,    0x0c,   0x00,
+        HLT
+    ]
+
+def branching(scale=1):
+    """ Data-dependent conditional branches over a rotating bit pattern """
+    return [
+        LXI_BC, *_word(20000 * scale),
+        MVI_A,  0x5a,
+        LXI_HL, 0x00,   0x00,
+        RLC,                    # 0x08
+        JNC,    0x0f,   0x00,
+        XRI,    0x1d,
+        INR_H,
+        CPI,    0x80,           # 0x0f
+        JC,     0x16,   0x00,
+        INR_L,
+        NOP,
+        MOV_D_A,                # 0x16
+        DCX_BC,
+        MOV_A_B,
+        ORA_C,
+        MOV_A_D,
+        JNZ,    0x08,   0x00,
+        HLT
+    ]
+
+WORKLOADS = {
+    workload.__name__: workload
+    for workload in (arithmetic, block_copy, recursion, stack_churn, branching)
+}
@@ -1,2 +1,3 @@
 from .cpu import CPU
-from .vm import VM
\ No newline at end of file
+from .vm import VM
+from .translator import Translator
@@ -1,105 +1,141 @@
-from .flags import encode, decode, s, z, p
-from .core  import *
+from array import array
 
+from .flags import CY, encode, s, z, p
 
-def __add_4(act_4, tmp_4, cy):
-    return (
-        (act_4 + tmp_4 + cy) // 16,
-        (act_4 + tmp_4 + cy) % 16
-    )
 
-def __add(act, tmp, cy):
-    ac, acc_l = __add_4(act % 16, tmp % 16, cy)
-    cy, acc_h = __add_4(act // 16, tmp // 16, ac)
-    acc = (acc_h << 4) | acc_l
-    return acc, ac, cy
+# Flag and result lookup tables.
+#
+# Every table is built once at import. Two-operand tables are indexed by
+# (cy << 16) | (act << 8) | tmp and hold (acc << 8) | flags, so an
+# instruction is answered by a single lookup.
+
+SZP_TABLE = array('B', [encode(s(acc), z(acc), 0, p(acc), 0) for acc in range(256)])
+
+ADD_TABLE = array('H', [
+    ((acc & 0xff) << 8) | SZP_TABLE[acc & 0xff] | (acc >> 8) | ((act ^ tmp ^ acc) & 0x10)
+    for cy in (0, 1)
+    for act in range(256)
+    for tmp in range(256)
+    for acc in (act + tmp + cy,)
+])
+
+# subtraction adds the one's complement; CY holds the inverted carry (borrow)
+SUB_TABLE = array('H', [
+    ((acc & 0xff) << 8) | SZP_TABLE[acc & 0xff] | ((acc >> 8) ^ CY) | ((act ^ tmp ^ acc ^ 0xff) & 0x10)
+    for cy in (0, 1)
+    for act in range(256)
+    for tmp in range(256)
+    for acc in (act + (tmp ^ 0xff) + 1 - cy,)
+])
+
+ANA_TABLE = array('H', [
+    ((act & tmp) << 8) | SZP_TABLE[act & tmp] for act in range(256) for tmp in range(256)
+])
+
+XRA_TABLE = array('H', [
+    ((act ^ tmp) << 8) | SZP_TABLE[act ^ tmp] for act in range(256) for tmp in range(256)
+])
+
+ORA_TABLE = array('H', [
+    ((act | tmp) << 8) | SZP_TABLE[act | tmp] for act in range(256) for tmp in range(256)
+])
+
+# INR / DCR leave CY untouched, so their tables hold flags without CY
+INR_TABLE = array('H', [ADD_TABLE[(tmp << 8) | 1] & ~CY for tmp in range(256)])
+DCR_TABLE = array('H', [SUB_TABLE[(tmp << 8) | 1] & ~CY for tmp in range(256)])
+
 
 def add(act, tmp):
     return adc(act, tmp)
 
 def adc(act, tmp, cy=0):
-    acc, ac, cy = __add(act, tmp, cy)
-    _s, _z, _p = s(acc), z(acc), p(acc)
-    flags = encode(_s, _z, ac, _p, cy)
-    return acc, flags
+    data = ADD_TABLE[(cy << 16) | (act << 8) | tmp]
+    return data >> 8, data & 0xff
 
 def sub(act, tmp):
-    return add(act, 256 - tmp)
+    return sbb(act, tmp)
+
+def sbb(act, tmp, cy=0):
+    data = SUB_TABLE[(cy << 16) | (act << 8) | tmp]
+    return data >> 8, data & 0xff
 
 def ana(act, tmp):
-    acc = act & tmp
-    s, z, p = s(acc), z(acc), p(acc)
-    flags = encode(s, z, 0, p, 0)
-    return acc, flags
+    data = ANA_TABLE[(act << 8) | tmp]
+    return data >> 8, data & 0xff
 
 def xra(act, tmp):
-    acc = act ^ tmp
-    s, z, p = s(acc), z(acc), p(acc)
-    flags = encode(s, z, 0, p, 0)
-    return acc, flags
+    data = XRA_TABLE[(act << 8) | tmp]
+    return data >> 8, data & 0xff
 
 def ora(act, tmp):
-    acc = act | tmp
-    s, z, p = s(acc), z(acc), p(acc)
-    flags = encode(s, z, 0, p, 0)
-    return acc, flags
+    data = ORA_TABLE[(act << 8) | tmp]
+    return data >> 8, data & 0xff
 
 def cmp(act, tmp):
-    _, flags = sub(act, tmp)
-    return act, flags
+    return act, SUB_TABLE[(act << 8) | tmp] & 0xff
+
+def inr(tmp, flags=0x02):
+    data = INR_TABLE[tmp]
+    return data >> 8, (data & 0xff) | (flags & CY)
+
+def dcr(tmp, flags=0x02):
+    data = DCR_TABLE[tmp]
+    return data >> 8, (data & 0xff) | (flags & CY)
 
 class ALU:
 
     def add(self, act, tmp):
-        return adc(act, tmp, 0)
-    
+        data = ADD_TABLE[(act << 8) | tmp]
+        return data >> 8, data & 0xff
+
     def adc(self, act, tmp, cy=0):
-        return adc(act, tmp, cy)
-    
+        data = ADD_TABLE[(cy << 16) | (act << 8) | tmp]
+        return data >> 8, data & 0xff
+
     def sub(self, act, tmp):
-        return sub(act, tmp)
-    
+        data = SUB_TABLE[(act << 8) | tmp]
+        return data >> 8, data & 0xff
+
     def SBB(self, act, tmp, cy=0):
-        return sbb(act, tmp, flags)
-    
+        data = SUB_TABLE[(cy << 16) | (act << 8) | tmp]
+        return data >> 8, data & 0xff
+
     def ana(self, act, tmp):
-        return ana(act, tmp)
-    
+        data = ANA_TABLE[(act << 8) | tmp]
+        return data >> 8, data & 0xff
+
     def xra(self, act, tmp):
-        return xra(act, tmp)
-    
+        data = XRA_TABLE[(act << 8) | tmp]
+        return data >> 8, data & 0xff
+
     def ORA(self, act, tmp):
-        return ora(act, tmp)
-    
-    def CMP(self, act, tmp, _):
-        _, flags = sub(act, tmp)
-        return act, flags
-
-    def INR(self, tmp):
-        acc, flags = add(act, 1)
-        s, z, ac, p, _ = decode(flags)
-        flags = encode(s, z, ac, p, 0)
-        return acc, flags
+        data = ORA_TABLE[(act << 8) | tmp]
+        return data >> 8, data & 0xff
 
-    def DCR(self, tmp):
-        acc, flags = SUB(tmp, 1)
-        s, z, ac, p, _ = decode(flags)
-        flags = encode(s, z, ac, p, 0)
-        return acc, flags
-    
-    def RLC(self, act):
-        """ 
+    def CMP(self, act, tmp, _=0):
+        return act, SUB_TABLE[(act << 8) | tmp] & 0xff
+
+    def INR(self, tmp, flags=0x02):
+        data = INR_TABLE[tmp]
+        return data >> 8, (data & 0xff) | (flags & CY)
+
+    def DCR(self, tmp, flags=0x02):
+        data = DCR_TABLE[tmp]
+        return data >> 8, (data & 0xff) | (flags & CY)
+
+    def RLC(self, act, _=0, flags_in=0x02):
+        """
         Rotate left
 
         (An+1) <- (An); (A0) <- (A7); (CY) <- (A7)
 
         """
-        cy = act // 128
-        acc = (act << 1) % 256 + cy
-        flags = encode(c=cy)
+        cy = act >> 7
+        acc = ((act << 1) & 0xff) | cy
+        flags = cy | (flags_in & ~CY)
         return acc, flags
 
-    def RRC(self, act, _, flags_in):
+    def RRC(self, act, _=0, flags_in=0x02):
         """
         Rotate right
 
@@ -111,25 +147,24 @@ class ALU:
         flags = cy | (flags_in & ~CY)
         return acc, flags
 
-    def RAL(self, act, _, flags):
+    def RAL(self, act, _=0, flags_in=0x02):
         """
         Rotate left through carry
 
         (An+1) <- (An); (CY) <- (A7); (A0) <- (CY)
 
         """
-        acc = (acc << 1) | (flags & CY)
-        flags = (acc // 256) | (flags & ~CY)
-        return acc % 256, flags
+        acc = (act << 1) | (flags_in & CY)
+        flags = (acc >> 8) | (flags_in & ~CY)
+        return acc & 0xff, flags
 
-    def RAR(self, act, tmp, flags):
+    def RAR(self, act, _=0, flags_in=0x02):
         """
         Rotate right through carry
 
         (An) <- (An+1); (CY) <- (A0); (A7) <- (CY)
 
         """
-        cy = flags & CY
-        
-
-        return 0x00, 0x00
+        acc = ((flags_in & CY) << 7) | (act >> 1)
+        flags = (act & CY) | (flags_in & ~CY)
+        return acc, flags
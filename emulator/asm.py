@@ -0,0 +1,330 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from .opcodes import OPCODES, D8
+
+# Two-pass 8080 assembler
+#
+# Source is one statement per line:
+#
+#   [label:] [mnemonic [operand, ...]] [; comment]
+#   name EQU expression
+#
+# The first pass sizes every statement and assigns labels, the second
+# evaluates the operands and emits bytes. Expressions combine numbers
+# (42, 0x2a, 2AH, $2A, 101010B, 'c'), symbols, `$` for the address of
+# the current statement, parentheses, unary - ~ and the binary operators
+# * / % + - << >> & ^ |. Directives are ORG, DB, DW, DS, EQU and END.
+
+Program = namedtuple("Program", "start image symbols")
+
+
+class AssemblyError(ValueError):
+
+    def __init__(self, message, line=None):
+        if line is not None:
+            message = "line %d: %s" % (line, message)
+        super().__init__(message)
+        self.line = line
+
+
+# mnemonic -> register operands -> Opcode; aliases keep the documented opcode
+ENCODINGS = {}
+for opcode in OPCODES:
+    ENCODINGS.setdefault(opcode.mnemonic, {}).setdefault(opcode.operands, opcode)
+
+# register pair spellings
+ALIASES = {"BC": "B", "DE": "D", "HL": "H"}
+
+# assembled programs kept by _assemble
+CACHE_SIZE = 256
+
+
+def assemble(source, origin=0x0000):
+    """
+    Assemble source text into a Program
+
+    start is the lowest address written, image the bytes from there on
+    with gaps filled with zeros, symbols maps labels to values. The last
+    CACHE_SIZE results are cached by source and origin; every call gets
+    its own copy of symbols.
+
+    """
+    program = _assemble(source, origin)
+    return program._replace(symbols=dict(program.symbols))
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _assemble(source, origin):
+    statements, symbols = _first_pass(source, origin)
+
+    memory = {}
+    for line, addr, name, operands in statements:
+        for offset, data in enumerate(_emit(name, operands, addr, symbols, line)):
+            memory[(addr + offset) & 0xffff] = data
+
+    if not memory:
+        return Program(origin, b"", symbols)
+    start, end = min(memory), max(memory) + 1
+    image = bytearray(end - start)
+    for addr, data in memory.items():
+        image[addr - start] = data
+    return Program(start, bytes(image), symbols)
+
+def _first_pass(source, origin):
+    statements = []
+    symbols = {}
+    addr = origin
+
+    def define(name, value, line):
+        if name in symbols:
+            raise AssemblyError("duplicate symbol %s" % name, line)
+        symbols[name] = value
+
+    for line, text in enumerate(source.splitlines(), 1):
+        label, name, operands = _parse(text, line)
+        if name == "EQU":
+            if label is None or len(operands) != 1:
+                raise AssemblyError("EQU needs a name and one value", line)
+            define(label, _evaluate(operands[0], symbols, addr, line), line)
+            continue
+        if label is not None:
+            define(label, addr, line)
+        if name is None:
+            continue
+        if name == "END":
+            break
+        if name == "ORG":
+            addr = _evaluate(_single(name, operands, line), symbols, addr, line)
+            continue
+
+        statements.append((line, addr, name, operands))
+        addr += _size(name, operands, symbols, addr, line)
+    return statements, symbols
+
+def _parse(text, line):
+    """ Split a line into label, upper-case mnemonic and operand strings """
+    tokens = _split(text, line)
+    label = name = None
+    operands = []
+    match = re.match(r"\s*([A-Za-z_.?@][\w.?@]*)\s*:(.*)$", tokens)
+    if match:
+        label, tokens = match.group(1), match.group(2)
+    fields = tokens.split(None, 2)
+    if label is None and len(fields) > 1 and fields[1].upper() == "EQU":
+        # name EQU value
+        label, name = fields[0], "EQU"
+        operands = _operands(fields[2] if len(fields) > 2 else "")
+    elif fields:
+        fields = tokens.split(None, 1)
+        name = fields[0].upper()
+        operands = _operands(fields[1] if len(fields) > 1 else "")
+    return label, name, operands
+
+def _split(text, line):
+    """ text without its comment, quotes respected """
+    quote = None
+    for k, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == ";":
+            return text[:k]
+    if quote:
+        raise AssemblyError("unterminated string", line)
+    return text
+
+def _operands(text):
+    """ Comma separated operands, quotes respected """
+    operands, current, quote = [], "", None
+    for ch in text:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == ",":
+            operands.append(current.strip())
+            current = ""
+            continue
+        current += ch
+    if current.strip() or operands:
+        operands.append(current.strip())
+    return operands
+
+def _single(name, operands, line):
+    if len(operands) != 1:
+        raise AssemblyError("%s takes one operand" % name, line)
+    return operands[0]
+
+def _size(name, operands, symbols, addr, line):
+    if name == "DB":
+        return sum(
+            len(op) - 2 if _is_string(op) else 1 for op in operands
+        )
+    if name == "DW":
+        return 2 * len(operands)
+    if name == "DS":
+        return _evaluate(_single(name, operands, line), symbols, addr, line)
+    return _encoding(name, line)[1].length
+
+def _is_string(operand):
+    return len(operand) >= 2 and operand[0] in "'\"" and operand[-1] == operand[0]
+
+def _emit(name, operands, addr, symbols, line):
+    if name == "DB":
+        data = []
+        for op in operands:
+            if _is_string(op):
+                data.extend(op[1:-1].encode("latin-1"))
+            else:
+                data.append(_byte(_evaluate(op, symbols, addr, line), line))
+        return data
+    if name == "DW":
+        data = []
+        for op in operands:
+            value = _word(_evaluate(op, symbols, addr, line), line)
+            data += [value & 0xff, value >> 8]
+        return data
+    if name == "DS":
+        return []
+
+    encodings, sample = _encoding(name, line)
+    count = len(sample.operands) + (sample.kind is not None)
+    if len(operands) != count:
+        raise AssemblyError("%s takes %d operands" % (name, count), line)
+
+    registers = operands[:len(sample.operands)]
+    if name == "RST":
+        registers = [str(_evaluate(registers[0], symbols, addr, line))]
+    key = tuple(ALIASES.get(op.upper(), op.upper()) for op in registers)
+    if key not in encodings:
+        raise AssemblyError("bad operands for %s: %s" % (name, ", ".join(operands)), line)
+
+    data = [encodings[key].opcode]
+    if sample.kind == D8:
+        data.append(_byte(_evaluate(operands[-1], symbols, addr, line), line))
+    elif sample.kind is not None:
+        value = _word(_evaluate(operands[-1], symbols, addr, line), line)
+        data += [value & 0xff, value >> 8]
+    return data
+
+def _encoding(name, line):
+    """ Encodings of mnemonic name and one of them """
+    encodings = ENCODINGS.get(name)
+    if encodings is None:
+        raise AssemblyError("unknown mnemonic %s" % name, line)
+    return encodings, next(iter(encodings.values()))
+
+def _byte(value, line):
+    if not -0x80 <= value <= 0xff:
+        raise AssemblyError("byte out of range: %d" % value, line)
+    return value & 0xff
+
+def _word(value, line):
+    if not -0x8000 <= value <= 0xffff:
+        raise AssemblyError("word out of range: %d" % value, line)
+    return value & 0xffff
+
+
+# Expressions
+
+TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>\$[0-9A-Fa-f]+|0[xX][0-9A-Fa-f]+|[0-9][0-9A-Fa-f]*[Hh]|[01]+[Bb]|[0-9]+)
+      | (?P<char>'[^']'|"[^"]")
+      | (?P<symbol>[A-Za-z_.?@][\w.?@]*)
+      | (?P<op><<|>>|[-+*/%&|^~()$])
+    )""", re.VERBOSE)
+
+BINARY = (
+    {"|": lambda x, y: x | y},
+    {"^": lambda x, y: x ^ y},
+    {"&": lambda x, y: x & y},
+    {"<<": lambda x, y: x << y, ">>": lambda x, y: x >> y},
+    {"+": lambda x, y: x + y, "-": lambda x, y: x - y},
+    {"*": lambda x, y: x * y, "/": lambda x, y: x // y, "%": lambda x, y: x % y},
+)
+
+def _tokenize(text, line):
+    tokens, pos = [], 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if not match:
+            raise AssemblyError("bad expression %s" % text, line)
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "number":
+            if value[0] == "$":
+                value = int(value[1:], 16)
+            elif value[-1] in "Hh":
+                value = int(value[:-1], 16)
+            elif value[-1] in "Bb" and not value.lower().startswith("0x"):
+                value = int(value[:-1], 2)
+            else:
+                value = int(value, 0) if value.lower().startswith("0x") else int(value, 10)
+            kind = "value"
+        elif kind == "char":
+            kind, value = "value", ord(value[1])
+        tokens.append((kind, value))
+    return tokens
+
+def _evaluate(text, symbols, here, line):
+    """ Value of expression text; $ is the address here """
+    tokens = _tokenize(text, line)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else (None, None)
+
+    def binary(level):
+        nonlocal pos
+        if level == len(BINARY):
+            return unary()
+        value = binary(level + 1)
+        while True:
+            kind, op = peek()
+            if kind != "op" or op not in BINARY[level]:
+                return value
+            pos += 1
+            rhs = binary(level + 1)
+            try:
+                value = BINARY[level][op](value, rhs)
+            except ZeroDivisionError:
+                raise AssemblyError("division by zero", line) from None
+
+    def unary():
+        nonlocal pos
+        kind, value = peek()
+        pos += 1
+        if kind == "value":
+            return value
+        if kind == "symbol":
+            if value not in symbols:
+                raise AssemblyError("undefined symbol %s" % value, line)
+            return symbols[value]
+        if kind == "op":
+            if value == "$":
+                return here
+            if value == "-":
+                return -unary()
+            if value == "+":
+                return unary()
+            if value == "~":
+                return ~unary()
+            if value == "(":
+                inner = binary(0)
+                if peek() != ("op", ")"):
+                    raise AssemblyError("missing )", line)
+                pos += 1
+                return inner
+        raise AssemblyError("bad expression %s" % text, line)
+
+    value = binary(0)
+    if pos != len(tokens):
+        raise AssemblyError("bad expression %s" % text, line)
+    return value
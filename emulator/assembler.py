@@ -6,9 +6,7 @@ INR_B		= 0x04
 DCR_B		= 0x05
 MVI_B		= 0x06
 RLC	        = 0x07
-
 DAD_BC		= 0x09
-
 LDAX_BC		= 0x0a
 DCX_BC		= 0x0b
 INR_C		= 0x0c
@@ -72,6 +70,12 @@ MOV_B_A		= 0x47
 MOV_C_B		= 0x48
 MOV_C_C		= 0x49
 MOV_C_D		= 0x4a
+MOV_C_E		= 0x4b
+MOV_C_H		= 0x4c
+MOV_C_L		= 0x4d
+MOV_C_M		= 0x4e
+MOV_C_A		= 0x4f
+
 MOV_D_B		= 0x50
 MOV_D_C		= 0x51
 MOV_D_D		= 0x52
@@ -88,6 +92,7 @@ MOV_E_H		= 0x5c
 MOV_E_L		= 0x5d
 MOV_E_M		= 0x5e
 MOV_E_A		= 0x5f
+
 MOV_H_B		= 0x60
 MOV_H_C		= 0x61
 MOV_H_D		= 0x62
@@ -104,6 +109,7 @@ MOV_L_H		= 0x6c
 MOV_L_L		= 0x6d
 MOV_L_M		= 0x6e
 MOV_L_A		= 0x6f
+
 MOV_M_B		= 0x70
 MOV_M_C		= 0x71
 MOV_M_D		= 0x72
@@ -120,6 +126,7 @@ MOV_A_H		= 0x7c
 MOV_A_L		= 0x7d
 MOV_A_M		= 0x7e
 MOV_A_A		= 0x7f
+
 ADD_B		= 0x80
 ADD_C		= 0x81
 ADD_D		= 0x82
@@ -136,6 +143,7 @@ ADC_H		= 0x8c
 ADC_L		= 0x8d
 ADC_M		= 0x8e
 ADC_A		= 0x8f
+
 SUB_B		= 0x90
 SUB_C		= 0x91
 SUB_D		= 0x92
@@ -152,8 +160,100 @@ SBB_H		= 0x9c
 SBB_L		= 0x9d
 SBB_M		= 0x9e
 SBB_A		= 0x9f
+
 ANA_B		= 0xa0
 ANA_C		= 0xa1
+ANA_D		= 0xa2
+ANA_E		= 0xa3
+ANA_H		= 0xa4
+ANA_L		= 0xa5
+ANA_M		= 0xa6
+ANA_A		= 0xa7
+XRA_B		= 0xa8
+XRA_C		= 0xa9
+XRA_D		= 0xaa
+XRA_E		= 0xab
+XRA_H		= 0xac
+XRA_L		= 0xad
+XRA_M		= 0xae
+XRA_A		= 0xaf
+
+ORA_B		= 0xb0
+ORA_C		= 0xb1
+ORA_D		= 0xb2
+ORA_E		= 0xb3
+ORA_H		= 0xb4
+ORA_L		= 0xb5
+ORA_M		= 0xb6
+ORA_A		= 0xb7
+CMP_B		= 0xb8
+CMP_C		= 0xb9
+CMP_D		= 0xba
+CMP_E		= 0xbb
+CMP_H		= 0xbc
+CMP_L		= 0xbd
+CMP_M		= 0xbe
+CMP_A		= 0xbf
 
+RNZ	        = 0xc0
+POP_BC		= 0xc1
+JNZ	        = 0xc2
 JMP         = 0xc3
+CNZ	        = 0xc4
+PUSH_BC		= 0xc5
+ADI	        = 0xc6
+RST_0		= 0xc7
+RZ	        = 0xc8
+RET	        = 0xc9
 JZ          = 0xca
+CZ	        = 0xcc
+CALL		= 0xcd
+ACI	        = 0xce
+RST_1		= 0xcf
+
+RNC	        = 0xd0
+POP_DE		= 0xd1
+JNC	        = 0xd2
+OUT	        = 0xd3
+CNC	        = 0xd4
+PUSH_DE		= 0xd5
+SUI	        = 0xd6
+RST_2		= 0xd7
+RC	        = 0xd8
+JC	        = 0xda
+IN	        = 0xdb
+CC	        = 0xdc
+SBI	        = 0xde
+RST_3		= 0xdf
+
+RPO	        = 0xe0
+POP_HL		= 0xe1
+JPO	        = 0xe2
+XTHL		= 0xe3
+CPO	        = 0xe4
+PUSH_HL		= 0xe5
+ANI	        = 0xe6
+RST_4		= 0xe7
+RPE	        = 0xe8
+PCHL		= 0xe9
+JPE	        = 0xea
+XCHG		= 0xeb
+CPE	        = 0xec
+XRI	        = 0xee
+RST_5		= 0xef
+
+RP	        = 0xf0
+POP_PSW		= 0xf1
+JP	        = 0xf2
+DI	        = 0xf3
+CP	        = 0xf4
+PUSH_PSW		= 0xf5
+ORI	        = 0xf6
+RST_6		= 0xf7
+RM	        = 0xf8
+SPHL		= 0xf9
+JM	        = 0xfa
+EI	        = 0xfb
+CM	        = 0xfc
+CPI	        = 0xfe
+RST_7		= 0xff
@@ -0,0 +1,490 @@
+import numpy as np
+
+from .registers     import *
+from .flags         import Z, P, CY, S
+from .alu           import ADD_TABLE, SUB_TABLE, ANA_TABLE, XRA_TABLE, ORA_TABLE, INR_TABLE, DCR_TABLE
+from .memory        import image
+from .instructions  import CYCLES, TAKEN, REGISTERS, PAIRS, CONDITIONS, generic
+from .cpu           import CPU
+
+# Structure-of-arrays batch engine
+#
+# N machines share one set of NumPy arrays: every register is a row of
+# `regs`, memory is an N x 64 KiB array. A step fetches the opcode of
+# every live lane, groups the lanes by opcode and runs each group's
+# handler once over all of its lanes. The handlers below mirror the
+# specialized handlers of `instructions` and answer the arithmetic from
+# the same ALU tables, so every lane matches a scalar CPU exactly.
+#
+# Memory is plain RAM and IN/OUT use the port latches; page mappings and
+# bus devices of the scalar CPU are not modelled.
+
+_ADD    = np.frombuffer(ADD_TABLE, dtype=np.uint16).astype(np.int64)
+_SUB    = np.frombuffer(SUB_TABLE, dtype=np.uint16).astype(np.int64)
+_ANA    = np.frombuffer(ANA_TABLE, dtype=np.uint16).astype(np.int64)
+_XRA    = np.frombuffer(XRA_TABLE, dtype=np.uint16).astype(np.int64)
+_ORA    = np.frombuffer(ORA_TABLE, dtype=np.uint16).astype(np.int64)
+_INR    = np.frombuffer(INR_TABLE, dtype=np.uint16).astype(np.int64)
+_DCR    = np.frombuffer(DCR_TABLE, dtype=np.uint16).astype(np.int64)
+_CYCLES = np.array(CYCLES, dtype=np.int64)
+
+
+class Batch:
+
+    def __init__(self, n):
+
+        self.n = n
+
+        # program counter and stack pointer of every lane
+        self.pc = np.zeros(n, dtype=np.int64)
+        self.sp = np.full(n, 0xbeef, dtype=np.int64)
+
+        # B C D E H L - A, one row per register
+        self.regs = np.zeros((8, n), dtype=np.int64)
+        self.flags = np.full(n, 0x02, dtype=np.int64)
+
+        # instruction register
+        self.ir = np.zeros(n, dtype=np.int64)
+
+        self.halt = np.zeros(n, dtype=bool)
+        self.ints = np.zeros(n, dtype=bool)
+        self.cycles = np.zeros(n, dtype=np.int64)
+
+        # memory and I/O ports
+        self.mem = np.zeros((n, 1 << 16), dtype=np.uint8)
+        self.ports = np.zeros((n, 256), dtype=np.uint8)
+
+        self.dispatch = build_dispatch()
+
+    def load(self, source, addr=0x0000):
+        """ Copy a program to memory at addr in every lane """
+        data = np.frombuffer(bytes(image(source)), dtype=np.uint8)
+        if addr + len(data) > 1 << 16:
+            raise ValueError("program does not fit in memory")
+        self.mem[:, addr:addr + len(data)] = data
+
+    def lane(self, k):
+        """ Scalar CPU holding the state of lane k """
+        cpu = CPU()
+        cpu.pc, cpu.sp = int(self.pc[k]), int(self.sp[k])
+        cpu.regs = [int(x) for x in self.regs[:, k]]
+        cpu.flags, cpu.ir = int(self.flags[k]), int(self.ir[k])
+        cpu.halt, cpu.ints = bool(self.halt[k]), bool(self.ints[k])
+        cpu.cycles = int(self.cycles[k])
+        cpu.mem[:] = self.mem[k].tobytes()
+        cpu.ports[:] = self.ports[k].tobytes()
+        return cpu
+
+    def set_lane(self, k, cpu):
+        """ Copy the state of a scalar CPU into lane k """
+        self.pc[k], self.sp[k] = cpu.pc, cpu.sp
+        self.regs[:, k] = cpu.regs
+        self.flags[k], self.ir[k] = cpu.flags, cpu.ir
+        self.halt[k], self.ints[k] = cpu.halt, cpu.ints
+        self.cycles[k] = cpu.cycles
+        self.mem[k] = np.frombuffer(cpu.mem, dtype=np.uint8)
+        self.ports[k] = np.frombuffer(cpu.ports, dtype=np.uint8)
+
+    def step(self):
+        """ Execute one instruction on every running lane, return how many ran """
+        return self.__step(np.flatnonzero(~self.halt))
+
+    def step_n(self, n):
+        """ Execute up to n steps, return the instructions executed over all lanes """
+        count = 0
+        for _ in range(n):
+            ran = self.step()
+            if not ran:
+                break
+            count += ran
+        return count
+
+    def run(self, max_cycles=None):
+        """
+        Execute until every lane halted or reached max_cycles
+
+        Returns the instructions executed over all lanes.
+
+        """
+        count = 0
+        while True:
+            live = ~self.halt
+            if max_cycles is not None:
+                live &= self.cycles < max_cycles
+            ran = self.__step(np.flatnonzero(live))
+            if not ran:
+                return count
+            count += ran
+
+    def __step(self, lanes):
+        if not lanes.size:
+            return 0
+        pc = self.pc[lanes]
+        opc = self.mem[lanes, pc].astype(np.int64)
+        self.pc[lanes] = (pc + 1) & 0xffff
+        self.ir[lanes] = opc
+        self.cycles[lanes] += _CYCLES[opc]
+
+        first = opc[0]
+        if (opc == first).all():
+            self.dispatch[first](self, lanes)
+            return lanes.size
+
+        # lanes diverged: one handler call per distinct opcode
+        order = np.argsort(opc, kind="stable")
+        opc = opc[order]
+        lanes = lanes[order]
+        bounds = np.flatnonzero(opc[1:] != opc[:-1]) + 1
+        start = 0
+        for end in (*bounds, len(opc)):
+            self.dispatch[opc[start]](self, lanes[start:end])
+            start = end
+        return len(opc)
+
+    # memory operation
+
+    def read(self, i, addr):
+        return self.mem[i, addr].astype(np.int64)
+
+    def write(self, i, addr, data):
+        self.mem[i, addr] = data
+
+    def read_16(self, i, addr):
+        return (self.read(i, (addr + 1) & 0xffff) << 8) | self.read(i, addr)
+
+    def write_16(self, i, addr, data_16):
+        self.mem[i, addr] = data_16 & 0xff
+        self.mem[i, (addr + 1) & 0xffff] = data_16 >> 8
+
+    def fetch(self, i):
+        pc = self.pc[i]
+        self.pc[i] = (pc + 1) & 0xffff
+        return self.read(i, pc)
+
+    def fetch_16(self, i):
+        pc = self.pc[i]
+        self.pc[i] = (pc + 2) & 0xffff
+        return self.read_16(i, pc)
+
+    # stack operations
+
+    def push_16(self, i, data_16):
+        sp = (self.sp[i] - 2) & 0xffff
+        self.sp[i] = sp
+        self.write_16(i, sp, data_16)
+
+    def pop_16(self, i):
+        sp = self.sp[i]
+        self.sp[i] = (sp + 2) & 0xffff
+        return self.read_16(i, sp)
+
+    # register access
+
+    def hl(self, i):
+        return (self.regs[H, i] << 8) | self.regs[L, i]
+
+    def get(self, r, i):
+        if r == M:
+            return self.read(i, self.hl(i))
+        return self.regs[r, i]
+
+    def set(self, r, i, data):
+        if r == M:
+            self.write(i, self.hl(i), data)
+        else:
+            self.regs[r, i] = data
+
+    def pair(self, rp, i):
+        if rp == SP:
+            return self.sp[i]
+        return (self.regs[2 * rp, i] << 8) | self.regs[2 * rp + 1, i]
+
+    def set_pair(self, rp, i, data_16):
+        if rp == SP:
+            self.sp[i] = data_16
+        else:
+            self.regs[2 * rp, i] = data_16 >> 8
+            self.regs[2 * rp + 1, i] = data_16 & 0xff
+
+
+# Vectorized handlers
+#
+# Every handler takes the batch and the lanes it runs on. Factories bind
+# registers, pairs and conditions like `instructions.build_dispatch`.
+
+def _named(handler, name):
+    handler.__name__ = handler.__qualname__ = name
+    return handler
+
+def _mov(dst, src):
+    def handler(b, i):
+        b.set(dst, i, b.get(src, i))
+    return _named(handler, "MOV_%s_%s" % (REGISTERS[dst], REGISTERS[src]))
+
+def _mvi(dst):
+    def handler(b, i):
+        b.set(dst, i, b.fetch(i))
+    return _named(handler, "MVI_" + REGISTERS[dst])
+
+def _accumulate(name, table, src, cy):
+    def handler(b, i):
+        tmp = b.fetch(i) if src is None else b.get(src, i)
+        index = (b.regs[A, i] << 8) | tmp
+        if cy:
+            index |= (b.flags[i] & CY) << 16
+        data = table[index]
+        b.regs[A, i] = data >> 8
+        b.flags[i] = data & 0xff
+    return _named(handler, name)
+
+def _compare(name, src):
+    def handler(b, i):
+        tmp = b.fetch(i) if src is None else b.get(src, i)
+        b.flags[i] = _SUB[(b.regs[A, i] << 8) | tmp] & 0xff
+    return _named(handler, name)
+
+def _step(name, table, dst):
+    def handler(b, i):
+        data = table[b.get(dst, i)]
+        b.set(dst, i, data >> 8)
+        b.flags[i] = (data & 0xff) | (b.flags[i] & CY)
+    return _named(handler, name + "_" + REGISTERS[dst])
+
+def _lxi(rp):
+    def handler(b, i):
+        b.set_pair(rp, i, b.fetch_16(i))
+    return _named(handler, "LXI_" + PAIRS[rp])
+
+def _ldax(rp):
+    def handler(b, i):
+        b.regs[A, i] = b.read(i, b.pair(rp, i))
+    return _named(handler, "LDAX_" + PAIRS[rp])
+
+def _stax(rp):
+    def handler(b, i):
+        b.write(i, b.pair(rp, i), b.regs[A, i])
+    return _named(handler, "STAX_" + PAIRS[rp])
+
+def _inx(name, rp, delta):
+    def handler(b, i):
+        b.set_pair(rp, i, (b.pair(rp, i) + delta) & 0xffff)
+    return _named(handler, name + "_" + PAIRS[rp])
+
+def _dad(rp):
+    def handler(b, i):
+        data = b.hl(i) + b.pair(rp, i)
+        b.set_pair(HL, i, data & 0xffff)
+        b.flags[i] = (b.flags[i] & ~CY) | (data >> 16)
+    return _named(handler, "DAD_" + PAIRS[rp])
+
+def _push(rp):
+    if rp == SP:
+        def handler(b, i):
+            b.push_16(i, (b.regs[A, i] << 8) | b.flags[i])
+        return _named(handler, "PUSH_PSW")
+    def handler(b, i):
+        b.push_16(i, b.pair(rp, i))
+    return _named(handler, "PUSH_" + PAIRS[rp])
+
+def _pop(rp):
+    if rp == SP:
+        def handler(b, i):
+            data_16 = b.pop_16(i)
+            b.regs[A, i] = data_16 >> 8
+            b.flags[i] = (data_16 & 0xd7) | 0x02
+        return _named(handler, "POP_PSW")
+    def handler(b, i):
+        b.set_pair(rp, i, b.pop_16(i))
+    return _named(handler, "POP_" + PAIRS[rp])
+
+def _taken(b, i, ccc):
+    mask = (Z, CY, P, S)[ccc >> 1]
+    flag = (b.flags[i] & mask) != 0
+    return flag if ccc & 1 else ~flag
+
+def _jcc(ccc):
+    def handler(b, i):
+        addr = b.fetch_16(i)
+        taken = _taken(b, i, ccc)
+        b.pc[i[taken]] = addr[taken]
+    return _named(handler, "J" + CONDITIONS[ccc])
+
+def _ccc(ccc):
+    def handler(b, i):
+        addr = b.fetch_16(i)
+        taken = _taken(b, i, ccc)
+        j = i[taken]
+        b.cycles[j] += TAKEN
+        b.push_16(j, b.pc[j])
+        b.pc[j] = addr[taken]
+    return _named(handler, "C" + CONDITIONS[ccc])
+
+def _rcc(ccc):
+    def handler(b, i):
+        j = i[_taken(b, i, ccc)]
+        b.cycles[j] += TAKEN
+        b.pc[j] = b.pop_16(j)
+    return _named(handler, "R" + CONDITIONS[ccc])
+
+def _rst(nnn):
+    def handler(b, i):
+        b.push_16(i, b.pc[i])
+        b.pc[i] = nnn << 3
+    return _named(handler, "RST_%d" % nnn)
+
+def NOP(b, i):
+    pass
+
+def HLT(b, i):
+    b.halt[i] = True
+
+def RLC(b, i):
+    act = b.regs[A, i]
+    cy = act >> 7
+    b.regs[A, i] = ((act << 1) & 0xff) | cy
+    b.flags[i] = cy | (b.flags[i] & ~CY)
+
+def RRC(b, i):
+    act = b.regs[A, i]
+    cy = act & 0x01
+    b.regs[A, i] = (cy << 7) | (act >> 1)
+    b.flags[i] = cy | (b.flags[i] & ~CY)
+
+def RAL(b, i):
+    flags = b.flags[i]
+    acc = (b.regs[A, i] << 1) | (flags & CY)
+    b.regs[A, i] = acc & 0xff
+    b.flags[i] = (acc >> 8) | (flags & ~CY)
+
+def RAR(b, i):
+    act, flags = b.regs[A, i], b.flags[i]
+    b.regs[A, i] = ((flags & CY) << 7) | (act >> 1)
+    b.flags[i] = (act & CY) | (flags & ~CY)
+
+def DAA(b, i):
+    pass
+
+def CMA(b, i):
+    b.regs[A, i] ^= 0xff
+
+def STC(b, i):
+    b.flags[i] |= CY
+
+def CMC(b, i):
+    b.flags[i] ^= CY
+
+def SHLD(b, i):
+    addr = b.fetch_16(i)
+    b.write(i, addr, b.regs[L, i])
+    b.write(i, (addr + 1) & 0xffff, b.regs[H, i])
+
+def LHLD(b, i):
+    addr = b.fetch_16(i)
+    b.regs[L, i] = b.read(i, addr)
+    b.regs[H, i] = b.read(i, (addr + 1) & 0xffff)
+
+def STA(b, i):
+    b.write(i, b.fetch_16(i), b.regs[A, i])
+
+def LDA(b, i):
+    b.regs[A, i] = b.read(i, b.fetch_16(i))
+
+def JMP(b, i):
+    b.pc[i] = b.fetch_16(i)
+
+def CALL(b, i):
+    addr = b.fetch_16(i)
+    b.push_16(i, b.pc[i])
+    b.pc[i] = addr
+
+def RET(b, i):
+    b.pc[i] = b.pop_16(i)
+
+def PCHL(b, i):
+    b.pc[i] = b.hl(i)
+
+def SPHL(b, i):
+    b.sp[i] = b.hl(i)
+
+def XCHG(b, i):
+    regs = b.regs
+    d, e = regs[D, i], regs[E, i]
+    regs[D, i], regs[E, i] = regs[H, i], regs[L, i]
+    regs[H, i], regs[L, i] = d, e
+
+def XTHL(b, i):
+    sp = b.sp[i]
+    data_16 = b.read_16(i, sp)
+    b.write_16(i, sp, b.hl(i))
+    b.set_pair(HL, i, data_16)
+
+def IN(b, i):
+    b.regs[A, i] = b.ports[i, b.fetch(i)]
+
+def OUT(b, i):
+    b.ports[i, b.fetch(i)] = b.regs[A, i]
+
+def EI(b, i):
+    b.ints[i] = True
+
+def DI(b, i):
+    b.ints[i] = False
+
+_SIMPLE = {
+    handler.__name__: handler for handler in (
+        NOP, HLT, RLC, RRC, RAL, RAR, DAA, CMA, STC, CMC, SHLD, LHLD,
+        STA, LDA, JMP, CALL, RET, PCHL, SPHL, XCHG, XTHL, IN, OUT, EI, DI,
+    )
+}
+
+def build_dispatch():
+    """ Build the 256-entry table of vectorized handlers """
+    # operand-free opcodes follow the layout of the generic table
+    table = [_SIMPLE.get(ins.__name__) for ins in generic]
+
+    for opc in range(0x40, 0x80):
+        if opc != 0x76:
+            table[opc] = _mov((opc >> 3) & 0x07, opc & 0x07)
+
+    accumulate = (
+        ("ADD", _ADD, 0, "ADI"),
+        ("ADC", _ADD, 1, "ACI"),
+        ("SUB", _SUB, 0, "SUI"),
+        ("SBB", _SUB, 1, "SBI"),
+        ("ANA", _ANA, 0, "ANI"),
+        ("XRA", _XRA, 0, "XRI"),
+        ("ORA", _ORA, 0, "ORI"),
+    )
+    for alu_op, (name, tbl, cy, imm) in enumerate(accumulate):
+        for src in range(8):
+            table[0x80 | (alu_op << 3) | src] = _accumulate(name + "_" + REGISTERS[src], tbl, src, cy)
+        table[0xc6 | (alu_op << 3)] = _accumulate(imm, tbl, None, cy)
+
+    for src in range(8):
+        table[0xb8 | src] = _compare("CMP_" + REGISTERS[src], src)
+    table[0xfe] = _compare("CPI", None)
+
+    for r in range(8):
+        table[0x04 | (r << 3)] = _step("INR", _INR, r)
+        table[0x05 | (r << 3)] = _step("DCR", _DCR, r)
+        table[0x06 | (r << 3)] = _mvi(r)
+
+    for rp in range(4):
+        table[0x01 | (rp << 4)] = _lxi(rp)
+        table[0x03 | (rp << 4)] = _inx("INX", rp, 1)
+        table[0x0b | (rp << 4)] = _inx("DCX", rp, -1)
+        table[0x09 | (rp << 4)] = _dad(rp)
+        table[0xc1 | (rp << 4)] = _pop(rp)
+        table[0xc5 | (rp << 4)] = _push(rp)
+
+    for rp in (BC, DE):
+        table[0x02 | (rp << 4)] = _stax(rp)
+        table[0x0a | (rp << 4)] = _ldax(rp)
+
+    for n in range(8):
+        table[0xc2 | (n << 3)] = _jcc(n)
+        table[0xc4 | (n << 3)] = _ccc(n)
+        table[0xc0 | (n << 3)] = _rcc(n)
+        table[0xc7 | (n << 3)] = _rst(n)
+
+    return table
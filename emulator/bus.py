@@ -0,0 +1,140 @@
+import asyncio
+from collections import deque
+
+# I/O port bus
+#
+# Devices register for port numbers in a 256-entry table. IN and OUT on
+# a port without a device read and write the latch in `cpu.ports`.
+#
+# A device that has no data yet returns None from read(). The bus then
+# raises Blocked, the IN instruction is rewound and the machine stops;
+# `run` awaits the device's wait() and retries the instruction, so many
+# machines with host I/O can share one event loop.
+
+
+class Blocked(Exception):
+    """ Raised by IN when its device is waiting for host I/O """
+
+    def __init__(self, device, port):
+        super().__init__("port 0x%02x is waiting for input" % port)
+        self.device = device
+        self.port = port
+
+
+class Device:
+    """ Base class of bus devices """
+
+    def read(self, port):
+        """ Byte for IN from port, None while waiting for input """
+        return 0xff
+
+    def write(self, port, data):
+        """ Byte from OUT to port """
+        pass
+
+    async def wait(self):
+        """ Return once read() has data """
+        pass
+
+
+class Bus:
+
+    def __init__(self, ports):
+
+        # latch of every port, used by ports without a device
+        self.ports = ports
+
+        self.devices = [None] * 256
+
+    def attach(self, device, *ports):
+        """ Register device for ports """
+        for port in ports:
+            self.devices[port] = device
+        return device
+
+    def detach(self, *ports):
+        for port in ports:
+            self.devices[port] = None
+
+    def read(self, port):
+        device = self.devices[port]
+        if device is None:
+            return self.ports[port]
+        data = device.read(port)
+        if data is None:
+            raise Blocked(device, port)
+        self.ports[port] = data
+        return data
+
+    def write(self, port, data):
+        self.ports[port] = data
+        device = self.devices[port]
+        if device is not None:
+            device.write(port, data)
+
+
+class Stream(Device):
+    """
+    Serial line over asyncio streams
+
+    Bytes from reader are returned by IN on the data port, OUT on the
+    data port is written to writer. The status port reads bit 0 set when
+    input is waiting and bit 1 set when output is possible. Once reader
+    is at EOF, the data port reads 0xff.
+
+    """
+
+    RX_READY    = 0x01
+    TX_READY    = 0x02
+
+    def __init__(self, reader=None, writer=None, data=0x00, status=0x01):
+        self.reader = reader
+        self.writer = writer
+        self.data = data
+        self.status = status
+        self.input = deque()
+        self.eof = reader is None
+
+    def feed(self, data):
+        """ Queue bytes for input """
+        self.input.extend(data)
+
+    def read(self, port):
+        if port == self.status:
+            return (self.RX_READY if self.input else 0) | self.TX_READY
+        if self.input:
+            return self.input.popleft()
+        return 0xff if self.eof else None
+
+    def write(self, port, data):
+        if port == self.data and self.writer is not None:
+            self.writer.write(bytes((data,)))
+
+    async def wait(self):
+        data = await self.reader.read(4096)
+        if data:
+            self.feed(data)
+        else:
+            self.eof = True
+
+
+async def run(machine, slice_cycles=10000, max_cycles=None):
+    """
+    Run a CPU, VM or Translator in slices of cycles on the event loop
+
+    Yields to the event loop after every slice and awaits the device of
+    a blocked IN before retrying it. Returns when the machine halts or
+    reaches max_cycles.
+
+    """
+    cpu = getattr(machine, "cpu", machine)
+    while not cpu.halt and (max_cycles is None or cpu.cycles < max_cycles):
+        limit = cpu.cycles + slice_cycles
+        if max_cycles is not None:
+            limit = min(limit, max_cycles)
+        try:
+            machine.run(limit)
+        except Blocked as blocked:
+            await blocked.device.wait()
+        else:
+            await asyncio.sleep(0)
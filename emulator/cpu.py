@@ -1,12 +1,48 @@
 from .registers     import *
 from .flags         import Z, S, AC, P, CY, encode, decode
 from .alu           import ALU
-from .core          import pack, unpack
-from .instructions  import dispatch
+from .memory        import (
+    PAGES, PAGE_SIZE, RAM, ROM, IO, CODE, WATCH, BREAK, CHECKED, MARKS, pages, image
+)
+from .instructions  import dispatch, generic, CYCLES
+from .translator    import Translator
+from .snapshot      import snapshot, restore, save
+from .bus           import Bus
+
+# Execution backends over the same machine state:
+#
+#   reference       generic handlers decoding their operands from ir
+#   specialized     opcode-specialized handlers from build_dispatch
+#   translated      compiled basic blocks, see translator
+#
+# step, step_n and run_until always interpret; with translated blocks
+# they use the specialized handlers.
+
+BACKENDS = ("reference", "specialized", "translated")
+
 
 class CPU:
 
-    def __init__(self):
+    # Fixed state layout: no per-instance __dict__, and every attribute
+    # below is read through a slot descriptor. The 8-bit registers stay
+    # in `regs`, indexed by register number, so the specialized handlers
+    # bind plain indices and the translator unpacks them into locals in
+    # one step; the A-L, pair and PSW properties are for callers outside
+    # the interpreter loops.
+    __slots__ = (
+        "backend", "table", "pc", "sp", "acc", "flags", "ir", "regs", "alu",
+        "halt", "mem", "pages", "page_read", "page_write", "conds", "cycles",
+        "ints", "ei", "ports", "bus", "translator", "debugger",
+    )
+
+    def __init__(self, backend="specialized"):
+
+        if backend not in BACKENDS:
+            raise ValueError("unknown backend %r" % (backend,))
+        self.backend = backend
+
+        # handler table of the interpreter loops
+        self.table = generic if backend == "reference" else dispatch
 
         # program counter
         self.pc = 0x0000
@@ -31,7 +67,12 @@ class CPU:
         self.halt = False
 
         # memory
-        self.mem = [0x00] * 64 * (1 << 10)  # 64 KiB
+        self.mem = bytearray(64 * (1 << 10))    # 64 KiB
+
+        # memory map: attribute bits and handlers of every 256-byte page
+        self.pages = bytearray(PAGES)
+        self.page_read = [None] * PAGES
+        self.page_write = [None] * PAGES
 
         #self.__init_optable()
 
@@ -41,28 +82,189 @@ class CPU:
 
         self.cycles = 0
 
-        # interrupts
+        # interrupts; ei is the cycle count right after the last EI, and
+        # nothing is taken before another instruction has run
         self.ints = False
+        self.ei = -1
 
         # I/O ports
-        self.ports = [0x00] * 256
-
-
-    def dispatch(self):
-        return self.optable[self.ir]
-
-    def load(self, arr):
-        for idx, data in enumerate(arr):
-            self.mem[idx] = data
-
-    def run(self):
-        while not self.halt:
-            self.ir = self.fetch()
-            ins = self.dispatch()
-            ins(self, self.alu)
+        self.ports = bytearray(256)
+        self.bus = Bus(self.ports)
+
+        # Set by a Translator, told about writes to CODE pages
+        self.translator = None
+
+        # Set by a Debugger, told about accesses to WATCH pages and
+        # writes to BREAK pages
+        self.debugger = None
+        if backend == "translated":
+            Translator(self)
+
+
+    def load(self, source, addr=0x0000):
+        """
+        Copy a program to memory at addr
+
+        source is bytes, a list of ints, a path or an open file. The
+        image is placed with a single slice assignment.
+
+        """
+        data = image(source)
+        if addr + len(data) > len(self.mem):
+            raise ValueError("program does not fit in memory")
+        self.mem[addr:addr + len(data)] = data
+        if self.translator is not None:
+            self.translator.flush()
+
+    def map_rom(self, source, addr=0x0000):
+        """
+        Map a ROM image at addr
+
+        source is bytes, a list of ints, a path or an open file. The
+        image is copied into memory and its pages are marked ROM, so
+        fetches and the translator read it like RAM while writes are
+        ignored; the rest of the last page reads 0xff. Returns the image
+        so further CPUs can map it without reading the file again.
+
+        """
+        rom = image(source)
+        size = len(rom)
+        if not size:
+            raise ValueError("empty ROM image")
+        end = addr + -(-size // PAGE_SIZE) * PAGE_SIZE
+        if end > len(self.mem):
+            raise ValueError("ROM does not fit in memory")
+        self.map(addr, end - addr, ROM)
+        self.mem[addr:addr + size] = rom
+        self.mem[addr + size:end] = b"\xff" * (end - addr - size)
+        if self.translator is not None:
+            self.translator.flush()
+        return rom
+
+    def snapshot(self):
+        """ Versioned binary snapshot of the machine state """
+        return snapshot(self)
+
+    def restore(self, source):
+        """
+        Resume from a snapshot
+
+        source is bytes, a path or an open file. Page mappings are not
+        part of a snapshot and are left as they are.
+
+        """
+        restore(self, image(source))
+
+    def save(self, target):
+        """ Write a snapshot to a path or an open file """
+        save(self, target)
+
+    def run(self, max_cycles=None, profiler=None, tracer=None):
+        """
+        Execute until HLT or until the cycle counter reaches max_cycles
+
+        Every instruction is charged its T-states from CYCLES before it
+        executes; the instruction crossing max_cycles is completed. With
+        a profiler or tracer, its recording loop runs instead of this one.
+
+        """
+        if profiler is not None:
+            return profiler.run(self, max_cycles)
+        if tracer is not None:
+            return tracer.run(self, max_cycles)
+        if self.backend == "translated":
+            return self.translator.run(max_cycles)
+        alu, table = self.alu, self.table
+        cycles = CYCLES
+        if max_cycles is None:
+            while not self.halt:
+                self.ir = opc = self.fetch()
+                self.cycles += cycles[opc]
+                table[opc](self, alu)
+        else:
+            while not self.halt and self.cycles < max_cycles:
+                self.ir = opc = self.fetch()
+                self.cycles += cycles[opc]
+                table[opc](self, alu)
+
+    def run_for(self, cycles):
+        """ Execute for a budget of cycles, return the cycles spent """
+        start = self.cycles
+        self.run(start + cycles)
+        return self.cycles - start
+
+    def step(self):
+        """ Execute one instruction """
+        self.ir = opc = self.fetch()
+        self.cycles += CYCLES[opc]
+        self.table[opc](self, self.alu)
+
+    def step_n(self, n):
+        """ Execute up to n instructions, return how many ran """
+        alu, table, cycles, fetch = self.alu, self.table, CYCLES, self.fetch
+        for count in range(n):
+            if self.halt:
+                return count
+            self.ir = opc = fetch()
+            self.cycles += cycles[opc]
+            table[opc](self, alu)
+        return n
+
+    def run_until(self, pc=None, cycles=None, predicate=None):
+        """
+        Execute until pc is reached, the cycle counter reaches cycles or
+        predicate(cpu) holds, whichever comes first, or until HLT
+
+        Conditions are checked before every instruction; a loop testing
+        only pc or only cycles runs when the predicate is not given, and
+        one testing only the predicate when nothing else is. Returns the
+        number of instructions executed.
+
+        """
+        alu, table, costs, fetch = self.alu, self.table, CYCLES, self.fetch
+        count = 0
+        if predicate is not None and cycles is None and pc is None:
+            while not self.halt and not predicate(self):
+                self.ir = opc = fetch()
+                self.cycles += costs[opc]
+                table[opc](self, alu)
+                count += 1
+        elif predicate is not None:
+            pc = -1 if pc is None else pc
+            limit = float("inf") if cycles is None else cycles
+            while not self.halt and self.pc != pc and self.cycles < limit and not predicate(self):
+                self.ir = opc = fetch()
+                self.cycles += costs[opc]
+                table[opc](self, alu)
+                count += 1
+        elif cycles is None and pc is None:
+            while not self.halt:
+                self.ir = opc = fetch()
+                self.cycles += costs[opc]
+                table[opc](self, alu)
+                count += 1
+        elif cycles is None:
+            while not self.halt and self.pc != pc:
+                self.ir = opc = fetch()
+                self.cycles += costs[opc]
+                table[opc](self, alu)
+                count += 1
+        elif pc is None:
+            while not self.halt and self.cycles < cycles:
+                self.ir = opc = fetch()
+                self.cycles += costs[opc]
+                table[opc](self, alu)
+                count += 1
+        else:
+            while not self.halt and self.pc != pc and self.cycles < cycles:
+                self.ir = opc = fetch()
+                self.cycles += costs[opc]
+                table[opc](self, alu)
+                count += 1
+        return count
     
     def dispatch(self):
-        return dispatch[self.ir]
+        return self.table[self.ir]
     
     def __get_register(self, r):
         if r == M:
@@ -72,7 +274,7 @@ class CPU:
         
     def __set_register(self, r, data):
         if r == M:
-            self.set_M(data)
+            self.M = data
         else:
             self.regs[r] = data
 
@@ -113,13 +315,29 @@ class CPU:
     def D(self, data):
         self.regs[D] = data
     
+    @property
+    def E(self):
+        return self.regs[E]
+    
+    @E.setter
+    def E(self, data):
+        self.regs[E] = data
+    
     @property
     def H(self):
         return self.regs[H]
     
+    @H.setter
+    def H(self, data):
+        self.regs[H] = data
+    
     @property
     def L(self):
         return self.regs[L]
+    
+    @L.setter
+    def L(self, data):
+        self.regs[L] = data
 
     @property
     def M(self):
@@ -149,66 +367,77 @@ class CPU:
     def dst(self, data):
         self.__set_register(self.__DST(), data)
     
+    # 16-bit views of the register pairs, composed from and split into
+    # regs with one shift and one mask
+
     @property
     def BC(self):
-        return pack(self.B, self.C)
+        regs = self.regs
+        return (regs[B] << 8) | regs[C]
     
     @BC.setter
     def BC(self, data_16):
-        self.B, self.C = unpack(data_16)
+        self.regs[B:D] = data_16 >> 8, data_16 & 0xff
     
     @property
     def DE(self):
-        return pack(self.D, self.E)
+        regs = self.regs
+        return (regs[D] << 8) | regs[E]
     
     @DE.setter
     def DE(self, data_16):
-        self.D, self.E = unpack(data_16)
+        self.regs[D:H] = data_16 >> 8, data_16 & 0xff
     
     @property
     def HL(self):
-        return pack(self.H, self.L)
+        regs = self.regs
+        return (regs[H] << 8) | regs[L]
     
     @HL.setter
     def HL(self, data_16):
-        self.H, self.L = unpack(data_16)
+        self.regs[H:M] = data_16 >> 8, data_16 & 0xff
     
     @property
     def PSW(self):
-        return pack(self.A, self.flags)
+        return (self.regs[A] << 8) | self.flags
     
     @PSW.setter
     def PSW(self, data_16):
-        self.A, self.flags = unpack(data_16)
+        self.regs[A] = data_16 >> 8
+        self.flags = (data_16 & 0xd7) | 0x02
     
     @property
     def rp(self):
-        if self.__RP() == 0:
-            return self.BC()
-        elif self.__RP() == 1:
-            return self.DE()
+        """ Get dynamic register pair """
+        rp = self.__RP()
+        if rp == SP:
+            return self.sp
+        regs = self.regs
+        return (regs[2 * rp] << 8) | regs[2 * rp + 1]
     
     @rp.setter
-    def rp(self):
-        pass
+    def rp(self, data_16):
+        rp = self.__RP()
+        if rp == SP:
+            self.sp = data_16
+        else:
+            self.regs[2 * rp:2 * rp + 2] = data_16 >> 8, data_16 & 0xff
     
     @property
     def rl(self):
-        _, data = unpack(self.rp)
-        return data
+        return self.rp & 0xff
     
     @rl.setter
     def rl(self, data):
-        self.rp = pack(self.rh, data)
+        self.rp = (self.rp & 0xff00) | data
 
     @property
     def rh(self):
-        data, _ = unpack(self.rp)
-        return data
+        return self.rp >> 8
     
     @rh.setter
     def rh(self, data):
-        self.rp = pack(data, self.rl)
+        self.rp = (data << 8) | (self.rp & 0xff)
 
     @property
     def Z(self):
@@ -235,6 +464,10 @@ class CPU:
     def CY(self):
         return bool(self.flags & CY)
     
+    @CY.setter
+    def CY(self, val):
+        self.flags = (self.flags & ~CY) | bool(val)
+    
     @property
     def cond(self):
         return self.conds[self.__CCC()]
@@ -257,27 +490,65 @@ class CPU:
     def __set_RP(self, data_16):
         self.set_pair(self.__RP(), data_16)
 
-    def fetch(self):
-        data = self.read(self.pc)
-        self.pc += 1
-        return data
-    
+    def map(self, addr, size, kind=RAM, read=None, write=None):
+        """
+        Map [addr, addr + size) as RAM, ROM or IO
+
+        IO pages call read(addr) and write(addr, data) instead of
+        touching memory. Regions must be page aligned. Translated blocks
+        in pages that change kind are dropped.
+
+        """
+        if kind & IO and (read is None or write is None):
+            raise ValueError("IO pages need a read and a write handler")
+        for page in pages(addr, size):
+            if self.pages[page] & CODE and self.pages[page] & ~MARKS != kind:
+                for data_addr in range(page << 8, (page + 1) << 8):
+                    self.translator.invalidate(data_addr)
+            self.pages[page] = kind | (self.pages[page] & MARKS)
+            self.page_read[page] = read
+            self.page_write[page] = write
+
     def read(self, addr):
-        self.cycles += 1
+        if self.pages[addr >> 8] & CHECKED:
+            return self.__read_mapped(addr)
         return self.mem[addr]
+
+    def __read_mapped(self, addr):
+        """ Slow path of read for IO and WATCH pages """
+        kind = self.pages[addr >> 8]
+        if kind & IO:
+            data = self.page_read[addr >> 8](addr)
+        else:
+            data = self.mem[addr]
+        if kind & WATCH:
+            self.debugger.watched_read(addr, data)
+        return data
     
     def write(self, addr, data):
-        self.cycles += 1
-        self.mem[addr] = data
+        kind = self.pages[addr >> 8]
+        if kind:
+            self.__write_mapped(addr, data, kind)
+        else:
+            self.mem[addr] = data
+
+    def __write_mapped(self, addr, data, kind):
+        """ Slow path of write for pages with attributes """
+        if kind & CODE:
+            self.translator.invalidate(addr)
+        if kind & (WATCH | BREAK):
+            self.debugger.watched_write(addr, data)
+        if kind & IO:
+            self.page_write[addr >> 8](addr, data)
+        elif not kind & ROM:
+            self.mem[addr] = data
     
     def read_16(self, addr):
-        self.cycles += 2
-        return pack(self.read(addr), self.read(addr + 1))
+        return self.read(addr) | (self.read((addr + 1) & 0xffff) << 8)
     
     def write_16(self, addr, data_16):
-        data_hi, data_lo = unpack(data_16)
-        self.write(addr, data_lo)
-        self.write(addr + 1, data_hi)
+        self.write(addr, data_16 & 0xff)
+        self.write((addr + 1) & 0xffff, data_16 >> 8)
 
     # memory operation
 
@@ -295,11 +566,11 @@ class CPU:
     
     def pop_16(self):
         data_16 = self.read_16(self.sp)
-        self.sp += 2
+        self.sp = (self.sp + 2) & 0xffff
         return data_16
 
     def push_16(self, data_16):
-        self.sp -= 2
+        self.sp = (self.sp - 2) & 0xffff
         self.write_16(self.sp, data_16)
 
     def __init_conds(self):
@@ -322,7 +593,7 @@ class CPU:
     
     def __RP(self):
         """ decode register pair index """
-        return (self.ir & 0x03) >> 4
+        return (self.ir & 0x30) >> 4
     
     def __ALU(self):
         """ decode alu opcode """
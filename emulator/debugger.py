@@ -0,0 +1,180 @@
+from collections import namedtuple
+
+from .instructions import CYCLES
+from .memory import IO, WATCH, BREAK
+
+# Breakpoints and watchpoints
+#
+# Nothing is checked on the plain run paths. A PC breakpoint swaps a
+# trap into a private copy of the handler table, for the opcode found at
+# the breakpoint only, so instructions with other opcodes run their
+# handler directly. Translated blocks end before every breakpoint and a
+# block starting at one is replaced by the trap. Pages holding
+# breakpoints are marked BREAK, so code storing a new opcode at a
+# breakpoint gets it trapped as well. Watched addresses mark
+# their pages WATCH, which only read and write test, so only accesses
+# to watched pages take the slow path and code in those pages is still
+# translated.
+#
+# A hit stops the machine the way HLT does. A breakpoint stops before
+# its instruction executes; a watchpoint after the instruction, or the
+# translated block, that made the access.
+
+# kind is "break", "read" or "write"; data is the byte accessed
+Hit = namedtuple("Hit", "kind addr data")
+
+HLT = 0x76
+
+
+class Debugger:
+
+    def __init__(self, machine):
+        """ Debugger of a CPU, with any backend, or of a Translator """
+        self.machine = machine
+        self.cpu = cpu = getattr(machine, "cpu", machine)
+        self.translator = cpu.translator
+
+        self.breakpoints = set()
+        self.reads = set()
+        self.writes = set()
+
+        # handler table of cpu before breakpoints were set
+        self.table = cpu.table
+
+        # why the machine last stopped, None if it was not a hit
+        self.hit = None
+
+        if self.translator is not None:
+            self.translator.breakpoints = self.breakpoints
+            self.translator.trap = self.__trap_block
+        cpu.debugger = self
+
+    def break_at(self, addr):
+        """ Stop before the instruction at addr executes """
+        self.breakpoints.add(addr)
+        self.cpu.pages[addr >> 8] |= BREAK
+        self.__patch()
+        if self.translator is not None:
+            self.translator.invalidate(addr)
+
+    def clear(self, addr):
+        """ Remove the breakpoint at addr """
+        self.breakpoints.discard(addr)
+        if not any(other >> 8 == addr >> 8 for other in self.breakpoints):
+            self.cpu.pages[addr >> 8] &= ~BREAK
+        self.__patch()
+        if self.translator is not None:
+            self.translator.invalidate(addr)
+
+    def watch(self, addr, size=1, read=False, write=True):
+        """ Stop after any instruction reading or writing [addr, addr + size) """
+        for data_addr in range(addr, addr + size):
+            if read:
+                self.reads.add(data_addr)
+            if write:
+                self.writes.add(data_addr)
+            self.cpu.pages[data_addr >> 8] |= WATCH
+
+    def unwatch(self, addr, size=1):
+        for data_addr in range(addr, addr + size):
+            self.reads.discard(data_addr)
+            self.writes.discard(data_addr)
+        pages = self.cpu.pages
+        watched = {data_addr >> 8 for data_addr in self.reads | self.writes}
+        for page in range(addr >> 8, ((addr + size - 1) >> 8) + 1):
+            if page not in watched:
+                pages[page] &= ~WATCH
+
+    def watched_read(self, addr, data):
+        """ Called by the CPU for reads from WATCH pages """
+        if addr in self.reads:
+            self.hit = Hit("read", addr, data)
+            self.cpu.halt = True
+
+    def watched_write(self, addr, data):
+        """ Called by the CPU for writes to WATCH and BREAK pages """
+        table = self.cpu.table
+        if addr in self.breakpoints and table is not self.table and table[data] is self.table[data]:
+            # a new opcode at a breakpoint
+            table[data] = self.__trap(data, self.table[data])
+        if addr in self.writes:
+            self.hit = Hit("write", addr, data)
+            self.cpu.halt = True
+
+    def run(self, max_cycles=None):
+        """
+        Run the machine like its run(max_cycles) and return the Hit that
+        stopped it, None if it stopped at HLT or max_cycles
+
+        Resuming at a breakpoint executes its instruction first.
+
+        """
+        cpu = self.cpu
+        self.__patch()
+        if self.__resume():
+            if cpu.halt or (max_cycles is not None and cpu.cycles >= max_cycles):
+                return self.__stopped()
+        self.machine.run(max_cycles)
+        return self.__stopped()
+
+    def step(self):
+        """ Execute one instruction, even at a breakpoint """
+        self.__patch()
+        if not self.__resume():
+            cpu = self.cpu
+            cpu.ir = opc = cpu.fetch()
+            cpu.cycles += CYCLES[opc]
+            self.table[opc](cpu, cpu.alu)
+        return self.__stopped()
+
+    def __resume(self):
+        """ Step over the breakpoint the machine stopped at """
+        cpu, hit = self.cpu, self.hit
+        self.hit = None
+        if hit is None or hit.kind != "break" or cpu.pc != hit.addr:
+            return False
+        cpu.ir = opc = cpu.fetch()
+        cpu.cycles += CYCLES[opc]
+        self.table[opc](cpu, cpu.alu)
+        return True
+
+    def __stopped(self):
+        # the halt set by a hit is not a HLT
+        if self.hit is not None and (self.hit.kind == "break" or self.cpu.ir != HLT):
+            self.cpu.halt = False
+        return self.hit
+
+    def __patch(self):
+        """ Trap the opcodes found at the breakpoints """
+        cpu, table = self.cpu, self.table
+        if not self.breakpoints:
+            cpu.table = table
+            return
+        patched = list(table)
+        for opc in {self.__peek(addr) for addr in self.breakpoints}:
+            patched[opc] = self.__trap(opc, table[opc])
+        cpu.table = patched
+
+    def __peek(self, addr):
+        """ Byte at addr as the CPU fetches it, without reporting a read """
+        cpu = self.cpu
+        if cpu.pages[addr >> 8] & IO:
+            return cpu.page_read[addr >> 8](addr)
+        return cpu.mem[addr]
+
+    def __trap(self, opc, handler):
+        breakpoints, cycles = self.breakpoints, CYCLES[opc]
+
+        def trap(cpu, alu):
+            addr = cpu.pc - 1
+            if addr not in breakpoints:
+                return handler(cpu, alu)
+            cpu.pc = addr
+            cpu.cycles -= cycles
+            self.hit = Hit("break", addr, opc)
+            cpu.halt = True
+        return trap
+
+    def __trap_block(self, cpu):
+        self.hit = Hit("break", cpu.pc, self.__peek(cpu.pc))
+        cpu.halt = True
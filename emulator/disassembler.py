@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+from .opcodes import OPCODES, D8
+from .memory import IO
+
+# Table-driven disassembler
+#
+# Instructions are decoded from the opcode metadata table and memoized
+# by address. A cached instruction is reused only while the bytes it was
+# decoded from are unchanged, so self-modifying code is decoded afresh.
+
+Instruction = namedtuple("Instruction", "addr opcode data length text")
+
+
+def hex_operand(value, digits):
+    """ Intel hex notation, e.g. 0FFH """
+    text = "%0*XH" % (digits, value)
+    return "0" + text if text[0] in "ABCDEF" else text
+
+def render(opcode, data):
+    """ Assembler text of an opcode with its immediate operand bytes """
+    operands = list(opcode.operands)
+    if opcode.kind == D8:
+        operands.append(hex_operand(data[0], 2))
+    elif opcode.kind is not None:
+        operands.append(hex_operand(data[0] | (data[1] << 8), 4))
+    if not operands:
+        return opcode.mnemonic
+    return "%-4s %s" % (opcode.mnemonic, ",".join(operands))
+
+
+class Disassembler:
+
+    def __init__(self, memory):
+        """
+        Disassembler over a CPU or any buffer of 64 KiB
+
+        With a CPU, bytes in IO pages are read through the page handlers.
+
+        """
+        self.mem = getattr(memory, "mem", memory)
+        self.cpu = memory if hasattr(memory, "page_read") else None
+        self.read = self.mem.__getitem__ if self.cpu is None else self.__read
+
+        # address -> Instruction
+        self.cache = {}
+
+    def __read(self, addr):
+        cpu = self.cpu
+        if cpu.pages[addr >> 8] & IO:
+            return cpu.page_read[addr >> 8](addr)
+        return self.mem[addr]
+
+    def decode(self, addr):
+        """ Instruction at addr """
+        read = self.read
+        opc = read(addr)
+        ins = self.cache.get(addr)
+        if ins is not None and opc == ins.opcode:
+            if ins.length == 1 or all(
+                read((addr + k + 1) & 0xffff) == byte for k, byte in enumerate(ins.data)
+            ):
+                return ins
+        opcode = OPCODES[opc]
+        data = bytes(read((addr + k) & 0xffff) for k in range(1, opcode.length))
+        ins = Instruction(addr, opcode.opcode, data, opcode.length, render(opcode, data))
+        self.cache[addr] = ins
+        return ins
+
+    def stream(self, start=0x0000, end=0x10000):
+        """ Lazily decode the instructions from start up to end """
+        addr = start
+        while addr < end:
+            ins = self.decode(addr)
+            yield ins
+            addr += ins.length
+
+    def listing(self, start=0x0000, end=0x10000):
+        """ Address, bytes and text of each instruction, one per line """
+        return "\n".join(
+            "%04X  %-8s  %s" % (
+                ins.addr, " ".join("%02X" % b for b in bytes([ins.opcode]) + ins.data), ins.text
+            )
+            for ins in self.stream(start, end)
+        )
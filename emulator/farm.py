@@ -0,0 +1,90 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .memory    import image
+from .cpu       import CPU
+
+# Process-pool ROM farm
+#
+# Jobs name their ROM instead of carrying it. The ROM images are handed
+# to every worker once, through the pool initializer, and kept in a
+# per-worker cache; a job only pickles its key, start state, budget and
+# output spec. Jobs are sent in chunks and results are yielded as soon
+# as their chunk completes.
+
+# rom:      key of the ROM image
+# state:    attributes set after loading, e.g. {"pc": 0x100, "B": 3}
+# cycles:   cycle budget, None runs to HLT
+# output:   (addr, size) memory ranges copied into the result
+# addr:     load address of the ROM
+Job = namedtuple("Job", "rom state cycles output addr", defaults=(None, None, (), 0x0000))
+
+Result = namedtuple("Result", "index pc sp regs flags cycles halt memory")
+
+# ROM images of the current worker process
+_roms = {}
+
+def _init_worker(roms):
+    _roms.update(roms)
+
+def _run_job(index, job):
+    cpu = CPU()
+    cpu.load(_roms[job.rom], job.addr)
+    for name, value in (job.state or {}).items():
+        setattr(cpu, name, value)
+    cpu.run(job.cycles)
+    return Result(
+        index, cpu.pc, cpu.sp, bytes(cpu.regs), cpu.flags, cpu.cycles, cpu.halt,
+        [bytes(cpu.mem[addr:addr + size]) for addr, size in job.output]
+    )
+
+def _run_chunk(chunk):
+    return [_run_job(index, job) for index, job in chunk]
+
+
+class Farm:
+
+    def __init__(self, roms, max_workers=None):
+        """
+        Pool of worker processes sharing a set of ROM images
+
+        roms maps keys to images given as bytes, a list of ints, a path
+        or an open file.
+
+        """
+        self.roms = {key: bytes(image(source)) for key, source in roms.items()}
+        self.pool = ProcessPoolExecutor(
+            max_workers, initializer=_init_worker, initargs=(self.roms,)
+        )
+
+    def run(self, jobs, chunksize=16):
+        """
+        Run jobs on the pool and yield their results as they complete
+
+        Results carry the index of their job, so the completion order
+        does not have to match the job order.
+
+        """
+        jobs = list(enumerate(jobs))
+        for index, job in jobs:
+            if job.rom not in self.roms:
+                raise KeyError("unknown ROM %r in job %d" % (job.rom, index))
+        futures = [
+            self.pool.submit(_run_chunk, jobs[start:start + chunksize])
+            for start in range(0, len(jobs), chunksize)
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+    def map(self, jobs, chunksize=16):
+        """ Run jobs on the pool and return their results in job order """
+        return sorted(self.run(jobs, chunksize))
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,217 @@
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+from .instructions import CYCLES
+from .interrupts import inject
+from .snapshot import snapshot, restore
+
+# Reverse execution
+#
+# A History runs a CPU forward like its run(max_cycles) and takes a
+# snapshot every `interval` cycles. Everything that enters the machine
+# from outside is logged: the value of every IN, and every interrupt
+# taken with the instruction count and cycle it was taken at. Going
+# back restores the nearest earlier checkpoint and re-executes from it
+# with the logged input, so any past instruction boundary is reached
+# exactly.
+#
+# At most `limit` checkpoints are kept. When there are more, every
+# other one is dropped and the interval doubles, so a long run is still
+# covered end to end and stepping back re-executes at most `interval`
+# cycles. Positions are counted in instructions; the state at position
+# p is the one after p instructions and the interrupts taken there.
+
+Checkpoint = namedtuple("Checkpoint", "count state reads taken")
+
+
+class History:
+
+    def __init__(self, cpu, interval=10000, limit=64):
+        """
+        Record the execution of cpu from its current state
+
+        The history replaces the bus of cpu, IN and OUT still reach the
+        devices attached to it. Driven by a Controller, set the history
+        as its machine and as its recorder to log interrupts.
+
+        """
+        self.cpu = cpu
+        self.bus = cpu.bus
+        cpu.bus = self
+
+        self.interval = interval
+        self.limit = limit
+
+        # instructions executed, and the furthest count run live
+        self.count = 0
+        self.frontier = 0
+
+        # every IN value in order, and how many of them are consumed
+        self.inputs = array('B')
+        self.reads = 0
+
+        # (count, cycles, n) of every interrupt, and how many are taken
+        self.irqs = []
+        self.taken = 0
+
+        # set while re-executing: input comes from the log
+        self.replaying = False
+
+        self.checkpoints = []
+        self.next = 0
+        self.checkpoint()
+
+    def checkpoint(self):
+        """ Snapshot the current position """
+        checkpoints = self.checkpoints
+        checkpoints.append(Checkpoint(
+            self.count, snapshot(self.cpu), self.reads, self.taken
+        ))
+        if len(checkpoints) > self.limit:
+            # keep the first, the last and every other one in between
+            kept = checkpoints[::-2][::-1]
+            if kept[0] is not checkpoints[0]:
+                kept.insert(0, checkpoints[0])
+            self.checkpoints = kept
+            self.interval *= 2
+        self.next = self.cpu.cycles + self.interval
+
+    def run(self, max_cycles=None):
+        """
+        Execute until HLT or until the cycle counter reaches max_cycles
+
+        After going back, the logged stretch up to the frontier is
+        re-executed with the logged input before the machine runs live
+        again.
+
+        """
+        cpu = self.cpu
+        limit = float("inf") if max_cycles is None else max_cycles
+        if self.count < self.frontier:
+            self.__replay(self.frontier, limit)
+            if self.count < self.frontier:
+                return
+
+        alu, table, costs, fetch = cpu.alu, cpu.table, CYCLES, cpu.fetch
+        count = self.count
+        try:
+            while not cpu.halt and cpu.cycles < limit:
+                if cpu.cycles >= self.next:
+                    self.count = count
+                    self.checkpoint()
+                bound = min(self.next, limit)
+                while not cpu.halt and cpu.cycles < bound:
+                    cpu.ir = opc = fetch()
+                    cpu.cycles += costs[opc]
+                    table[opc](cpu, alu)
+                    count += 1
+        finally:
+            self.count = self.frontier = count
+
+    def step_back(self, n=1):
+        """ Go back n instructions """
+        if n > self.count:
+            raise ValueError("cannot step back past the start of the history")
+        self.seek(self.count - n)
+
+    def run_back(self, predicate):
+        """
+        Go back to the latest earlier position where predicate(cpu)
+        holds; returns the instructions stepped back, None if there is
+        no such position, in which case the machine stays where it is
+
+        """
+        here = end = self.count
+        for checkpoint in reversed(self.checkpoints):
+            if checkpoint.count >= end:
+                continue
+            self.__restore(checkpoint)
+            found = self.__replay(end, predicate=predicate)
+            if found is not None:
+                self.seek(found)
+                return here - found
+            end = checkpoint.count
+        self.seek(here)
+        return None
+
+    def seek(self, count):
+        """ Go to position count, at most the frontier """
+        if not 0 <= count <= self.frontier:
+            raise ValueError("position %d is outside of the history" % count)
+        checkpoints = self.checkpoints
+        k = bisect_right(checkpoints, count, key=lambda checkpoint: checkpoint.count)
+        self.__restore(checkpoints[k - 1])
+        self.__replay(count)
+
+    def __restore(self, checkpoint):
+        restore(self.cpu, checkpoint.state)
+        self.count = checkpoint.count
+        self.reads = checkpoint.reads
+        self.taken = checkpoint.taken
+
+    def __interrupts(self, count):
+        """ Take the interrupts logged at position count not taken yet """
+        irqs = self.irqs
+        while self.taken < len(irqs) and irqs[self.taken][0] == count:
+            _, cycles, n = irqs[self.taken]
+            self.cpu.cycles = cycles
+            inject(self.cpu, n)
+            self.taken += 1
+
+    def __replay(self, stop, limit=float("inf"), predicate=None):
+        """
+        Re-execute from the current position up to stop with the logged
+        input; returns the last position where predicate held
+
+        """
+        cpu = self.cpu
+        alu, table, costs, fetch = cpu.alu, cpu.table, CYCLES, cpu.fetch
+        irqs = self.irqs
+        found = None
+        self.replaying = True
+        try:
+            while True:
+                if self.taken < len(irqs) and irqs[self.taken][0] == self.count:
+                    self.__interrupts(self.count)
+                if self.count >= stop or cpu.cycles >= limit:
+                    break
+                if predicate is not None and predicate(cpu):
+                    found = self.count
+                if cpu.halt:
+                    break
+                cpu.ir = opc = fetch()
+                cpu.cycles += costs[opc]
+                table[opc](cpu, alu)
+                self.count += 1
+        finally:
+            self.replaying = False
+        return found
+
+    def interrupt(self, n):
+        """ Called by the Controller as RST n is taken """
+        if not self.replaying and self.count == self.frontier:
+            self.irqs.append((self.count, self.cpu.cycles, n))
+            self.taken += 1
+
+    def read(self, port):
+        if self.replaying:
+            data = self.inputs[self.reads]
+            self.cpu.ports[port] = data
+        else:
+            data = self.bus.read(port)
+            self.inputs.append(data)
+        self.reads += 1
+        return data
+
+    def write(self, port, data):
+        if self.replaying:
+            self.cpu.ports[port] = data
+        else:
+            self.bus.write(port, data)
+
+    def attach(self, device, *ports):
+        return self.bus.attach(device, *ports)
+
+    def detach(self, *ports):
+        self.bus.detach(*ports)
@@ -1,4 +1,10 @@
-from .flags import *
+from .flags      import *
+from .registers  import *
+from .alu        import (
+    ADD_TABLE, SUB_TABLE, ANA_TABLE, XRA_TABLE, ORA_TABLE, INR_TABLE, DCR_TABLE
+)
+from .bus        import Blocked
+from .opcodes    import CYCLES, TAKEN
 
 def MOV(cpu, alu):
     """
@@ -21,21 +27,23 @@ def LXI(cpu, alu):
 
 def LDA(cpu, alu):
     """ Load accumulator direct """
-    cpu.A = cpu.read(cpu.fetch_16())
+    cpu.regs[A] = cpu.read(cpu.fetch_16())
 
 def STA(cpu, alu):
     """ Store Accumulator direct """
-    cpu.write(cpu.fetch_16(), cpu.A)
+    cpu.write(cpu.fetch_16(), cpu.regs[A])
 
 def LHLD(cpu, alu):
     """ Load L and H direct """
-    cpu.HL = cpu.read_16(cpu.fetch_16())
+    data_16 = cpu.read_16(cpu.fetch_16())
+    cpu.regs[H], cpu.regs[L] = data_16 >> 8, data_16 & 0xff
 
 def SHLD(cpu, alu):
     """ 
     Store H and L direct 
     """
-    cpu.write_16(cpu.fetch_16(), cpu.HL)
+    regs = cpu.regs
+    cpu.write_16(cpu.fetch_16(), (regs[H] << 8) | regs[L])
 
 def LDAX(cpu, alu):
     """
@@ -56,7 +64,8 @@ def XCHG(cpu, alu):
     the contents of registers D and E.
 
     """
-    cpu.HL, cpu.DE = cpu.DE, cpu.HL
+    regs = cpu.regs
+    regs[D], regs[E], regs[H], regs[L] = regs[H], regs[L], regs[D], regs[E]
 
 def ADD(cpu, alu):
     """ 
@@ -108,7 +117,7 @@ def ACI(cpu, alu):
     accumulator. 
     
     """
-    cpu.A, cpu.flags = alu.ADC(cpu.A, cpu.fetch(), cpu.CY)
+    cpu.A, cpu.flags = alu.adc(cpu.A, cpu.fetch(), cpu.CY)
 
 def SUB(cpu, alu):
     """ 
@@ -138,11 +147,11 @@ def SUI(cpu, alu):
 
 def SBB(cpu, alu):
     """ Subtract register with borrow """
-    cpu.A, cpu.flags = alu.sbb(cpu.A, cpu.src, cpu.CY)
+    cpu.A, cpu.flags = alu.SBB(cpu.A, cpu.src, cpu.CY)
 
 def SBI(cpu, alu):
     """ Subtract immediate with borrow """
-    cpu.A, cpu.flags = alu.sbb(cpu.A, cpu.fetch(), cpu.CY)
+    cpu.A, cpu.flags = alu.SBB(cpu.A, cpu.fetch(), cpu.CY)
 
 def INR(cpu, alu):
     """ 
@@ -154,8 +163,7 @@ def INR(cpu, alu):
     Note: All condition flags except CY are affected.
     
     """
-    cpu.dst, flags = alu.add(cpu.dst, 1)
-    cpu.flags = (flags & ~CY) | (cpu.flags & CY)    # preserve cy
+    cpu.dst, cpu.flags = alu.INR(cpu.dst, cpu.flags)
 
 def DCR(cpu, alu):
     """ 
@@ -167,8 +175,7 @@ def DCR(cpu, alu):
     Note: All condition flags except CY are affected. 
     
     """
-    cpu.dst, flags = alu.sub(cpu.dst, 1)
-    cpu.flags = (flags & ~CY) | (cpu.flags & CY)    # preserve cy
+    cpu.dst, cpu.flags = alu.DCR(cpu.dst, cpu.flags)
 
 def INX(cpu, alu):
     """ 
@@ -180,19 +187,17 @@ def INX(cpu, alu):
     one. Note: No condition ftags are affected.  
     
     """
-    cpu.rl, flags = alu.add(cpu.rl, 1)
-    cpu.rh, _     = alu.ADC(cpu.rh, 0, flags & CY)
+    cpu.rp = (cpu.rp + 1) & 0xffff
 
 def DCX(cpu, alu):
     """ Decrement register pair """
-    cpu.rl, flags = alu.sub(cpu.rl, 1)
-    cpu.rh, _     = alu.sbb(cpu.rh, 0, flags & CY)
+    cpu.rp = (cpu.rp - 1) & 0xffff
 
 def DAD(cpu, alu):
-    cpu.L, flags = alu.add(cpu.L, cpu.rl)
-    cpu.H, flags = alu.ADC(cpu.H, cpu.rh, flags & CY)
-
-    cpu.flags = (flags & CY) | (cpu.flags & ~CY)
+    """ Add register pair to H and L """
+    data = cpu.HL + cpu.rp
+    cpu.HL = data & 0xffff
+    cpu.flags = (cpu.flags & ~CY) | (data >> 16)
 
 def DAA(cpu, alu):
     """ Decimal adjust accumulator """
@@ -215,39 +220,39 @@ def XRI(cpu, alu):
 
 def ORA(cpu, alu):
     """ OR register """
-    cpu.A, cpu.flags = alu.ora(cpu.A, cpu.src)
+    cpu.A, cpu.flags = alu.ORA(cpu.A, cpu.src)
 
 def ORI(cpu, alu):
     """ OR immediate """
-    cpu.A, cpu.flags = alu.ora(cpu.A, cpu.fetch())
+    cpu.A, cpu.flags = alu.ORA(cpu.A, cpu.fetch())
 
 def CMP(cpu, alu):
     """ Compare register """
-    _, cpu.flags = alu.sub(cpu.A, cpu.src)
+    _, cpu.flags = alu.CMP(cpu.A, cpu.src)
 
 def CPI(cpu, alu):
     """ Compare immediate """
-    _, cpu.flags = alu.sub(cpu.A, cpu.fetch())
+    _, cpu.flags = alu.CMP(cpu.A, cpu.fetch())
 
 def RLC(cpu, alu):
     """ Rotate left """
-    cpu.A, cpu.flags = alu.RRC(cpu.A, 0, cpu.CY)
+    cpu.regs[A], cpu.flags = alu.RLC(cpu.regs[A], 0, cpu.flags)
 
 def RRC(cpu, alu):
     """ Rotate right """
-    cpu.A, cpu.flags = alu.RRC(cpu.A, 0, cpu.CY)
+    cpu.regs[A], cpu.flags = alu.RRC(cpu.regs[A], 0, cpu.flags)
 
 def RAL(cpu, alu):
     """ Rotate left through carry """
-    cpu.A, cpu.flags = alu.RAL(cpu.A, 0, cpu.CY)
+    cpu.regs[A], cpu.flags = alu.RAL(cpu.regs[A], 0, cpu.flags)
 
 def RAR(cpu, alu):
     """ Rotate right through carry """
-    cpu.A, cpu.flags = alu.RAR(cpu.A, 0, cpu.CY)
+    cpu.regs[A], cpu.flags = alu.RAR(cpu.regs[A], 0, cpu.flags)
 
 def CMA(cpu, alu):
     """ Complement accumulator """
-    cpu.A = 255 - cpu.A
+    cpu.regs[A] ^= 0xff
 
 def CMC(cpu, alu):
     """ Complement carry """
@@ -255,7 +260,7 @@ def CMC(cpu, alu):
 
 def STC(cpu, alu):
     """ Set carry """
-    cpu.CY = 1
+    cpu.flags |= CY
 
 def JMP(cpu, alu):
     """ Jump """
@@ -263,19 +268,23 @@ def JMP(cpu, alu):
 
 def CALL(cpu, alu):
     """ Unconditional call """
+    addr = cpu.fetch_16()
     cpu.push_16(cpu.pc)
-    cpu.pc = cpu.fetch_16()
+    cpu.pc = addr
 
 def JCC(cpu, alu):
     """ Conditional jump """
+    addr = cpu.fetch_16()
     if cpu.cond():
-        print("Jump")
-        JMP(cpu, alu)
+        cpu.pc = addr
 
 def CCC(cpu, alu):
     """ Condition call """
+    addr = cpu.fetch_16()
     if cpu.cond():
-        CALL(cpu, alu)
+        cpu.cycles += TAKEN
+        cpu.push_16(cpu.pc)
+        cpu.pc = addr
 
 def RET(cpu, alu):
     """ Return """
@@ -284,16 +293,17 @@ def RET(cpu, alu):
 def RCC(cpu, alu):
     """ Conditional return """
     if cpu.cond():
+        cpu.cycles += TAKEN
         RET(cpu, alu)
 
 def RST(cpu, alu):
     """ Restart """
     cpu.push_16(cpu.pc)
-    cpu.pc = 8 * cpu.__NNN()
+    cpu.pc = cpu.ir & 0x38
 
 def PCHL(cpu, alu):
     """ Jump H and L indirect """
-    cpu.pc = cpu.HL
+    cpu.pc = (cpu.regs[H] << 8) | cpu.regs[L]
 
 def PUSH(cpu, alu):
     """ 
@@ -326,25 +336,34 @@ def POP(cpu, alu):
 
 def XTHL(cpu, alu):
     """ Exchange stack top with H and L """
-    data_16 = cpu.pop_16()
-    cpu.push_16(cpu.HL)
-    cpu.HL = data_16
+    regs = cpu.regs
+    data_16 = cpu.read_16(cpu.sp)
+    cpu.write_16(cpu.sp, (regs[H] << 8) | regs[L])
+    regs[H], regs[L] = data_16 >> 8, data_16 & 0xff
 
 def SPHL(cpu, alu):
     """ Move HL to SP """
-    cpu.sp = cpu.HL
+    cpu.sp = (cpu.regs[H] << 8) | cpu.regs[L]
 
 def IN(cpu, alu):
     """ Input """
-    pass
+    port = cpu.fetch()
+    try:
+        cpu.regs[A] = cpu.bus.read(port)
+    except Blocked:
+        # leave the machine before IN, it is retried once the device is ready
+        cpu.pc = (cpu.pc - 2) & 0xffff
+        cpu.cycles -= CYCLES[0xdb]
+        raise
 
 def OUT(cpu, alu):
     """ Output """
-    pass
+    cpu.bus.write(cpu.fetch(), cpu.regs[A])
 
 def EI(cpu, alu):
-    """ Enable interrupts """
+    """ Enable interrupts, from after the next instruction on """
     cpu.ints = 1
+    cpu.ei = cpu.cycles
 
 def DI(cpu, alu):
     """ Disable interrupts """
@@ -352,14 +371,14 @@ def DI(cpu, alu):
 
 def HLT(cpu, alu):
     """ Halt """
-    print("halt")
     cpu.halt = True
 
 def NOP(cpu, alu):
     """ No op """
     pass
 
-dispatch = [
+
+generic = [
     NOP,   LXI,   STAX,  INX,   INR,   DCR,   MVI,   RLC,   # 0x00–0x07
     NOP,   DAD,   LDAX,  DCX,   INR,   DCR,   MVI,   RRC,   # 0x08–0x0F
     NOP,   LXI,   STAX,  INX,   INR,   DCR,   MVI,   RAL,   # 0x10–0x17
@@ -370,7 +389,7 @@ dispatch = [
     NOP,   DAD,   LDA,   DCX,   INR,   DCR,   MVI,   CMC,   # 0x38–0x3F
     MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x40–0x47
     MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x48–0x4F
-    MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   HLT,   # 0x50–0x57
+    MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x50–0x57
     MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x58–0x5F
     MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x60–0x67
     MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x68–0x6F
@@ -391,9 +410,307 @@ dispatch = [
     RCC,   POP,   JCC,   XTHL,  CCC,   PUSH,  ANI,   RST,   # 0xE0-0xE7
     RCC,   PCHL,  JCC,   XCHG,  CCC,   CALL,  XRI,   RST,   # 0xE8-0xEF
     RCC,   POP,   JCC,   DI,    CCC,   PUSH,  ORI,   RST,   # 0xF0-0xF7
-    RCC,   SPHL,  JCC,   EI,    CCC,   CALL,  CPI,   RST    # 0xF8-0xFF                                                 
+    RCC,   SPHL,  JCC,   EI,    CCC,   CALL,  CPI,   RST    # 0xF8-0xFF
 ]
 
+# Opcode-specialized handlers
+#
+# The generic handlers above decode their operands from cpu.ir on every
+# execution. The factories below bind register, register pair and
+# condition at table-build time, so the handlers in `dispatch` do no
+# decoding at all.
+
+REGISTERS   = "BCDEHLMA"
+PAIRS       = ("BC", "DE", "HL", "SP")
+CONDITIONS  = ("NZ", "Z", "NC", "C", "PO", "PE", "P", "M")
+
+def _named(handler, name, doc):
+    handler.__name__ = handler.__qualname__ = name
+    handler.__doc__ = doc
+    return handler
+
+def _mov(dst, src):
+    """ MOV r1, r2 """
+    if src == M:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            regs[dst] = cpu.read((regs[H] << 8) | regs[L])
+    elif dst == M:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            cpu.write((regs[H] << 8) | regs[L], regs[src])
+    else:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            regs[dst] = regs[src]
+    name = "MOV_%s_%s" % (REGISTERS[dst], REGISTERS[src])
+    return _named(handler, name, MOV.__doc__)
+
+def _mvi(dst):
+    """ MVI r, data """
+    if dst == M:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            cpu.write((regs[H] << 8) | regs[L], cpu.fetch())
+    else:
+        def handler(cpu, alu):
+            cpu.regs[dst] = cpu.fetch()
+    return _named(handler, "MVI_" + REGISTERS[dst], MVI.__doc__)
+
+def _accumulate(name, table, src, cy, doc):
+    """
+    ADD/ADC/SUB/SBB/ANA/XRA/ORA r, M or immediate
+
+    `table` is the ALU lookup table of the operation, `cy` the mask
+    that selects whether the carry flag takes part in the lookup.
+
+    """
+    if src is None:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            data = table[((cpu.flags & cy) << 16) | (regs[A] << 8) | cpu.fetch()]
+            regs[A] = data >> 8
+            cpu.flags = data & 0xff
+    elif src == M:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            tmp = cpu.read((regs[H] << 8) | regs[L])
+            data = table[((cpu.flags & cy) << 16) | (regs[A] << 8) | tmp]
+            regs[A] = data >> 8
+            cpu.flags = data & 0xff
+    else:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            data = table[((cpu.flags & cy) << 16) | (regs[A] << 8) | regs[src]]
+            regs[A] = data >> 8
+            cpu.flags = data & 0xff
+    return _named(handler, name, doc)
+
+def _compare(name, src, doc):
+    """ CMP r, M or immediate """
+    if src is None:
+        def handler(cpu, alu):
+            cpu.flags = SUB_TABLE[(cpu.regs[A] << 8) | cpu.fetch()] & 0xff
+    elif src == M:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            tmp = cpu.read((regs[H] << 8) | regs[L])
+            cpu.flags = SUB_TABLE[(regs[A] << 8) | tmp] & 0xff
+    else:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            cpu.flags = SUB_TABLE[(regs[A] << 8) | regs[src]] & 0xff
+    return _named(handler, name, doc)
+
+def _step(name, table, dst, doc):
+    """ INR/DCR r """
+    if dst == M:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            addr = (regs[H] << 8) | regs[L]
+            data = table[cpu.read(addr)]
+            cpu.write(addr, data >> 8)
+            cpu.flags = (data & 0xff) | (cpu.flags & CY)
+    else:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            data = table[regs[dst]]
+            regs[dst] = data >> 8
+            cpu.flags = (data & 0xff) | (cpu.flags & CY)
+    return _named(handler, name + "_" + REGISTERS[dst], doc)
+
+def _lxi(rp):
+    """ LXI rp, data 16 """
+    if rp == SP:
+        def handler(cpu, alu):
+            cpu.sp = cpu.fetch_16()
+    else:
+        hi, lo = 2 * rp, 2 * rp + 1
+        def handler(cpu, alu):
+            regs = cpu.regs
+            data_16 = cpu.fetch_16()
+            regs[hi] = data_16 >> 8
+            regs[lo] = data_16 & 0xff
+    return _named(handler, "LXI_" + PAIRS[rp], LXI.__doc__)
+
+def _ldax(rp):
+    """ LDAX rp """
+    hi, lo = 2 * rp, 2 * rp + 1
+    def handler(cpu, alu):
+        regs = cpu.regs
+        regs[A] = cpu.read((regs[hi] << 8) | regs[lo])
+    return _named(handler, "LDAX_" + PAIRS[rp], LDAX.__doc__)
+
+def _stax(rp):
+    """ STAX rp """
+    hi, lo = 2 * rp, 2 * rp + 1
+    def handler(cpu, alu):
+        regs = cpu.regs
+        cpu.write((regs[hi] << 8) | regs[lo], regs[A])
+    return _named(handler, "STAX_" + PAIRS[rp], STAX.__doc__)
+
+def _inx(name, rp, delta, doc):
+    """ INX/DCX rp """
+    if rp == SP:
+        def handler(cpu, alu):
+            cpu.sp = (cpu.sp + delta) & 0xffff
+    else:
+        hi, lo = 2 * rp, 2 * rp + 1
+        def handler(cpu, alu):
+            regs = cpu.regs
+            data_16 = (((regs[hi] << 8) | regs[lo]) + delta) & 0xffff
+            regs[hi] = data_16 >> 8
+            regs[lo] = data_16 & 0xff
+    return _named(handler, name + "_" + PAIRS[rp], doc)
+
+def _dad(rp):
+    """ DAD rp """
+    if rp == SP:
+        def handler(cpu, alu):
+            regs = cpu.regs
+            data = ((regs[H] << 8) | regs[L]) + cpu.sp
+            regs[H] = (data >> 8) & 0xff
+            regs[L] = data & 0xff
+            cpu.flags = (cpu.flags & ~CY) | (data >> 16)
+    else:
+        hi, lo = 2 * rp, 2 * rp + 1
+        def handler(cpu, alu):
+            regs = cpu.regs
+            data = ((regs[H] << 8) | regs[L]) + ((regs[hi] << 8) | regs[lo])
+            regs[H] = (data >> 8) & 0xff
+            regs[L] = data & 0xff
+            cpu.flags = (cpu.flags & ~CY) | (data >> 16)
+    return _named(handler, "DAD_" + PAIRS[rp], DAD.__doc__)
+
+def _push(rp):
+    """ PUSH rp / PSW """
+    if rp == SP:
+        def handler(cpu, alu):
+            cpu.push_16((cpu.regs[A] << 8) | cpu.flags)
+        name = "PUSH_PSW"
+    else:
+        hi, lo = 2 * rp, 2 * rp + 1
+        def handler(cpu, alu):
+            regs = cpu.regs
+            cpu.push_16((regs[hi] << 8) | regs[lo])
+        name = "PUSH_" + PAIRS[rp]
+    return _named(handler, name, PUSH.__doc__)
+
+def _pop(rp):
+    """ POP rp / PSW """
+    if rp == SP:
+        def handler(cpu, alu):
+            data_16 = cpu.pop_16()
+            cpu.regs[A] = data_16 >> 8
+            cpu.flags = (data_16 & 0xd7) | 0x02
+        name = "POP_PSW"
+    else:
+        hi, lo = 2 * rp, 2 * rp + 1
+        def handler(cpu, alu):
+            regs = cpu.regs
+            data_16 = cpu.pop_16()
+            regs[hi] = data_16 >> 8
+            regs[lo] = data_16 & 0xff
+        name = "POP_" + PAIRS[rp]
+    return _named(handler, name, POP.__doc__)
+
+def _condition(ccc):
+    """ flag mask and expected value of condition code ccc """
+    mask = (Z, CY, P, S)[ccc >> 1]
+    return mask, mask if ccc & 1 else 0
+
+def _jcc(ccc):
+    """ Jcondition addr """
+    mask, want = _condition(ccc)
+    def handler(cpu, alu):
+        addr = cpu.fetch_16()
+        if cpu.flags & mask == want:
+            cpu.pc = addr
+    return _named(handler, "J" + CONDITIONS[ccc], JCC.__doc__)
+
+def _ccc(ccc):
+    """ Ccondition addr """
+    mask, want = _condition(ccc)
+    def handler(cpu, alu):
+        addr = cpu.fetch_16()
+        if cpu.flags & mask == want:
+            cpu.cycles += TAKEN
+            cpu.push_16(cpu.pc)
+            cpu.pc = addr
+    return _named(handler, "C" + CONDITIONS[ccc], CCC.__doc__)
+
+def _rcc(ccc):
+    """ Rcondition """
+    mask, want = _condition(ccc)
+    def handler(cpu, alu):
+        if cpu.flags & mask == want:
+            cpu.cycles += TAKEN
+            cpu.pc = cpu.pop_16()
+    return _named(handler, "R" + CONDITIONS[ccc], RCC.__doc__)
+
+def _rst(nnn):
+    """ RST n """
+    vector = 8 * nnn
+    def handler(cpu, alu):
+        cpu.push_16(cpu.pc)
+        cpu.pc = vector
+    return _named(handler, "RST_%d" % nnn, RST.__doc__)
+
+def build_dispatch():
+    """ Build the 256-entry table of opcode-specialized handlers """
+    table = list(generic)
+
+    for opc in range(0x40, 0x80):
+        if opc != 0x76:
+            table[opc] = _mov((opc >> 3) & 0x07, opc & 0x07)
+
+    accumulate = (
+        ("ADD", ADD_TABLE, 0,  ADD.__doc__, ADI),
+        ("ADC", ADD_TABLE, CY, ADC.__doc__, ACI),
+        ("SUB", SUB_TABLE, 0,  SUB.__doc__, SUI),
+        ("SBB", SUB_TABLE, CY, SBB.__doc__, SBI),
+        ("ANA", ANA_TABLE, 0,  ANA.__doc__, ANI),
+        ("XRA", XRA_TABLE, 0,  XRA.__doc__, XRI),
+        ("ORA", ORA_TABLE, 0,  ORA.__doc__, ORI),
+    )
+    for alu_op, (name, tbl, cy, doc, imm) in enumerate(accumulate):
+        for src in range(8):
+            table[0x80 | (alu_op << 3) | src] = _accumulate(
+                name + "_" + REGISTERS[src], tbl, src, cy, doc
+            )
+        table[0xc6 | (alu_op << 3)] = _accumulate(imm.__name__, tbl, None, cy, imm.__doc__)
+
+    for src in range(8):
+        table[0xb8 | src] = _compare("CMP_" + REGISTERS[src], src, CMP.__doc__)
+    table[0xfe] = _compare("CPI", None, CPI.__doc__)
+
+    for r in range(8):
+        table[0x04 | (r << 3)] = _step("INR", INR_TABLE, r, INR.__doc__)
+        table[0x05 | (r << 3)] = _step("DCR", DCR_TABLE, r, DCR.__doc__)
+        table[0x06 | (r << 3)] = _mvi(r)
+
+    for rp in range(4):
+        table[0x01 | (rp << 4)] = _lxi(rp)
+        table[0x03 | (rp << 4)] = _inx("INX", rp, 1, INX.__doc__)
+        table[0x0b | (rp << 4)] = _inx("DCX", rp, -1, DCX.__doc__)
+        table[0x09 | (rp << 4)] = _dad(rp)
+        table[0xc1 | (rp << 4)] = _pop(rp)
+        table[0xc5 | (rp << 4)] = _push(rp)
+
+    for rp in (BC, DE):
+        table[0x02 | (rp << 4)] = _stax(rp)
+        table[0x0a | (rp << 4)] = _ldax(rp)
+
+    for n in range(8):
+        table[0xc2 | (n << 3)] = _jcc(n)
+        table[0xc4 | (n << 3)] = _ccc(n)
+        table[0xc0 | (n << 3)] = _rcc(n)
+        table[0xc7 | (n << 3)] = _rst(n)
+
+    return table
+
+dispatch = build_dispatch()
+
 class Instructions:
 
     def __init__(self):
@@ -401,37 +718,4 @@ class Instructions:
 
 
     def __init_dispatch(self):
-        return [
-            NOP,   LXI,   STAX,  INX,   INR,   DCR,   MVI,   RLC,   # 0x00–0x07
-            NOP,   DAD,   LDAX,  DCX,   INR,   DCR,   MVI,   RRC,   # 0x08–0x0F
-            NOP,   LXI,   STAX,  INX,   INR,   DCR,   MVI,   RAL,   # 0x10–0x17
-            NOP,   DAD,   LDAX,  DCX,   INR,   DCR,   MVI,   RAR,   # 0x18–0x1F
-            NOP,   LXI,   SHLD,  INX,   INR,   DCR,   MVI,   DAA,   # 0x20–0x27
-            NOP,   DAD,   LHLD,  DCX,   INR,   DCR,   MVI,   CMA,   # 0x28–0x2F
-            NOP,   LXI,   STA,   INX,   INR,   DCR,   MVI,   STC,   # 0x30–0x37
-            NOP,   DAD,   LDA,   DCX,   INR,   DCR,   MVI,   CMC,   # 0x38–0x3F
-            MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x40–0x47
-            MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x48–0x4F
-            MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   HLT,   # 0x50–0x57
-            MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x58–0x5F
-            MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x60–0x67
-            MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x68–0x6F
-            MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   HLT,   MOV,   # 0x70–0x77
-            MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   MOV,   # 0x78–0x7F
-            ADD,   ADD,   ADD,   ADD,   ADD,   ADD,   ADD,   ADD,   # 0x80–0x87
-            ADC,   ADC,   ADC,   ADC,   ADC,   ADC,   ADC,   ADC,   # 0x88–0x8F
-            SUB,   SUB,   SUB,   SUB,   SUB,   SUB,   SUB,   SUB,   # 0x90–0x97
-            SBB,   SBB,   SBB,   SBB,   SBB,   SBB,   SBB,   SBB,   # 0x98–0x9F
-            ANA,   ANA,   ANA,   ANA,   ANA,   ANA,   ANA,   ANA,   # 0xA0–0xA7
-            XRA,   XRA,   XRA,   XRA,   XRA,   XRA,   XRA,   XRA,   # 0xA8–0xAF
-            ORA,   ORA,   ORA,   ORA,   ORA,   ORA,   ORA,   ORA,   # 0xB0–0xB7
-            CMP,   CMP,   CMP,   CMP,   CMP,   CMP,   CMP,   CMP,   # 0xB8–0xBF
-            RCC,   POP,   JCC,   JMP,   CCC,   PUSH,  ADI,   RST,   # 0xC0–0xC7
-            RCC,   RET,   JCC,   JMP,   CCC,   CALL,  ACI,   RST,   # 0xC8–0xCF
-            RCC,   POP,   JCC,   OUT,   CCC,   PUSH,  SUI,   RST,   # 0xD0-0xD7
-            RCC,   RET,   JCC,   IN,    CCC,   CALL,  SBI,   RST,   # 0xD8-0xDF
-            RCC,   POP,   JCC,   XTHL,  CCC,   PUSH,  ANI,   RST,   # 0xE0-0xE7
-            RCC,   PCHL,  JCC,   XCHG,  CCC,   CALL,  XRI,   RST,   # 0xE8-0xEF
-            RCC,   POP,   JCC,   DI,    CCC,   PUSH,  ORI,   RST,   # 0xF0-0xF7
-            RCC,   SPHL,  JCC,   EI,    CCC,   CALL,  CPI,   RST    # 0xF8-0xFF                                                 
-        ]
+        return build_dispatch()
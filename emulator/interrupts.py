@@ -0,0 +1,145 @@
+import heapq
+from itertools import count
+
+from .instructions import CYCLES
+
+# Interrupt controller and cycle-timestamped event queue
+#
+# Devices schedule callbacks at absolute cycle counts. The controller
+# runs the machine without any per-instruction check until the cycle of
+# the next event, fires the due callbacks and injects the RST of any
+# requested interrupt. Events fire after the instruction (or translated
+# block) that crosses their cycle.
+
+
+def inject(cpu, n):
+    """ Take RST n: the interrupted pc goes to the stack """
+    cpu.ints = False
+    cpu.halt = False
+    cpu.ir = 0xc7 | (n << 3)
+    cpu.cycles += CYCLES[cpu.ir]
+    cpu.push_16(cpu.pc)
+    cpu.pc = n << 3
+
+
+class Scheduler:
+    """ Heap of (cycle, seq, callback) events """
+
+    def __init__(self):
+        self.queue = []
+        self.seq = count()
+
+    def schedule(self, cycle, callback):
+        """ Call callback(cycle) once the cycle counter reaches cycle """
+        event = [cycle, next(self.seq), callback]
+        heapq.heappush(self.queue, event)
+        return event
+
+    def cancel(self, event):
+        # cancelled events stay in the heap until they are due
+        event[2] = None
+
+    def next(self):
+        """ Cycle of the next event, None if there is none """
+        queue = self.queue
+        while queue and queue[0][2] is None:
+            heapq.heappop(queue)
+        return queue[0][0] if queue else None
+
+    def fire(self, now):
+        """ Call every event due at cycle now """
+        queue = self.queue
+        while queue and queue[0][0] <= now:
+            cycle, _, callback = heapq.heappop(queue)
+            if callback is not None:
+                callback(cycle)
+
+
+class Controller:
+
+    def __init__(self, machine):
+        """ Interrupt controller of a CPU, VM or Translator """
+        self.machine = machine
+        self.cpu = getattr(machine, "cpu", machine)
+        self.events = Scheduler()
+
+        # bit n set: RST n requested
+        self.pending = 0
+
+        # told about every interrupt taken, see replay
+        self.recorder = None
+
+    def schedule(self, cycle, callback):
+        return self.events.schedule(cycle, callback)
+
+    def cancel(self, event):
+        self.events.cancel(event)
+
+    def every(self, period, callback, start=None):
+        """
+        Call callback(cycle) every period cycles, first at start
+
+        Returns the event list of the next occurrence; cancelling it
+        stops the timer.
+
+        """
+        events = self.events
+        first = self.cpu.cycles + period if start is None else start
+        event = events.schedule(first, None)
+
+        def tick(cycle):
+            callback(cycle)
+            if event[2] is not None:
+                event[0], event[1] = cycle + period, next(events.seq)
+                heapq.heappush(events.queue, event)
+
+        event[2] = tick
+        return event
+
+    def interrupt(self, n):
+        """ Request RST n; it is taken as soon as interrupts are enabled """
+        self.pending |= 1 << n
+
+    def acknowledge(self):
+        """
+        Take the lowest pending RST if interrupts are enabled
+
+        As on the 8080, nothing is taken right after EI, so an ISR can
+        end with EI; RET without nesting.
+
+        """
+        cpu = self.cpu
+        if not self.pending or not cpu.ints or cpu.ei == cpu.cycles:
+            return False
+        n = (self.pending & -self.pending).bit_length() - 1
+        self.pending &= self.pending - 1
+        if self.recorder is not None:
+            self.recorder.interrupt(n)
+        inject(cpu, n)
+        return True
+
+    def run(self, max_cycles=None):
+        """
+        Execute until the cycle counter reaches max_cycles, or until the
+        machine halted and nothing can wake it up
+
+        A halted machine waiting for an interrupt skips straight to the
+        cycle of the next event.
+
+        """
+        cpu, machine, events = self.cpu, self.machine, self.events
+        end = float("inf") if max_cycles is None else max_cycles
+        while cpu.cycles < end:
+            self.acknowledge()
+            due = events.next()
+            if cpu.halt:
+                if due is None or not cpu.ints:
+                    return
+                cpu.cycles = max(cpu.cycles, min(due, end))
+            elif self.pending and (not cpu.ints or cpu.ei == cpu.cycles):
+                # a masked request: go slowly until EI and the
+                # instruction after it
+                machine.run(cpu.cycles + 1)
+            else:
+                machine.run(end if due is None else min(due, end))
+            events.fire(cpu.cycles)
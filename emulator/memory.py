@@ -0,0 +1,44 @@
+import os
+
+# Page-granular memory map
+#
+# The 64 KiB address space is split into 256-byte pages. Every page
+# carries a set of attribute bits; plain RAM pages have none, so the
+# common case costs a single test on the page table.
+
+PAGE_BITS   = 8
+PAGE_SIZE   = 1 << PAGE_BITS
+PAGES       = 1 << (16 - PAGE_BITS)
+
+# page attributes
+RAM         = 0x00
+ROM         = 0x01      # writes are ignored
+IO          = 0x02      # reads and writes go to the page handlers
+CODE        = 0x04      # holds translated code, writes invalidate it
+WATCH       = 0x08      # reads and writes are reported to the debugger
+BREAK       = 0x10      # holds breakpoints, writes are reported to the debugger
+
+# pages whose reads leave the fast path
+CHECKED     = IO | WATCH
+
+# attributes kept when a page is remapped
+MARKS       = CODE | WATCH | BREAK
+
+
+def pages(addr, size):
+    """ Page numbers covering [addr, addr + size) """
+    if addr % PAGE_SIZE or size % PAGE_SIZE:
+        raise ValueError("memory map regions must be page aligned")
+    if addr < 0 or addr + size > 1 << 16:
+        raise ValueError("memory map region outside of the address space")
+    return range(addr >> PAGE_BITS, (addr + size) >> PAGE_BITS)
+
+
+def image(source):
+    """ Program bytes given as bytes, a list of ints, a path or an open file """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "read"):
+        return source.read()
+    return source
@@ -0,0 +1,131 @@
+from collections import namedtuple
+
+# Opcode metadata
+#
+# One entry per opcode with its mnemonic, register operands, length,
+# immediate operand kind and T-states. The interpreter takes its cycle
+# counts from here, the translator its instruction lengths, and the
+# assembler and disassembler their encodings.
+
+Opcode = namedtuple("Opcode", "opcode mnemonic operands length kind cycles")
+
+# immediate operand kinds: None, a byte or a word following the opcode
+D8      = "d8"
+D16     = "d16"
+LENGTH  = {None: 1, D8: 2, D16: 3}
+
+# T-states of every opcode. Conditional calls and returns are listed
+# with their not-taken count; their handlers charge the 6 extra states
+# when the condition holds.
+
+CYCLES = [
+     4, 10,  7,  5,  5,  5,  7,  4,    # 0x00–0x07
+     4, 10,  7,  5,  5,  5,  7,  4,    # 0x08–0x0F
+     4, 10,  7,  5,  5,  5,  7,  4,    # 0x10–0x17
+     4, 10,  7,  5,  5,  5,  7,  4,    # 0x18–0x1F
+     4, 10, 16,  5,  5,  5,  7,  4,    # 0x20–0x27
+     4, 10, 16,  5,  5,  5,  7,  4,    # 0x28–0x2F
+     4, 10, 13,  5, 10, 10, 10,  4,    # 0x30–0x37
+     4, 10, 13,  5,  5,  5,  7,  4,    # 0x38–0x3F
+     5,  5,  5,  5,  5,  5,  7,  5,    # 0x40–0x47
+     5,  5,  5,  5,  5,  5,  7,  5,    # 0x48–0x4F
+     5,  5,  5,  5,  5,  5,  7,  5,    # 0x50–0x57
+     5,  5,  5,  5,  5,  5,  7,  5,    # 0x58–0x5F
+     5,  5,  5,  5,  5,  5,  7,  5,    # 0x60–0x67
+     5,  5,  5,  5,  5,  5,  7,  5,    # 0x68–0x6F
+     7,  7,  7,  7,  7,  7,  7,  7,    # 0x70–0x77
+     5,  5,  5,  5,  5,  5,  7,  5,    # 0x78–0x7F
+     4,  4,  4,  4,  4,  4,  7,  4,    # 0x80–0x87
+     4,  4,  4,  4,  4,  4,  7,  4,    # 0x88–0x8F
+     4,  4,  4,  4,  4,  4,  7,  4,    # 0x90–0x97
+     4,  4,  4,  4,  4,  4,  7,  4,    # 0x98–0x9F
+     4,  4,  4,  4,  4,  4,  7,  4,    # 0xA0–0xA7
+     4,  4,  4,  4,  4,  4,  7,  4,    # 0xA8–0xAF
+     4,  4,  4,  4,  4,  4,  7,  4,    # 0xB0–0xB7
+     4,  4,  4,  4,  4,  4,  7,  4,    # 0xB8–0xBF
+     5, 10, 10, 10, 11, 11,  7, 11,    # 0xC0–0xC7
+     5, 10, 10, 10, 11, 17,  7, 11,    # 0xC8–0xCF
+     5, 10, 10, 10, 11, 11,  7, 11,    # 0xD0–0xD7
+     5, 10, 10, 10, 11, 17,  7, 11,    # 0xD8–0xDF
+     5, 10, 10, 18, 11, 11,  7, 11,    # 0xE0–0xE7
+     5,  5, 10,  4, 11, 17,  7, 11,    # 0xE8–0xEF
+     5, 10, 10,  4, 11, 11,  7, 11,    # 0xF0–0xF7
+     5,  5, 10,  4, 11, 17,  7, 11     # 0xF8–0xFF
+]
+
+# Cycles charged on top of CYCLES by a taken conditional call or return
+TAKEN = 6
+
+
+REGISTERS   = ("B", "C", "D", "E", "H", "L", "M", "A")
+PAIRS       = ("B", "D", "H", "SP")
+STACK       = ("B", "D", "H", "PSW")
+CONDITIONS  = ("NZ", "Z", "NC", "C", "PO", "PE", "P", "M")
+ALU         = ("ADD", "ADC", "SUB", "SBB", "ANA", "XRA", "ORA", "CMP")
+IMMEDIATE   = ("ADI", "ACI", "SUI", "SBI", "ANI", "XRI", "ORI", "CPI")
+
+
+def build_opcodes():
+    """ Build the 256-entry opcode metadata table """
+    table = [None] * 256
+
+    def op(opc, mnemonic, operands=(), kind=None):
+        table[opc] = Opcode(opc, mnemonic, operands, LENGTH[kind], kind, CYCLES[opc])
+
+    # NOP and its undocumented aliases; the other aliases (JMP, RET,
+    # CALL) follow their documented opcode below
+    for opc in range(0x00, 0x40, 0x08):
+        op(opc, "NOP")
+
+    for rp, pair in enumerate(PAIRS):
+        op(0x01 | (rp << 4), "LXI", (pair,), D16)
+        op(0x03 | (rp << 4), "INX", (pair,))
+        op(0x09 | (rp << 4), "DAD", (pair,))
+        op(0x0b | (rp << 4), "DCX", (pair,))
+    for rp, pair in enumerate(STACK):
+        op(0xc1 | (rp << 4), "POP", (pair,))
+        op(0xc5 | (rp << 4), "PUSH", (pair,))
+    for rp in range(2):
+        op(0x02 | (rp << 4), "STAX", (PAIRS[rp],))
+        op(0x0a | (rp << 4), "LDAX", (PAIRS[rp],))
+
+    for r, reg in enumerate(REGISTERS):
+        op(0x04 | (r << 3), "INR", (reg,))
+        op(0x05 | (r << 3), "DCR", (reg,))
+        op(0x06 | (r << 3), "MVI", (reg,), D8)
+        for s, src in enumerate(REGISTERS):
+            op(0x40 | (r << 3) | s, "MOV", (reg, src))
+        for s, src in enumerate(REGISTERS):
+            op(0x80 | (r << 3) | s, ALU[r], (src,))
+        op(0xc6 | (r << 3), IMMEDIATE[r], (), D8)
+
+    for n, cond in enumerate(CONDITIONS):
+        op(0xc0 | (n << 3), "R" + cond)
+        op(0xc2 | (n << 3), "J" + cond, (), D16)
+        op(0xc4 | (n << 3), "C" + cond, (), D16)
+        op(0xc7 | (n << 3), "RST", (str(n),))
+
+    # 0x76 replaces MOV M,M
+    for opc, mnemonic in (
+        (0x07, "RLC"), (0x0f, "RRC"), (0x17, "RAL"), (0x1f, "RAR"),
+        (0x27, "DAA"), (0x2f, "CMA"), (0x37, "STC"), (0x3f, "CMC"),
+        (0x76, "HLT"), (0xc9, "RET"), (0xd9, "RET"), (0xe3, "XTHL"),
+        (0xe9, "PCHL"), (0xeb, "XCHG"), (0xf3, "DI"), (0xf9, "SPHL"),
+        (0xfb, "EI"),
+    ):
+        op(opc, mnemonic)
+
+    for opc, mnemonic in (
+        (0x22, "SHLD"), (0x2a, "LHLD"), (0x32, "STA"), (0x3a, "LDA"),
+        (0xc3, "JMP"), (0xcb, "JMP"),
+        (0xcd, "CALL"), (0xdd, "CALL"), (0xed, "CALL"), (0xfd, "CALL"),
+    ):
+        op(opc, mnemonic, (), D16)
+
+    op(0xd3, "OUT", (), D8)
+    op(0xdb, "IN", (), D8)
+
+    return table
+
+OPCODES = build_opcodes()
+LENGTHS = [opcode.length for opcode in OPCODES]
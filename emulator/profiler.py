@@ -0,0 +1,84 @@
+from array import array
+from collections import namedtuple
+from time import perf_counter_ns
+
+from .instructions import dispatch, CYCLES
+
+# Execution profiler
+#
+# A Profiler runs a CPU or VM with its own copy of the interpreter loop,
+# so the plain run loops carry no profiling code at all. Counts go to
+# preallocated arrays: executions per opcode, hits per address and host
+# nanoseconds spent in each opcode handler. With sample=N only every Nth
+# instruction is recorded and timed, the others take the fast path.
+
+Report = namedtuple("Report", "addresses opcodes")
+
+
+class Profiler:
+
+    def __init__(self, sample=1):
+        self.sample = sample
+
+        # instructions until the next recorded one
+        self.left = sample
+
+        self.opcodes = array('Q', [0]) * 256
+        self.addresses = array('Q', [0]) * (1 << 16)
+        self.time = array('Q', [0]) * 256
+
+    def reset(self):
+        self.left = self.sample
+        for counts in (self.opcodes, self.addresses, self.time):
+            counts[:] = array(counts.typecode, [0]) * len(counts)
+
+    def run(self, machine, max_cycles=None):
+        """ Run a CPU or VM like its run(max_cycles), recording a profile """
+        if hasattr(machine, "optable"):
+            cpu = machine.cpu
+            table, args = machine.optable, (cpu,)
+        else:
+            cpu = machine
+            table, args = cpu.table, (cpu, cpu.alu)
+
+        opcodes, addresses, time = self.opcodes, self.addresses, self.time
+        clock, cycles, fetch = perf_counter_ns, CYCLES, cpu.fetch
+        limit = float("inf") if max_cycles is None else max_cycles
+        sample, left = self.sample, self.left
+        while not cpu.halt and cpu.cycles < limit:
+            pc = cpu.pc
+            cpu.ir = opc = fetch()
+            cpu.cycles += cycles[opc]
+            left -= 1
+            if left:
+                table[opc](*args)
+                continue
+            left = sample
+            opcodes[opc] += 1
+            addresses[pc] += 1
+            start = clock()
+            table[opc](*args)
+            time[opc] += clock() - start
+        self.left = left
+
+    def report(self, n=10):
+        """
+        Top n addresses and opcodes
+
+        addresses holds (addr, count) pairs, opcodes holds
+        (name, opcode, count, host ns) tuples, both by descending count.
+        Counts are samples when sample > 1.
+
+        """
+        addresses = sorted(
+            ((addr, count) for addr, count in enumerate(self.addresses) if count),
+            key=lambda item: -item[1]
+        )[:n]
+        opcodes = sorted(
+            (
+                (dispatch[opc].__name__, opc, count, self.time[opc])
+                for opc, count in enumerate(self.opcodes) if count
+            ),
+            key=lambda item: -item[2]
+        )[:n]
+        return Report(addresses, opcodes)
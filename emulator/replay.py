@@ -0,0 +1,255 @@
+import os
+import struct
+from collections import deque
+
+from .interrupts import Controller
+
+# Input recording and replay
+#
+# A Recorder stands in for the bus of a machine and logs the value of
+# every IN, and, attached to a Controller, every interrupt taken, each
+# stamped with the cycle counter. A Replay feeds a log back: it answers
+# IN from the log and injects the interrupts at their cycles, with no
+# device attached, so a recorded session reruns headless and at full
+# speed. Any IN that does not match the log raises Divergence.
+#
+# A log is a header followed by records. Every record is a tag byte,
+# the cycles since the previous record as an unsigned LEB128 varint and
+# the record's data:
+#
+#   magic    4s     b"I80R"
+#   version  H
+#
+#   PORT     port B, data B
+#   IRQ      n B
+#   END      -
+
+MAGIC   = b"I80R"
+VERSION = 1
+HEADER  = struct.Struct("<4sH")
+
+# record tags
+PORT    = 0
+IRQ     = 1
+END     = 2
+
+# records kept before writing them out
+BUFFER  = 1 << 16
+
+
+class Divergence(Exception):
+    """ Raised by a Replay when the machine departs from the log """
+
+    def __init__(self, message, cycle):
+        super().__init__("cycle %d: %s" % (cycle, message))
+        self.cycle = cycle
+
+
+def _varint(value):
+    data = bytearray()
+    while value > 0x7f:
+        data.append((value & 0x7f) | 0x80)
+        value >>= 7
+    data.append(value)
+    return data
+
+
+class Recorder:
+
+    def __init__(self, machine, target, controller=None):
+        """
+        Record the input of a CPU, VM or Translator to target
+
+        target is a path or an open binary file. The recorder replaces
+        the bus of the machine until close(); IN and OUT still reach the
+        devices attached to it.
+
+        """
+        self.cpu = getattr(machine, "cpu", machine)
+        self.bus = self.cpu.bus
+        self.cpu.bus = self
+
+        if isinstance(target, (str, os.PathLike)):
+            self.stream, self.owned = open(target, "wb"), True
+        else:
+            self.stream, self.owned = target, False
+        self.log = bytearray(HEADER.pack(MAGIC, VERSION))
+
+        # cycle stamp of the last record
+        self.last = self.cpu.cycles
+
+        if controller is not None:
+            controller.recorder = self
+        self.controller = controller
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, tag, *data):
+        cycles = self.cpu.cycles
+        self.log.append(tag)
+        self.log += _varint(cycles - self.last)
+        self.log += bytes(data)
+        self.last = cycles
+        if len(self.log) >= BUFFER:
+            self.flush()
+
+    def read(self, port):
+        data = self.bus.read(port)
+        self.record(PORT, port, data)
+        return data
+
+    def write(self, port, data):
+        self.bus.write(port, data)
+
+    def attach(self, device, *ports):
+        return self.bus.attach(device, *ports)
+
+    def detach(self, *ports):
+        self.bus.detach(*ports)
+
+    def interrupt(self, n):
+        """ Called by the Controller as RST n is taken """
+        self.record(IRQ, n)
+
+    def flush(self):
+        self.stream.write(self.log)
+        self.log = bytearray()
+
+    def close(self):
+        """ Log the final cycle count, write out the log and give back the bus """
+        if self.stream is None:
+            return
+        self.record(END)
+        self.flush()
+        if self.owned:
+            self.stream.close()
+        self.stream = None
+        self.cpu.bus = self.bus
+        if self.controller is not None:
+            self.controller.recorder = None
+
+
+def records(source):
+    """
+    Records of a log as (tag, cycle, data) tuples
+
+    source is a path, an open file or bytes. Cycles are relative to the
+    start of the recording; data is (port, byte) for PORT, (n,) for IRQ
+    and () for END.
+
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return records(f)
+    if hasattr(source, "read"):
+        source = source.read()
+
+    view = memoryview(source).cast("B")
+    if len(view) < HEADER.size:
+        raise ValueError("not an input log")
+    magic, version = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("not an input log")
+    if version != VERSION:
+        raise ValueError("unsupported input log version %d" % version)
+
+    result = []
+    pos, cycle = HEADER.size, 0
+    sizes = {PORT: 2, IRQ: 1, END: 0}
+    while pos < len(view):
+        tag = view[pos]
+        if tag not in sizes:
+            raise ValueError("bad input log record %d" % tag)
+        pos += 1
+        delta = shift = 0
+        while True:
+            if pos >= len(view):
+                raise ValueError("truncated input log")
+            byte = view[pos]
+            pos += 1
+            delta |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        cycle += delta
+        size = sizes[tag]
+        if pos + size > len(view):
+            raise ValueError("truncated input log")
+        result.append((tag, cycle, tuple(view[pos:pos + size])))
+        pos += size
+    return result
+
+
+class Replay:
+
+    def __init__(self, machine, source):
+        """
+        Replay the log in source on a CPU, VM or Translator
+
+        The machine must start in the state the recording started in.
+        The replay replaces its bus: OUT only sets the port latches.
+        Interrupts are taken at the first instruction or block boundary
+        past their cycle, so replay on the engine the log was recorded
+        with, or on an interpreter.
+
+        """
+        self.machine = machine
+        self.cpu = cpu = getattr(machine, "cpu", machine)
+        self.bus = cpu.bus
+        cpu.bus = self
+
+        base = cpu.cycles
+        self.end = None
+        self.input = deque()
+        self.controller = Controller(machine)
+        for tag, cycle, data in records(source):
+            if tag == PORT:
+                self.input.append((base + cycle, data[0], data[1]))
+            elif tag == IRQ:
+                self.controller.schedule(base + cycle, self.__request(data[0]))
+            else:
+                # a halted recording idled up to here
+                self.end = base + cycle
+                self.controller.schedule(self.end, lambda cycle: None)
+
+    def __request(self, n):
+        controller = self.controller
+        return lambda cycle: controller.interrupt(n)
+
+    def read(self, port):
+        cpu = self.cpu
+        if not self.input:
+            raise Divergence("IN 0x%02x past the end of the log" % port, cpu.cycles)
+        cycle, logged, data = self.input.popleft()
+        if (cycle, logged) != (cpu.cycles, port):
+            raise Divergence(
+                "IN 0x%02x, the log has IN 0x%02x at cycle %d" % (port, logged, cycle),
+                cpu.cycles
+            )
+        cpu.ports[port] = data
+        return data
+
+    def write(self, port, data):
+        self.cpu.ports[port] = data
+
+    def attach(self, device, *ports):
+        return device
+
+    def detach(self, *ports):
+        pass
+
+    def run(self, max_cycles=None):
+        """
+        Execute with the logged input until max_cycles, by default until
+        the cycle the recording was closed at
+
+        """
+        self.controller.run(self.end if max_cycles is None else max_cycles)
+
+    def close(self):
+        """ Give the machine its bus back """
+        self.cpu.bus = self.bus
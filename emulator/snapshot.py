@@ -0,0 +1,77 @@
+import os
+import struct
+
+# Binary machine snapshots
+#
+# A snapshot is a fixed-size header holding the registers and counters,
+# followed by the raw memory and port images:
+#
+#   magic    4s     b"I80S"
+#   version  H
+#   pc, sp   H H
+#   acc      B
+#   flags    B
+#   ir       B
+#   ints     ?
+#   halt     ?
+#   ei       ?      EI ran last, interrupts still held off
+#   regs     8s     B C D E H L M A
+#   cycles   Q
+#   mem      65536 bytes
+#   ports    256 bytes
+#
+# Restoring is one struct unpack and two slice assignments.
+
+MAGIC   = b"I80S"
+VERSION = 2
+
+HEADER  = struct.Struct("<4sHHHBBB???8sQ")
+MEMORY  = 1 << 16
+PORTS   = 256
+SIZE    = HEADER.size + MEMORY + PORTS
+
+
+def snapshot(cpu):
+    """ Machine state of cpu as bytes """
+    header = HEADER.pack(
+        MAGIC, VERSION, cpu.pc, cpu.sp, cpu.acc, cpu.flags, cpu.ir,
+        cpu.ints, cpu.halt, cpu.ei == cpu.cycles, bytes(cpu.regs), cpu.cycles
+    )
+    return b"".join((header, cpu.mem, cpu.ports))
+
+def restore(cpu, data):
+    """ Replace the machine state of cpu by a snapshot """
+    view = memoryview(data).cast("B")
+    if len(view) < HEADER.size:
+        raise ValueError("truncated snapshot")
+    (magic, version, pc, sp, acc, flags, ir,
+     ints, halt, ei, regs, cycles) = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("not a snapshot")
+    if version != VERSION:
+        raise ValueError("unsupported snapshot version %d" % version)
+    if len(view) != SIZE:
+        raise ValueError("truncated snapshot")
+
+    offset = HEADER.size
+    cpu.mem[:] = view[offset:offset + MEMORY]
+    offset += MEMORY
+    cpu.ports[:] = view[offset:offset + PORTS]
+
+    cpu.pc, cpu.sp, cpu.acc, cpu.flags, cpu.ir = pc, sp, acc, flags, ir
+    cpu.ints, cpu.halt, cpu.cycles = ints, halt, cycles
+    cpu.ei = cycles if ei else -1
+    cpu.regs[:] = regs
+
+    # translated blocks describe the memory that was just replaced
+    if cpu.translator is not None:
+        cpu.translator.flush()
+
+def save(cpu, target):
+    """ Write a snapshot of cpu to a path or an open file """
+    data = snapshot(cpu)
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, "wb") as f:
+            f.write(data)
+    else:
+        target.write(data)
@@ -0,0 +1,148 @@
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+from .instructions import CYCLES
+
+# Instruction tracer
+#
+# Every executed instruction is stored as one row of a ring buffer made
+# of preallocated typed arrays, one array per column, so tracing does not
+# allocate per record. A row holds the pc and opcode of the instruction
+# and the machine state after it ran.
+#
+# With a stream, every filled stretch of the ring is written out as a
+# columnar chunk:
+#
+#   magic    4s     b"I80T"
+#   version  H
+#   count    I
+#   columns  count values per column, in COLUMNS order, little-endian
+
+COLUMNS = (
+    ("pc",      'H'),
+    ("opcode",  'B'),
+    ("a",       'B'),
+    ("flags",   'B'),
+    ("bc",      'H'),
+    ("de",      'H'),
+    ("hl",      'H'),
+    ("sp",      'H'),
+    ("cycles",  'Q'),
+)
+
+MAGIC   = b"I80T"
+VERSION = 1
+HEADER  = struct.Struct("<4sHI")
+
+Record = namedtuple("Record", [name for name, _ in COLUMNS])
+
+
+class Tracer:
+
+    def __init__(self, size=1 << 16, stream=None):
+        self.size = size
+        self.stream = stream
+        self.columns = [array(code, [0]) * size for _, code in COLUMNS]
+
+        # next row, rows of the current lap already streamed
+        self.pos = 0
+        self.written = 0
+
+        # instructions traced so far
+        self.count = 0
+
+    def run(self, machine, max_cycles=None):
+        """ Run a CPU or VM like its run(max_cycles), tracing every instruction """
+        if hasattr(machine, "optable"):
+            cpu = machine.cpu
+            table, args = machine.optable, (cpu,)
+        else:
+            cpu = machine
+            table, args = cpu.table, (cpu, cpu.alu)
+
+        pcs, opcodes, accs, flags, bcs, des, hls, sps, counts = self.columns
+        cycles, fetch = CYCLES, cpu.fetch
+        limit = float("inf") if max_cycles is None else max_cycles
+        size, pos, start = self.size, self.pos, self.count - self.pos
+        try:
+            while not cpu.halt and cpu.cycles < limit:
+                pc = cpu.pc
+                cpu.ir = opc = fetch()
+                cpu.cycles += cycles[opc]
+                table[opc](*args)
+
+                regs = cpu.regs
+                pcs[pos] = pc
+                opcodes[pos] = opc
+                accs[pos] = regs[7]
+                flags[pos] = cpu.flags
+                bcs[pos] = (regs[0] << 8) | regs[1]
+                des[pos] = (regs[2] << 8) | regs[3]
+                hls[pos] = (regs[4] << 8) | regs[5]
+                sps[pos] = cpu.sp
+                counts[pos] = cpu.cycles
+                pos += 1
+                if pos == size:
+                    self.pos = size
+                    if self.stream is not None:
+                        self.flush()
+                    start += size
+                    pos = self.pos = self.written = 0
+        finally:
+            self.pos = pos
+            self.count = start + pos
+
+    def last(self, n=None):
+        """ The last n traced instructions as Records, oldest first """
+        held = min(self.count, self.size)
+        n = held if n is None else min(n, held)
+        rows = [(self.pos - n + k) % self.size for k in range(n)]
+        return [Record(*(column[row] for column in self.columns)) for row in rows]
+
+    def flush(self):
+        """ Write the rows traced since the last write to the stream """
+        start, end = self.written, self.pos
+        if end == start:
+            return
+        stream = self.stream
+        stream.write(HEADER.pack(MAGIC, VERSION, end - start))
+        for column in self.columns:
+            chunk = column[start:end]
+            if sys.byteorder == "big":
+                chunk.byteswap()
+            stream.write(chunk.tobytes())
+        self.written = end
+
+
+def read(source):
+    """
+    Columns of a streamed trace
+
+    source is a path or an open file. Returns a dict of arrays keyed by
+    column name, each holding every record of the trace.
+
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return read(f)
+
+    columns = {name: array(code) for name, code in COLUMNS}
+    while True:
+        header = source.read(HEADER.size)
+        if not header:
+            break
+        magic, version, count = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("not a trace")
+        if version != VERSION:
+            raise ValueError("unsupported trace version %d" % version)
+        for name, code in COLUMNS:
+            chunk = array(code)
+            chunk.frombytes(source.read(count * chunk.itemsize))
+            if sys.byteorder == "big":
+                chunk.byteswap()
+            columns[name].extend(chunk)
+    return columns
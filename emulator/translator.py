@@ -0,0 +1,657 @@
+from .flags         import Z, S, AC, P, CY
+from .registers     import *
+from .alu           import (
+    ADD_TABLE, SUB_TABLE, ANA_TABLE, XRA_TABLE, ORA_TABLE, INR_TABLE, DCR_TABLE
+)
+from .instructions  import dispatch, CYCLES, TAKEN
+from .opcodes       import LENGTHS
+from .memory        import IO, CODE
+
+
+# Basic-block translation
+#
+# A block is the straight-line run of instructions starting at some
+# address. It is decoded once, emitted as the source of one Python
+# function with the registers held in locals, compiled and cached by its
+# start address. A block ends at any control transfer, at any memory
+# store (so self-modifying code is seen before the next block is
+# entered), at instructions left to the interpreter, or after
+# MAX_BLOCK instructions.
+#
+# Blocks that branch back to their own start are idle loops when they
+# only count a register down or poll memory that nothing changes. Such
+# a loop is fast-forwarded: the iterations left before it exits or the
+# cycle budget of run() is crossed are computed at once and charged
+# their exact cycles.
+
+MAX_BLOCK = 64
+
+NAMES       = ("b", "c", "d", "e", "h", "l", None, "a")
+PAIRS       = (("b", "c"), ("d", "e"), ("h", "l"), None)
+TABLES      = ("ADD_TABLE", "ADD_TABLE", "SUB_TABLE", "SUB_TABLE",
+               "ANA_TABLE", "XRA_TABLE", "ORA_TABLE", "SUB_TABLE")
+OPERATORS   = ("+", "+", "-", "-", "&", "^", "|", None)
+
+# the five condition flags
+ALL         = S | Z | AC | P | CY
+
+# opcodes run by their interpreter handler: they end the block
+FALLBACK    = {0x27, 0x76, 0xd3, 0xdb, 0xf3, 0xfb}
+
+
+def _condition(ccc):
+    mask = (Z, CY, P, S)[ccc >> 1]
+    return "(f & 0x%02x) == 0x%02x" % (mask, mask if ccc & 1 else 0)
+
+
+class Translator:
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+
+        # start address -> compiled block
+        self.cache = {}
+
+        # start address -> (first, last + 1) address covered by the block
+        self.extent = {}
+
+        # byte address -> start addresses of the blocks covering it;
+        # the pages they sit in are marked CODE so writes reach invalidate
+        self.owners = {}
+        self.marks = bytearray(1 << 16)
+
+        # cycle budget of the current run, bounds fast-forwarded loops
+        self.limit = float("inf")
+
+        # blocks end before breakpoints; one starting at a breakpoint is
+        # replaced by trap, see debugger
+        self.breakpoints = set()
+        self.trap = None
+
+        cpu.translator = self
+
+    def run(self, max_cycles=None):
+        """
+        Execute until HLT or until the cycle counter reaches max_cycles
+
+        The budget is checked between blocks, so the block crossing
+        max_cycles is completed.
+
+        """
+        cpu = self.cpu
+        cache = self.cache
+        if max_cycles is None:
+            max_cycles = float("inf")
+        self.limit = max_cycles
+        while not cpu.halt and cpu.cycles < max_cycles:
+            block = cache.get(cpu.pc)
+            if block is None:
+                block = self.translate(cpu.pc)
+            block(cpu)
+
+    def invalidate(self, addr):
+        """ Drop every block covering addr """
+        if not self.marks[addr]:
+            return
+        for start in self.owners.pop(addr):
+            if start not in self.extent:
+                continue
+            first, last = self.extent.pop(start)
+            del self.cache[start]
+            for byte in range(first, last):
+                self.marks[byte] -= 1
+                owners = self.owners.get(byte)
+                if owners is not None:
+                    owners.discard(start)
+                    if not owners:
+                        del self.owners[byte]
+
+    def flush(self):
+        """ Drop all translated blocks """
+        self.cache.clear()
+        self.extent.clear()
+        self.owners.clear()
+        self.marks = bytearray(1 << 16)
+        pages = self.cpu.pages
+        for page in range(len(pages)):
+            pages[page] &= ~CODE
+
+    def translate(self, start):
+        """ Translate, compile and cache the block starting at start """
+        mem = self.cpu.mem
+        pages = self.cpu.pages
+        breakpoints = self.breakpoints
+        if start in breakpoints:
+            return self.trap
+        ops = []
+        addr = start
+        while len(ops) < MAX_BLOCK and addr < 0x10000:
+            if pages[addr >> 8] & IO or (ops and addr in breakpoints):
+                break
+            opc = mem[addr]
+            size = LENGTHS[opc]
+            if addr + size > 0x10000 or pages[(addr + size - 1) >> 8] & IO:
+                break
+            ops.append((addr, opc, mem[addr + 1:addr + size]))
+            addr += size
+            if _ends_block(opc):
+                break
+
+        if not ops:
+            # code in IO pages or running past the end of memory is
+            # interpreted; the entry is cached and dropped like a block
+            block = _interpret
+            addr = start + 1
+        else:
+            block = self.build(start, ops)
+
+        self.cache[start] = block
+        self.extent[start] = (start, addr)
+        for byte in range(start, addr):
+            self.marks[byte] += 1
+            self.owners.setdefault(byte, set()).add(start)
+        for page in range(start >> 8, ((addr - 1) >> 8) + 1):
+            pages[page] |= CODE
+        return block
+
+    def build(self, start, ops):
+        """ Compile the block made of ops """
+        source = _countdown(start, ops)
+        polls = source is None and _self_loop(start, ops)
+        if source is None:
+            source = emit(start, ops)
+        scope = {
+            "ADD_TABLE": ADD_TABLE, "SUB_TABLE": SUB_TABLE, "ANA_TABLE": ANA_TABLE,
+            "XRA_TABLE": XRA_TABLE, "ORA_TABLE": ORA_TABLE,
+            "INR_TABLE": INR_TABLE, "DCR_TABLE": DCR_TABLE,
+            "dispatch": dispatch, "translator": self,
+        }
+        exec(compile(source, "<block %04x>" % start, "exec"), scope)
+        block = scope["block_%04x" % start]
+        if polls:
+            cycles = sum(CYCLES[opc] for _, opc, _ in ops)
+            block = _polling(self, block, start, cycles, _sources(ops))
+        block.source = source
+        return block
+
+
+def _interpret(cpu):
+    cpu.ir = opc = cpu.fetch()
+    cpu.cycles += CYCLES[opc]
+    dispatch[opc](cpu, cpu.alu)
+
+def _ends_block(opc):
+    if opc in FALLBACK:
+        return True
+    if opc & 0xc0 == 0xc0:
+        # everything in the top quarter but the immediates, POP,
+        # SPHL and XCHG transfers control or stores
+        return not (opc & 0x07 == 0x06 or opc & 0xcf == 0xc1 or opc in (0xf9, 0xeb))
+    if opc & 0xf8 == 0x70 or opc in (0x34, 0x35, 0x36, 0x02, 0x12, 0x22, 0x32):
+        return True
+    return False
+
+def _self_loop(start, ops):
+    """ Whether the block is a loop branching back to start without stores """
+    _, opc, data = ops[-1]
+    if not (opc in (0xc3, 0xcb) or opc & 0xc7 == 0xc2):
+        return False
+    return data[0] | (data[1] << 8) == start
+
+def _polling(translator, block, start, cycles, sources):
+    """
+    Wrap the block of a self loop with fixed-point detection
+
+    An iteration that branches back and leaves registers, flags and SP
+    as it found them will repeat itself exactly, since the loop does not
+    store and memory can only change between runs. The wrapper then
+    charges every iteration left until the cycle budget is crossed,
+    unless a watchpoint stopped the machine.
+    Reads from IO pages may change from one iteration to the next, so
+    nothing is skipped while a page the loop reads from is mapped to IO;
+    sources names those pages, see _sources.
+
+    """
+    if sources is None:
+        return block
+    fixed, pairs = sources
+
+    def poll(cpu):
+        regs = cpu.regs
+        before = regs[:], cpu.flags, cpu.sp
+        block(cpu)
+        if cpu.halt or cpu.pc != start or (regs, cpu.flags, cpu.sp) != before:
+            return
+        left = translator.limit - cpu.cycles
+        if left <= 0 or left == float("inf"):
+            return
+        pages = cpu.pages
+        for page in fixed:
+            if pages[page] & IO:
+                return
+        for rp in pairs:
+            addr = cpu.sp if rp == SP else (regs[2 * rp] << 8) | regs[2 * rp + 1]
+            if (pages[addr >> 8] | pages[((addr + 1) & 0xffff) >> 8]) & IO:
+                return
+        cpu.cycles += int(-(-left // cycles)) * cycles
+    return poll
+
+def _sources(ops):
+    """
+    Pages a store-free block reads from, None if they are not known
+    before it runs
+
+    Returns the fixed pages, those of the code and of LDA/LHLD operands,
+    and the register pairs (SP for POP) addressing the other reads. A
+    pair changed by the block before it is read from gives None.
+
+    """
+    fixed = set()
+    pairs = set()
+    written = set()
+    for addr, opc, data in ops:
+        end = addr + LENGTHS[opc] - 1
+        fixed.update((addr >> 8, end >> 8))
+        if opc in (0x2a, 0x3a):                         # LHLD, LDA
+            imm_16 = data[0] | (data[1] << 8)
+            fixed.update((imm_16 >> 8, ((imm_16 + 1) & 0xffff) >> 8))
+        read = None
+        if opc & 0xc7 == 0x46 or opc & 0xc7 == 0x86:    # MOV r,M; ALU M
+            read = 2
+        elif opc in (0x0a, 0x1a):                       # LDAX
+            read = opc >> 4
+        elif opc & 0xcf == 0xc1:                        # POP
+            read = SP
+        if read is not None:
+            if read in written:
+                return None
+            pairs.add(read)
+        written |= _pairs_written(opc)
+    return tuple(fixed), tuple(pairs)
+
+def _pairs_written(opc):
+    """ Register pairs, SP as 3, the instruction may change """
+    if opc & 0xc0 == 0x40 or opc & 0xc7 in (0x04, 0x05, 0x06):
+        y = (opc >> 3) & 0x07                           # MOV, INR, DCR, MVI
+        return {y >> 1} if y < 6 else set()
+    if opc & 0xcf in (0x01, 0x03, 0x0b):                # LXI, INX, DCX
+        return {opc >> 4 & 3}
+    if opc & 0xcf == 0x09 or opc == 0x2a:               # DAD, LHLD
+        return {2}
+    if opc & 0xcf == 0xc1:                              # POP
+        return {SP} if opc == 0xf1 else {SP, opc >> 4 & 3}
+    if opc == 0xeb:                                     # XCHG
+        return {1, 2}
+    if opc == 0xf9:                                     # SPHL
+        return {SP}
+    return set()
+
+def _countdown(start, ops):
+    """
+    Source of a fast-forwarded delay loop, None if ops are not one
+
+    Delay loops are NOPs and one DCR r followed by JNZ to start, or
+    DCX rp; MOV A,hi; ORA lo; JNZ start with either half moved.
+
+    """
+    if not _self_loop(start, ops) or ops[-1][1] != 0xc2:
+        return None
+    body = [opc for _, opc, _ in ops[:-1] if opc != 0x00]
+    cycles = sum(CYCLES[opc] for _, opc, _ in ops)
+    exit_pc = ops[-1][0] + 3
+
+    if len(body) == 1 and body[0] & 0xc7 == 0x05 and body[0] >> 3 != M:
+        # DCR r counts 256 times from 0
+        reg = body[0] >> 3
+        lines = [
+            "n = regs[%d] or 0x100" % reg,
+            "v = (n - k) & 0xff",
+            "regs[%d] = v" % reg,
+            "cpu.flags = (DCR_TABLE[(v + 1) & 0xff] & 0xff) | (cpu.flags & 0x01)",
+        ]
+    elif len(body) == 3 and body[0] & 0xcf == 0x0b and body[0] >> 4 != SP:
+        # DCX rp counts 65536 times from 0
+        rp = body[0] >> 4
+        hi, lo = 2 * rp, 2 * rp + 1
+        if body[1:] == [0x78 | hi, 0xb0 | lo]:
+            moved, other = hi, lo
+        elif body[1:] == [0x78 | lo, 0xb0 | hi]:
+            moved, other = lo, hi
+        else:
+            return None
+        lines = [
+            "n = ((regs[%d] << 8) | regs[%d]) or 0x10000" % (hi, lo),
+            "v = (n - k) & 0xffff",
+            "regs[%d] = v >> 8; regs[%d] = v & 0xff" % (hi, lo),
+            "_t = ORA_TABLE[(regs[%d] << 8) | regs[%d]]" % (moved, other),
+            "regs[7] = _t >> 8",
+            "cpu.flags = _t & 0xff",
+        ]
+    else:
+        return None
+
+    # k iterations run: all n of them, or up to the one crossing the budget
+    lines[1:1] = [
+        "left = translator.limit - cpu.cycles",
+        "k = n if n * %d <= left else max(1, int(-(-left // %d)))" % (cycles, cycles),
+    ]
+    lines += [
+        "cpu.cycles += k * %d" % cycles,
+        "cpu.pc = 0x%04x if v else 0x%04x" % (start, exit_pc),
+    ]
+    return "def block_%04x(cpu):\n    regs = cpu.regs\n" % start + "".join(
+        "    %s\n" % line for line in lines
+    )
+
+def _reads_flags(opc):
+    """ Flags the instruction consumes before writing them """
+    if opc & 0xe8 == 0x88:                      # ADC, SBB
+        return CY
+    if opc in (0xce, 0xde, 0x17, 0x1f, 0x3f):   # ACI, SBI, RAL, RAR, CMC
+        return CY
+    if opc & 0xc7 in (0xc0, 0xc2, 0xc4):        # Rcc, Jcc, Ccc
+        return (Z, CY, P, S)[opc >> 4 & 3]
+    if opc == 0xf5 or opc in FALLBACK:          # PUSH PSW, DAA, ...
+        return ALL
+    return 0
+
+def _writes_flags(opc):
+    """ Flags the instruction replaces """
+    if 0x80 <= opc < 0xc0 or opc & 0xc7 == 0xc6 or opc == 0xf1:
+        return ALL
+    if opc & 0xc6 == 0x04:                      # INR, DCR
+        return ALL & ~CY
+    if opc & 0xcf == 0x09:                      # DAD
+        return CY
+    if opc in (0x07, 0x0f, 0x17, 0x1f, 0x37, 0x3f):
+        return CY                               # rotates, STC, CMC
+    return 0
+
+def _live_flags(ops):
+    """
+    For every instruction, the flags it produces that are consumed
+
+    Everything is live at the end of the block, where the flags become
+    visible again.
+
+    """
+    live = ALL
+    result = []
+    for _, opc, _ in reversed(ops):
+        writes = _writes_flags(opc)
+        result.append(live & writes)
+        live = (live & ~writes) | _reads_flags(opc)
+    result.reverse()
+    return result
+
+def emit(start, ops):
+    """ Emit the Python source of the block made of ops """
+    body = []
+    dirty = set()
+    cycles = 0
+    exit_pc = None
+    fallback = []
+
+    def hl():
+        return "((h << 8) | l)"
+
+    def pair(rp):
+        hi, lo = PAIRS[rp]
+        return "((%s << 8) | %s)" % (hi, lo)
+
+    def set_pair(rp, expr):
+        if rp == SP:
+            body.append("sp = %s" % expr)
+            dirty.add("sp")
+        else:
+            hi, lo = PAIRS[rp]
+            body.append("_t = %s" % expr)
+            body.append("%s = _t >> 8; %s = _t & 0xff" % (hi, lo))
+            dirty.update((hi, lo))
+
+    def assign(name, expr):
+        body.append("%s = %s" % (name, expr))
+        dirty.add(name)
+
+    def operand(src):
+        return "read(%s)" % hl() if src == M else NAMES[src]
+
+    def push(expr):
+        assign("sp", "(sp - 2) & 0xffff")
+        body.append("write_16(sp, %s)" % expr)
+
+    def pop():
+        body.append("_t = read_16(sp)")
+        assign("sp", "(sp + 2) & 0xffff")
+
+    for (addr, opc, data), live in zip(ops, _live_flags(ops)):
+        nxt = addr + LENGTHS[opc]
+        imm = data[0] if data else 0
+        imm_16 = data[0] | (data[1] << 8) if len(data) == 2 else 0
+        x, y, z = opc >> 6, (opc >> 3) & 0x07, opc & 0x07
+
+        cycles += CYCLES[opc]
+
+        if opc in FALLBACK:
+            # the handler fetches its own operands
+            fallback.append("cpu.pc = 0x%04x" % (addr + 1))
+            fallback.append("cpu.ir = 0x%02x" % opc)
+            fallback.append("dispatch[0x%02x](cpu, cpu.alu)" % opc)
+            break
+
+        if x == 1:                                      # MOV
+            if y == M:
+                body.append("write(%s, %s)" % (hl(), NAMES[z]))
+            else:
+                assign(NAMES[y], operand(z))
+        elif x == 2:                                    # ALU register
+            _accumulate(body, dirty, y, operand(z), live)
+        elif opc & 0xc7 == 0xc6:                        # ALU immediate
+            _accumulate(body, dirty, y, "0x%02x" % imm, live)
+        elif opc & 0xc7 == 0x06:                        # MVI
+            if y == M:
+                body.append("write(%s, 0x%02x)" % (hl(), imm))
+            else:
+                assign(NAMES[y], "0x%02x" % imm)
+        elif opc & 0xc6 == 0x04:                        # INR, DCR
+            table = "DCR_TABLE" if z & 1 else "INR_TABLE"
+            if y == M:
+                body.append("_a = %s" % hl())
+                body.append("_t = %s[read(_a)]" % table)
+                body.append("write(_a, _t >> 8)")
+            else:
+                body.append("_t = %s[%s]" % (table, NAMES[y]))
+                assign(NAMES[y], "_t >> 8")
+            if live:
+                assign("f", "(_t & 0xff) | (f & 0x01)")
+        elif opc & 0xcf == 0x01:                        # LXI
+            set_pair(opc >> 4 & 3, "0x%04x" % imm_16)
+        elif opc & 0xcf == 0x03:                        # INX
+            rp = opc >> 4 & 3
+            set_pair(rp, "(%s + 1) & 0xffff" % ("sp" if rp == SP else pair(rp)))
+        elif opc & 0xcf == 0x0b:                        # DCX
+            rp = opc >> 4 & 3
+            set_pair(rp, "(%s - 1) & 0xffff" % ("sp" if rp == SP else pair(rp)))
+        elif opc & 0xcf == 0x09:                        # DAD
+            rp = opc >> 4 & 3
+            body.append("_t = %s + %s" % (hl(), "sp" if rp == SP else pair(rp)))
+            if live:
+                assign("f", "(f & 0xfe) | (_t >> 16)")
+            assign("h", "(_t >> 8) & 0xff")
+            assign("l", "_t & 0xff")
+        elif opc in (0x02, 0x12):                       # STAX
+            body.append("write(%s, a)" % pair(opc >> 4))
+        elif opc in (0x0a, 0x1a):                       # LDAX
+            assign("a", "read(%s)" % pair(opc >> 4))
+        elif opc == 0x22:                               # SHLD
+            body.append("write_16(0x%04x, %s)" % (imm_16, hl()))
+        elif opc == 0x2a:                               # LHLD
+            body.append("_t = read_16(0x%04x)" % imm_16)
+            assign("h", "_t >> 8")
+            assign("l", "_t & 0xff")
+        elif opc == 0x32:                               # STA
+            body.append("write(0x%04x, a)" % imm_16)
+        elif opc == 0x3a:                               # LDA
+            assign("a", "read(0x%04x)" % imm_16)
+        elif opc == 0x07:                               # RLC
+            body.append("_t = a >> 7")
+            assign("a", "((a << 1) & 0xff) | _t")
+            if live:
+                assign("f", "(f & 0xfe) | _t")
+        elif opc == 0x0f:                               # RRC
+            body.append("_t = a & 0x01")
+            assign("a", "(a >> 1) | (_t << 7)")
+            if live:
+                assign("f", "(f & 0xfe) | _t")
+        elif opc == 0x17:                               # RAL
+            body.append("_t = (a << 1) | (f & 0x01)")
+            assign("a", "_t & 0xff")
+            if live:
+                assign("f", "(f & 0xfe) | (_t >> 8)")
+        elif opc == 0x1f:                               # RAR
+            body.append("_t = a & 0x01")
+            assign("a", "(a >> 1) | ((f & 0x01) << 7)")
+            if live:
+                assign("f", "(f & 0xfe) | _t")
+        elif opc == 0x2f:                               # CMA
+            assign("a", "a ^ 0xff")
+        elif opc == 0x37:                               # STC
+            if live:
+                assign("f", "f | 0x01")
+        elif opc == 0x3f:                               # CMC
+            if live:
+                assign("f", "f ^ 0x01")
+        elif opc == 0xeb:                               # XCHG
+            body.append("d, e, h, l = h, l, d, e")
+            dirty.update("dehl")
+        elif opc == 0xf9:                               # SPHL
+            assign("sp", hl())
+        elif opc & 0xcf == 0xc1:                        # POP
+            pop()
+            if opc == 0xf1:
+                assign("a", "_t >> 8")
+                assign("f", "(_t & 0xd7) | 0x02")
+            else:
+                hi, lo = PAIRS[opc >> 4 & 3]
+                assign(hi, "_t >> 8")
+                assign(lo, "_t & 0xff")
+        elif opc & 0xcf == 0xc5:                        # PUSH
+            push("(a << 8) | f" if opc == 0xf5 else pair(opc >> 4 & 3))
+        elif opc == 0xe3:                               # XTHL
+            body.append("_t = read_16(sp)")
+            body.append("write_16(sp, %s)" % hl())
+            assign("h", "_t >> 8")
+            assign("l", "_t & 0xff")
+        elif opc in (0xc3, 0xcb):                       # JMP
+            exit_pc = "0x%04x" % imm_16
+        elif opc & 0xc7 == 0xc2:                        # Jcc
+            exit_pc = "0x%04x if %s else 0x%04x" % (imm_16, _condition(y), nxt)
+        elif opc in (0xcd, 0xdd, 0xed, 0xfd):           # CALL
+            push("0x%04x" % nxt)
+            exit_pc = "0x%04x" % imm_16
+        elif opc & 0xc7 == 0xc4:                        # Ccc
+            body.append("if %s:" % _condition(y))
+            body.append("    cpu.cycles += %d" % TAKEN)
+            body.append("    sp = (sp - 2) & 0xffff")
+            body.append("    write_16(sp, 0x%04x)" % nxt)
+            body.append("    _pc = 0x%04x" % imm_16)
+            body.append("else:")
+            body.append("    _pc = 0x%04x" % nxt)
+            dirty.add("sp")
+            exit_pc = "_pc"
+        elif opc in (0xc9, 0xd9):                       # RET
+            pop()
+            exit_pc = "_t"
+        elif opc & 0xc7 == 0xc0:                        # Rcc
+            body.append("if %s:" % _condition(y))
+            body.append("    cpu.cycles += %d" % TAKEN)
+            body.append("    _pc = read_16(sp)")
+            body.append("    sp = (sp + 2) & 0xffff")
+            body.append("else:")
+            body.append("    _pc = 0x%04x" % nxt)
+            dirty.add("sp")
+            exit_pc = "_pc"
+        elif opc & 0xc7 == 0xc7:                        # RST
+            push("0x%04x" % nxt)
+            exit_pc = "0x%04x" % (opc & 0x38)
+        elif opc == 0xe9:                               # PCHL
+            exit_pc = hl()
+        # remaining opcodes are NOPs
+
+        if exit_pc is None and _ends_block(opc):
+            exit_pc = "0x%04x" % nxt
+    else:
+        if exit_pc is None:
+            exit_pc = "0x%04x" % nxt
+
+    sync = []
+    for idx, name in enumerate(NAMES):
+        if name in dirty:
+            sync.append("regs[%d] = %s" % (idx, name))
+    if "f" in dirty:
+        sync.append("cpu.flags = f")
+    if "sp" in dirty:
+        sync.append("cpu.sp = sp")
+
+    lines = [
+        "def block_%04x(cpu):" % start,
+        "    regs = cpu.regs",
+        "    b, c, d, e, h, l, _, a = regs",
+        "    f = cpu.flags",
+        "    sp = cpu.sp",
+        "    read = cpu.read",
+        "    write = cpu.write",
+        "    read_16 = cpu.read_16",
+        "    write_16 = cpu.write_16",
+        "    cpu.cycles += %d" % cycles,
+    ]
+    lines.extend("    " + line for line in body)
+    lines.extend("    " + line for line in sync)
+    if fallback:
+        lines.extend("    " + line for line in fallback)
+    else:
+        lines.append("    cpu.pc = %s" % exit_pc)
+    return "\n".join(lines) + "\n"
+
+def _accumulate(body, dirty, op, src, live):
+    """ ADD/ADC/SUB/SBB/ANA/XRA/ORA/CMP with src """
+    carry = op in (1, 3)
+    if op == 7:                                         # CMP
+        if live == CY:
+            body.append("f = (f & 0xfe) | (a < %s)" % src)
+            dirty.add("f")
+        elif live:
+            body.append("f = SUB_TABLE[(a << 8) | %s] & 0xff" % src)
+            dirty.add("f")
+        elif src.startswith("read("):
+            body.append(src)
+        return
+    if not live:
+        if carry:
+            body.append("a = (a %s %s %s (f & 0x01)) & 0xff" % (OPERATORS[op], src, OPERATORS[op]))
+        elif op < 4:
+            body.append("a = (a %s %s) & 0xff" % (OPERATORS[op], src))
+        else:
+            body.append("a = a %s %s" % (OPERATORS[op], src))
+        dirty.add("a")
+        return
+    if live == CY:
+        # only the carry is consumed: skip the table
+        if op >= 4:
+            body.append("a = a %s %s" % (OPERATORS[op], src))
+            body.append("f = f & 0xfe")
+        else:
+            body.append("_t = a %s %s%s" % (
+                OPERATORS[op], src, " %s (f & 0x01)" % OPERATORS[op] if carry else ""
+            ))
+            body.append("a = _t & 0xff")
+            body.append("f = (f & 0xfe) | ((_t >> 8) & 0x01)")
+        dirty.update("af")
+        return
+    index = "(a << 8) | %s" % src
+    if carry:
+        index = "((f & 0x01) << 16) | " + index
+    body.append("_t = %s[%s]" % (TABLES[op], index))
+    body.append("a = _t >> 8")
+    body.append("f = _t & 0xff")
+    dirty.update("af")
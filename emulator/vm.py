@@ -1,241 +1,109 @@
 from .cpu import *
+from .instructions import CYCLES, TAKEN, generic
+from .bus import Blocked
 
 class VM:
 
-    def __init__(self):
-        self.cpu = CPU()
+    def __init__(self, cpu=None):
+        # an existing CPU shares its machine state with the VM
+        self.cpu = CPU() if cpu is None else cpu
         
         self.optable = [self.NOP] * 256
 
         self.__init_optable()
     
-    def run(self):
-        while not self.cpu.halt:
-            
-            opc = self.cpu.fetch()
-
-            self.cpu.ir = opc
-            
-            ins = self.optable[opc]
-            
-            ins(self.cpu)
+    def run(self, max_cycles=None, profiler=None, tracer=None):
+        """ Execute until HLT or until the cycle counter reaches max_cycles """
+        if profiler is not None:
+            return profiler.run(self, max_cycles)
+        if tracer is not None:
+            return tracer.run(self, max_cycles)
+        cpu, optable, cycles, fetch = self.cpu, self.optable, CYCLES, self.cpu.fetch
+        if max_cycles is None:
+            while not cpu.halt:
+                cpu.ir = opc = fetch()
+                cpu.cycles += cycles[opc]
+                optable[opc](cpu)
+        else:
+            while not cpu.halt and cpu.cycles < max_cycles:
+                cpu.ir = opc = fetch()
+                cpu.cycles += cycles[opc]
+                optable[opc](cpu)
+
+    def run_for(self, cycles):
+        """ Execute for a budget of cycles, return the cycles spent """
+        start = self.cpu.cycles
+        self.run(start + cycles)
+        return self.cpu.cycles - start
+
+    def step(self):
+        """ Execute one instruction """
+        cpu = self.cpu
+        cpu.ir = opc = cpu.fetch()
+        cpu.cycles += CYCLES[opc]
+        self.optable[opc](cpu)
+
+    def step_n(self, n):
+        """ Execute up to n instructions, return how many ran """
+        cpu = self.cpu
+        optable, cycles, fetch = self.optable, CYCLES, cpu.fetch
+        for count in range(n):
+            if cpu.halt:
+                return count
+            cpu.ir = opc = fetch()
+            cpu.cycles += cycles[opc]
+            optable[opc](cpu)
+        return n
+
+    def run_until(self, pc=None, cycles=None, predicate=None):
+        """ See CPU.run_until """
+        cpu = self.cpu
+        optable, costs, fetch = self.optable, CYCLES, cpu.fetch
+        count = 0
+        if predicate is not None and cycles is None and pc is None:
+            while not cpu.halt and not predicate(cpu):
+                cpu.ir = opc = fetch()
+                cpu.cycles += costs[opc]
+                optable[opc](cpu)
+                count += 1
+        elif predicate is not None:
+            pc = -1 if pc is None else pc
+            limit = float("inf") if cycles is None else cycles
+            while not cpu.halt and cpu.pc != pc and cpu.cycles < limit and not predicate(cpu):
+                cpu.ir = opc = fetch()
+                cpu.cycles += costs[opc]
+                optable[opc](cpu)
+                count += 1
+        elif cycles is None and pc is None:
+            while not cpu.halt:
+                cpu.ir = opc = fetch()
+                cpu.cycles += costs[opc]
+                optable[opc](cpu)
+                count += 1
+        elif cycles is None:
+            while not cpu.halt and cpu.pc != pc:
+                cpu.ir = opc = fetch()
+                cpu.cycles += costs[opc]
+                optable[opc](cpu)
+                count += 1
+        elif pc is None:
+            while not cpu.halt and cpu.cycles < cycles:
+                cpu.ir = opc = fetch()
+                cpu.cycles += costs[opc]
+                optable[opc](cpu)
+                count += 1
+        else:
+            while not cpu.halt and cpu.pc != pc and cpu.cycles < cycles:
+                cpu.ir = opc = fetch()
+                cpu.cycles += costs[opc]
+                optable[opc](cpu)
+                count += 1
+        return count
     
     def __init_optable(self):
-        self.optable[0x00] = self.NOP
-        self.optable[0x01] = self.LXI
-        self.optable[0x02] = self.STAX
-        self.optable[0x03] = self.INX
-        self.optable[0x04] = self.INR
-        self.optable[0x05] = self.DCR
-        self.optable[0x06] = self.MVI
-        self.optable[0x07] = self.RLC
-        
-        self.optable[0x09] = self.DAD
-        self.optable[0x0a] = self.LDAX
-        self.optable[0x0b] = self.DCX
-        self.optable[0x0c] = self.INR
-        self.optable[0x0d] = self.DCR
-        self.optable[0x0e] = self.MVI
-        self.optable[0x0f] = self.RRC
-
-        self.optable[0x11] = self.LXI
-        self.optable[0x12] = self.STAX
-        self.optable[0x13] = self.INX
-        self.optable[0x14] = self.INR
-        self.optable[0x15] = self.DCR
-        self.optable[0x16] = self.MVI
-        self.optable[0x17] = self.RAL
-        
-        self.optable[0x19] = self.DAD
-        self.optable[0x1a] = self.LDAX
-        self.optable[0x1b] = self.DCX
-        self.optable[0x1c] = self.INR
-        self.optable[0x1d] = self.DCR
-        self.optable[0x1e] = self.MVI
-        self.optable[0x1f] = self.RAR
-
-        self.optable[0x21] = self.LXI
-        self.optable[0x22] = self.SHLD
-        self.optable[0x23] = self.INX
-        self.optable[0x24] = self.INR
-        self.optable[0x25] = self.DCR
-        self.optable[0x26] = self.MVI
-        self.optable[0x27] = self.DAA
-
-        self.optable[0x29] = self.DAD
-        self.optable[0x2a] = self.LHLD
-        self.optable[0x2b] = self.DCX
-        self.optable[0x2c] = self.INR
-        self.optable[0x2d] = self.DCR
-        self.optable[0x2e] = self.MVI
-        self.optable[0x2f] = self.CMA
-
-        self.optable[0x31] = self.LXI
-        self.optable[0x32] = self.STA
-        self.optable[0x33] = self.INX
-        self.optable[0x34] = self.INR
-        self.optable[0x35] = self.DCR
-        self.optable[0x36] = self.MVI
-        self.optable[0x37] = self.STC
-
-        self.optable[0x39] = self.DAD
-        self.optable[0x3a] = self.LDA
-        self.optable[0x3b] = self.DCX
-        self.optable[0x3c] = self.INR
-        self.optable[0x3d] = self.DCR
-        self.optable[0x3e] = self.MVI
-        self.optable[0x3f] = self.CMC
-        self.optable[0x40] = self.MOV
-        self.optable[0x41] = self.MOV
-        self.optable[0x42] = self.MOV
-        self.optable[0x43] = self.MOV
-        self.optable[0x44] = self.MOV
-        self.optable[0x45] = self.MOV
-        self.optable[0x46] = self.MOV
-        self.optable[0x47] = self.MOV
-        self.optable[0x48] = self.MOV
-        self.optable[0x49] = self.MOV
-        self.optable[0x4a] = self.MOV
-
-        self.optable[0x50] = self.MOV
-        self.optable[0x51] = self.MOV
-        self.optable[0x52] = self.MOV
-        self.optable[0x53] = self.MOV
-        self.optable[0x54] = self.MOV
-        self.optable[0x55] = self.MOV
-        self.optable[0x56] = self.MOV
-        self.optable[0x57] = self.MOV
-
-        self.optable[0x58] = self.MOV
-        self.optable[0x59] = self.MOV
-        self.optable[0x5a] = self.MOV
-        self.optable[0x5b] = self.MOV
-        self.optable[0x5c] = self.MOV
-        self.optable[0x5d] = self.MOV
-        self.optable[0x5e] = self.MOV
-        self.optable[0x5f] = self.MOV
-
-        self.optable[0x60] = self.MOV
-        self.optable[0x61] = self.MOV
-        self.optable[0x62] = self.MOV
-        self.optable[0x63] = self.MOV
-        self.optable[0x64] = self.MOV
-        self.optable[0x65] = self.MOV
-        self.optable[0x66] = self.MOV
-        self.optable[0x67] = self.MOV
-
-        self.optable[0x68] = self.MOV
-        self.optable[0x69] = self.MOV
-        self.optable[0x6a] = self.MOV
-        self.optable[0x6b] = self.MOV
-        self.optable[0x6c] = self.MOV
-        self.optable[0x6d] = self.MOV
-        self.optable[0x6e] = self.MOV
-        self.optable[0x6f] = self.MOV
-
-        self.optable[0x70] = self.MOV
-        self.optable[0x71] = self.MOV
-        self.optable[0x72] = self.MOV
-        self.optable[0x73] = self.MOV
-        self.optable[0x74] = self.MOV
-        self.optable[0x75] = self.MOV
-        self.optable[0x76] = self.HLT
-        self.optable[0x77] = self.MOV
-
-        self.optable[0x78] = self.MOV
-        self.optable[0x79] = self.MOV
-        self.optable[0x7a] = self.MOV
-        self.optable[0x7b] = self.MOV
-        self.optable[0x7c] = self.MOV
-        self.optable[0x7d] = self.MOV
-        self.optable[0x7e] = self.MOV
-        self.optable[0x7f] = self.MOV
-
-        self.optable[0x80] = self.ADD
-        self.optable[0x81] = self.ADD
-        self.optable[0x82] = self.ADD
-        self.optable[0x83] = self.ADD
-        self.optable[0x84] = self.ADD
-        self.optable[0x85] = self.ADD
-        self.optable[0x86] = self.ADD
-        self.optable[0x87] = self.ADD
-
-        self.optable[0x88] = self.ADC
-        self.optable[0x89] = self.ADC
-        self.optable[0x8a] = self.ADC
-        self.optable[0x8b] = self.ADC
-        self.optable[0x8c] = self.ADC
-        self.optable[0x8d] = self.ADC
-        self.optable[0x8e] = self.ADC
-        self.optable[0x8f] = self.ADC
-
-        self.optable[0x90] = self.SUB
-        self.optable[0x91] = self.SUB
-        self.optable[0x92] = self.SUB
-        self.optable[0x93] = self.SUB
-        self.optable[0x94] = self.SUB
-        self.optable[0x95] = self.SUB
-        self.optable[0x96] = self.SUB
-        self.optable[0x97] = self.SUB
-
-        self.optable[0x98] = self.SBB
-        self.optable[0x99] = self.SBB
-        self.optable[0x9a] = self.SBB
-        self.optable[0x9b] = self.SBB
-        self.optable[0x9c] = self.SBB
-        self.optable[0x9d] = self.SBB
-        self.optable[0x9e] = self.SBB
-        self.optable[0x9f] = self.SBB
-
-        self.optable[0xa0] = self.ANA
-        self.optable[0xa1] = self.ANA
-        self.optable[0xa2] = self.ANA
-        self.optable[0xa3] = self.ANA
-        self.optable[0xa4] = self.ANA
-        self.optable[0xa5] = self.ANA
-        self.optable[0xa6] = self.ANA
-        self.optable[0xa7] = self.ANA
-
-        self.optable[0xa8] = self.XRA
-        self.optable[0xa9] = self.XRA
-        self.optable[0xaa] = self.XRA
-        self.optable[0xab] = self.XRA
-        self.optable[0xac] = self.XRA
-        self.optable[0xad] = self.XRA
-        self.optable[0xae] = self.XRA
-        self.optable[0xaf] = self.XRA
-
-        self.optable[0xb0] = self.ORA
-        self.optable[0xb1] = self.ORA
-        self.optable[0xb2] = self.ORA
-        self.optable[0xb3] = self.ORA
-        self.optable[0xb4] = self.ORA
-        self.optable[0xb5] = self.ORA
-        self.optable[0xb6] = self.ORA
-        self.optable[0xb7] = self.ORA
-
-        self.optable[0xb8] = self.CMP
-        self.optable[0xb9] = self.CMP
-        self.optable[0xba] = self.CMP
-        self.optable[0xbb] = self.CMP
-        self.optable[0xbc] = self.CMP
-        self.optable[0xbd] = self.CMP
-        self.optable[0xbe] = self.CMP
-        self.optable[0xbf] = self.CMP
-
-        self.optable[0xc1] = self.RCC
-        self.optable[0xc2] = self.POP
-        self.optable[0xc3] = self.JMP
-        self.optable[0xc4] = self.CCC
-        self.optable[0xc5] = self.PUSH
-        self.optable[0xc6] = self.ADI
-        self.optable[0xc7] = self.RST
-        self.optable[0xc8] = self.RCC
-        
-        self.optable[0xc9] = self.RET
-        self.optable[0xca] = self.JCC
-        self.optable[0xcb] = self.JMP
-        self.optable[0xcc] = self.CCC
+        # same layout as the generic table, served by the bound methods
+        for opc, ins in enumerate(generic):
+            self.optable[opc] = getattr(self, ins.__name__)
 
 
     def MOV(self, cpu):
@@ -308,7 +176,7 @@ class VM:
         accumulator. The result is placed in the accumulator.
 
         """
-        cpu.A, cpu.flags = cpu.alu.ADD(cpu.A, cpu.src, 0)
+        cpu.A, cpu.flags = cpu.alu.add(cpu.A, cpu.src)
     
     def ADI(self, cpu):
         """ 
@@ -321,7 +189,7 @@ class VM:
         is placed in the accumulator. 
 
         """
-        cpu.A, cpu.flags = cpu.alu.ADD(cpu.A, cpu.fetch(), 0)
+        cpu.A, cpu.flags = cpu.alu.add(cpu.A, cpu.fetch())
     
     def ADC(self, cpu):
         """
@@ -334,7 +202,7 @@ class VM:
         result is placed in the accumulator. 
 
         """
-        cpu.A, cpu.flags = cpu.alu.ADC(cpu.A, cpu.src, cpu.CY)
+        cpu.A, cpu.flags = cpu.alu.adc(cpu.A, cpu.src, cpu.CY)
     
     def ACI(self, cpu):
         """ 
@@ -348,7 +216,7 @@ class VM:
         accumulator. 
         
         """
-        cpu.A, cpu.flags = cpu.alu.ADC(cpu.A, cpu.fetch(), cpu.CY)
+        cpu.A, cpu.flags = cpu.alu.adc(cpu.A, cpu.fetch(), cpu.CY)
 
     def SUB(self, cpu):
         """ 
@@ -361,7 +229,7 @@ class VM:
         accumulator. 
         
         """
-        cpu.A, cpu.flags = cpu.alu.SUB(cpu.A, cpu.src, 0)
+        cpu.A, cpu.flags = cpu.alu.sub(cpu.A, cpu.src)
     
     def SUI(self, cpu):
         """ 
@@ -374,7 +242,7 @@ class VM:
         result is placed in the accumulator. 
         
         """
-        cpu.A, cpu.flags = cpu.alu.SUB(cpu.A, cpu.fetch(), 0)
+        cpu.A, cpu.flags = cpu.alu.sub(cpu.A, cpu.fetch())
 
     def SBB(self, cpu):
         """ Subtract register with borrow """
@@ -394,7 +262,7 @@ class VM:
         Note: All condition flags except CY are affected.
         
         """
-        cpu.dst, cpu.flags = cpu.alu.INR(cpu.dst, 0)
+        cpu.dst, cpu.flags = cpu.alu.INR(cpu.dst, cpu.flags)
     
     def DCR(self, cpu):
         """ 
@@ -406,9 +274,9 @@ class VM:
         Note: All condition flags except CY are affected. 
         
         """
-        cpu.dst, cpu.flags = cpu.alu.DCR(0, cpu.dst, cpu.flags)
+        cpu.dst, cpu.flags = cpu.alu.DCR(cpu.dst, cpu.flags)
     
-    def INX(self, cpu, tmp_16):
+    def INX(self, cpu):
         """ 
         Increment register pair 
 
@@ -418,78 +286,72 @@ class VM:
         one. Note: No condition ftags are affected.  
         
         """
-        cpu.rl, flags = cpu.alu.ADD(cpu.rl, 1, 0)
-        cpu.rh, _     = cpu.alu.ADC(cpu.rh, 0, flags & CY)
+        cpu.rp = (cpu.rp + 1) & 0xffff
     
     def DCX(self, cpu):
         """ Decrement register pair """
-        tmp_lo, tmp_hi  = cpu.rp % 256, cpu.rp // 256
-
-        acc_lo, flags   = cpu.alu.SUB(tmp_lo, 1, cpu.flags)
-        acc_hi, flags   = cpu.alu.SBB(tmp_hi, 0, flags)
-        
-        cpu.__set_RP(256 * acc_hi + acc_lo)
+        cpu.rp = (cpu.rp - 1) & 0xffff
     
-    def DAD(self, cpu, tmp_16):
-        cpu.L, flags = cpu.alu.ADD(cpu.L, cpu.rl, 0)
-        cpu.H, flags = cpu.alu.ADC(cpu.H, cpu.rh, flags)
-
-        cpu.flags = (flags & CY) | (cpu.flags & ~CY)
+    def DAD(self, cpu):
+        """ Add register pair to H and L """
+        data = cpu.HL + cpu.rp
+        cpu.HL = data & 0xffff
+        cpu.flags = (cpu.flags & ~CY) | (data >> 16)
     
     def DAA(self, cpu):
         """ Decimal adjust accumulator """
         pass
     
     def ANA(self, cpu):
-        cpu.A, cpu.flags = cpu.alu.ANA(cpu.A, cpu.src, 0)
+        cpu.A, cpu.flags = cpu.alu.ana(cpu.A, cpu.src)
     
     def ANI(self, cpu):
         """ And immediate """
-        cpu.A, cpu.flags = cpu.alu.ANA(cpu.A, cpu.fetch(), 0)
+        cpu.A, cpu.flags = cpu.alu.ana(cpu.A, cpu.fetch())
     
     def XRA(self, cpu):
         """ Exclusive OR register """
-        cpu.A, cpu.flags = cpu.alu.XRA(cpu.A, cpu.src, 0)
+        cpu.A, cpu.flags = cpu.alu.xra(cpu.A, cpu.src)
 
     def XRI(self, cpu):
         """ Exclusive OR immediate """
-        cpu.A, cpu.flags = cpu.alu.XRA(cpu.A, cpu.fetch(), 0)
+        cpu.A, cpu.flags = cpu.alu.xra(cpu.A, cpu.fetch())
     
     def ORA(self, cpu):
         """ OR register """
-        cpu.A, cpu.flags = cpu.alu.ORA(cpu.A, cpu.src, 0)
+        cpu.A, cpu.flags = cpu.alu.ORA(cpu.A, cpu.src)
     
     def ORI(self, cpu):
         """ OR immediate """
-        cpu.A, cpu.flags = cpu.alu.ORA(cpu.A, cpu.fetch(), 0)
+        cpu.A, cpu.flags = cpu.alu.ORA(cpu.A, cpu.fetch())
     
     def CMP(self, cpu):
         """ Compare register """
-        _, cpu.flags = cpu.alu.SUB(cpu.A, cpu.src, 0)
+        _, cpu.flags = cpu.alu.CMP(cpu.A, cpu.src)
     
     def CPI(self, cpu):
         """ Compare immediate """
-        _, cpu.flags = cpu.alu.SUB(cpu.A, cpu.fetch(), 0)
+        _, cpu.flags = cpu.alu.CMP(cpu.A, cpu.fetch())
     
     def RLC(self, cpu):
         """ Rotate left """
-        cpu.A, cpu.flags = cpu.alu.RRC(cpu.A, 0, cpu.CY)
+        cpu.A, cpu.flags = cpu.alu.RLC(cpu.A, 0, cpu.flags)
     
     def RRC(self, cpu):
         """ Rotate right """
-        cpu.A, cpu.flags = cpu.alu.RRC(cpu.A, 0, cpu.CY)
+        cpu.A, cpu.flags = cpu.alu.RRC(cpu.A, 0, cpu.flags)
     
     def RAL(self, cpu):
         """ Rotate left through carry """
-        cpu.A, cpu.flags = cpu.alu.RAL(cpu.A, 0, cpu.CY)
+        cpu.A, cpu.flags = cpu.alu.RAL(cpu.A, 0, cpu.flags)
     
     def RAR(self, cpu):
         """ Rotate right through carry """
-        cpu.A, cpu.flags = cpu.alu.RAR(cpu.A, 0, cpu.CY)
+        cpu.A, cpu.flags = cpu.alu.RAR(cpu.A, 0, cpu.flags)
     
     def CMA(self, cpu):
         """ Complement accumulator """
-        cpu.A = 255 - cpu.A
+        cpu.A = cpu.A ^ 0xff
     
     def CMC(self, cpu):
         """ Complement carry """
@@ -505,18 +367,23 @@ class VM:
 
     def CALL(self, cpu):
         """ Unconditional call """
+        addr = cpu.fetch_16()
         cpu.push_16(cpu.pc)
-        cpu.pc = cpu.fetch_16()
+        cpu.pc = addr
     
     def JCC(self, cpu):
         """ Conditional jump """
+        addr = cpu.fetch_16()
         if cpu.cond():
-            cpu.JMP()
+            cpu.pc = addr
     
     def CCC(self, cpu):
         """ Condition call """
+        addr = cpu.fetch_16()
         if cpu.cond():
-            cpu.CALL()
+            cpu.cycles += TAKEN
+            cpu.push_16(cpu.pc)
+            cpu.pc = addr
     
     def RET(self, cpu):
         """ Return """
@@ -525,12 +392,13 @@ class VM:
     def RCC(self, cpu):
         """ Conditional return """
         if cpu.cond():
-            self.RET()
+            cpu.cycles += TAKEN
+            self.RET(cpu)
     
     def RST(self, cpu):
         """ Restart """
         cpu.push_16(cpu.pc)
-        cpu.pc = 8 * cpu.__NNN()
+        cpu.pc = cpu.ir & 0x38
     
     def PCHL(self, cpu):
         """ Jump H and L indirect """
@@ -560,6 +428,7 @@ class VM:
 
     def POP(self, cpu):
         """ Pop """
+        data_16 = cpu.pop_16()
         if cpu.ir == 0xf1:          # POP PSW
             cpu.PSW = data_16
         else:
@@ -577,26 +446,31 @@ class VM:
     
     def IN(self, cpu):
         """ Input """
-        pass
+        port = cpu.fetch()
+        try:
+            cpu.A = cpu.bus.read(port)
+        except Blocked:
+            cpu.pc = (cpu.pc - 2) & 0xffff
+            cpu.cycles -= CYCLES[0xdb]
+            raise
     
     def OUT(self, cpu):
         """ Output """
-        pass
+        cpu.bus.write(cpu.fetch(), cpu.A)
     
     def EI(self, cpu):
-        """ Enable interrupts """
-        pass
+        """ Enable interrupts, from after the next instruction on """
+        cpu.ints = 1
+        cpu.ei = cpu.cycles
     
     def DI(self, cpu):
         """ Disable interrupts """
-        pass
+        cpu.ints = 0
     
     def HLT(self, cpu):
         """ Halt """
-        print("halt")
         cpu.halt = True
     
     def NOP(self, cpu):
         """ No op """
-        print("nop")
         pass
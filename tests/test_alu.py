@@ -0,0 +1,34 @@
+from emulator.alu import ALU
+from emulator.flags import S, Z, AC, P, CY
+
+def test_add():
+    alu = ALU()
+    assert alu.add(0x2e, 0x74) == (0xa2, S | AC | 0x02)
+    assert alu.add(0x80, 0x80) == (0x00, Z | P | CY | 0x02)
+    assert alu.adc(0xff, 0x00, 1) == (0x00, Z | P | AC | CY | 0x02)
+
+def test_sub():
+    alu = ALU()
+    assert alu.sub(0x3e, 0x3e) == (0x00, Z | P | AC | 0x02)
+    assert alu.sub(0x00, 0x01) == (0xff, S | P | CY | 0x02)
+    assert alu.SBB(0x04, 0x02, 1) == (0x01, AC | 0x02)
+    assert alu.CMP(0x0a, 0x05) == (0x0a, P | AC | 0x02)
+
+def test_INR_DCR_preserve_carry():
+    alu = ALU()
+    assert alu.INR(0xff, CY) == (0x00, Z | P | AC | CY | 0x02)
+    assert alu.DCR(0x01, 0x02) == (0x00, Z | P | AC | 0x02)
+    assert alu.DCR(0x00, CY) == (0xff, S | P | CY | 0x02)
+
+def test_logic():
+    alu = ALU()
+    assert alu.ana(0xfc, 0x0f) == (0x0c, P | 0x02)
+    assert alu.xra(0x5c, 0x5c) == (0x00, Z | P | 0x02)
+    assert alu.ORA(0x33, 0x0f) == (0x3f, P | 0x02)
+
+def test_rotate():
+    alu = ALU()
+    assert alu.RLC(0xf2) == (0xe5, CY | 0x02)
+    assert alu.RRC(0xf2) == (0x79, 0x02)
+    assert alu.RAL(0xb5, 0, 0x02) == (0x6a, CY | 0x02)
+    assert alu.RAR(0x6a, 0, CY | 0x02) == (0xb5, 0x02)
@@ -0,0 +1,89 @@
+import pytest
+
+from emulator import CPU
+from emulator.asm import AssemblyError, assemble
+from emulator.assembler import *
+from benchmarks.workloads import recursion
+
+
+FIB = """
+; fib(N) into HL
+N       EQU     18
+
+        ORG     0
+        LXI     SP, 0F000H
+        LXI     H, 0
+        MVI     A, N
+        CALL    fib
+        HLT
+
+fib:    CPI     2               ; HL += fib(A)
+        JC      leaf
+        PUSH    PSW
+        DCR     A
+        CALL    fib
+        POP     PSW
+        SUI     2
+        CALL    fib
+        RET
+leaf:   MOV     E, A
+        MVI     D, 0
+        DAD     D
+        RET
+"""
+
+def test_matches_hand_assembly():
+    program = assemble(FIB)
+    assert program.start == 0
+    assert program.image == bytes(recursion())
+    assert program.symbols == {"N": 18, "fib": 0x0c, "leaf": 0x1d}
+
+    cpu = CPU()
+    cpu.load(program.image, program.start)
+    cpu.run()
+    assert cpu.HL == 2584
+
+def test_directives_and_expressions():
+    program = assemble("""
+        ORG     $100
+start:  JMP     (end - start) * 2 + $ & 0xffff
+table:  DB      1, -1, 'AB', "c;d", 101B, LOW
+        DW      table, start >> 4, ~0
+        DS      3
+end:    MVI     M, end - table
+LOW     EQU     'x' | 20h
+    """)
+    assert program.start == 0x100
+    assert program.symbols["table"] == 0x103
+    assert program.symbols["end"] == 0x103 + 9 + 6 + 3
+    assert program.image == bytes([
+        JMP,    0x2a,   0x01,
+        1, 0xff, 0x41, 0x42, 0x63, 0x3b, 0x64, 0x05, 0x78,
+        0x03, 0x01, 0x10, 0x00, 0xff, 0xff,
+        0, 0, 0,
+        MVI_M,  18
+    ])
+
+def test_cache():
+    first, second = assemble(FIB), assemble(FIB)
+    assert first.image is second.image
+    assert assemble(FIB, 0x100).image is not first.image
+
+    # symbols are per caller
+    first.symbols["fib"] = 0xffff
+    assert second.symbols["fib"] != 0xffff
+    assert assemble(FIB).symbols == second.symbols
+
+@pytest.mark.parametrize("source", [
+    "FOO A",
+    "MOV A",
+    "MOV M, M",
+    "JMP nowhere",
+    "MVI A, 256",
+    "x: NOP\nx: NOP",
+    "LDAX H",
+    "DB 'abc",
+])
+def test_errors(source):
+    with pytest.raises(AssemblyError):
+        assemble(source)
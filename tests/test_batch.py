@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from emulator import CPU
+from emulator.assembler import *
+from emulator.batch import Batch
+
+
+def random_cpu(rnd):
+    cpu = CPU()
+    cpu.mem[:] = bytes(rnd.randrange(256) for _ in range(1 << 16))
+    # keep pc from running off the end of memory
+    cpu.mem[0xfff0:] = bytes([HLT]) * 16
+    cpu.regs = [rnd.randrange(256) for _ in range(8)]
+    cpu.flags = (rnd.randrange(256) & 0xd7) | 0x02
+    cpu.sp = rnd.randrange(1 << 16)
+    cpu.pc = rnd.randrange(0xff00)
+    return cpu
+
+def test_matches_scalar_cpu():
+    rnd = random.Random(8080)
+    cpus = [random_cpu(rnd) for _ in range(32)]
+    batch = Batch(len(cpus))
+    for k, cpu in enumerate(cpus):
+        batch.set_lane(k, cpu)
+
+    batch.run(2000)
+    for k, cpu in enumerate(cpus):
+        cpu.run(2000)
+        assert batch.lane(k).snapshot() == cpu.snapshot(), k
+
+def test_lockstep_loop():
+    batch = Batch(4)
+    batch.load([
+        LDA,    0x00,   0x01,
+        MOV_B_A,
+        XRA_A,
+        ADD_B,                  # 0x05
+        DCR_B,
+        JNZ,    0x05,   0x00,
+        STA,    0x01,   0x01,
+        HLT
+    ])
+    batch.mem[:, 0x0100] = [1, 5, 10, 22]
+    assert batch.run() == 4 * 5 + 3 * (1 + 5 + 10 + 22)
+    assert batch.halt.all()
+    assert list(batch.mem[:, 0x0101]) == [1, 15, 55, 253]
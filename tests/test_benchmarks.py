@@ -0,0 +1,25 @@
+from benchmarks import runner
+from benchmarks.workloads import WORKLOADS, recursion
+from emulator import CPU
+
+
+def test_workloads_halt():
+    for name, workload in WORKLOADS.items():
+        cpu = CPU()
+        cpu.load(workload())
+        cpu.run(10 ** 7)
+        assert cpu.halt, name
+
+def test_recursion_result():
+    cpu = CPU()
+    cpu.load(recursion())
+    cpu.run()
+    assert cpu.HL == 2584           # fib(18)
+
+def test_compare():
+    baseline = {"arithmetic": {"cpu": {"ips": 2e6}, "vm": {"ips": 1e6}}}
+    results = runner.run(["arithmetic"], ["cpu", "vm"], repeat=1)
+    results["arithmetic"]["cpu"]["ips"] = 1.5e6
+    results["arithmetic"]["vm"]["ips"] = 0.95e6
+    regressions = runner.compare(results, baseline, threshold=0.10)
+    assert [r[:2] for r in regressions] == [("arithmetic", "cpu")]
@@ -0,0 +1,81 @@
+import asyncio
+
+from emulator import CPU, VM, Translator
+from emulator.assembler import *
+from emulator.bus import Device, Stream, run
+
+
+# copy the data port to itself until a zero byte arrives
+ECHO = [
+    IN,     0x00,           # 0x00
+    CPI,    0x00,
+    JZ,     0x0b,   0x00,
+    OUT,    0x00,
+    JMP,    0x00,   0x00,
+    HLT                     # 0x0b
+]
+
+class Sink:
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+def test_port_latch():
+    cpu = CPU()
+    cpu.load([
+        MVI_A,  0x42,
+        OUT,    0x10,
+        MVI_A,  0x00,
+        IN,     0x10,
+        HLT
+    ])
+    cpu.run()
+    assert cpu.A == 0x42
+    assert cpu.ports[0x10] == 0x42
+
+def test_device():
+
+    class Counter(Device):
+
+        def __init__(self):
+            self.count = 0
+
+        def read(self, port):
+            self.count += 1
+            return self.count
+
+    cpu = CPU()
+    cpu.bus.attach(Counter(), 0x01, 0x02)
+    cpu.load([
+        IN,     0x01,
+        MOV_B_A,
+        IN,     0x02,
+        HLT
+    ])
+    cpu.run()
+    assert (cpu.B, cpu.A) == (1, 2)
+
+def test_stream():
+
+    async def echo(machine):
+        cpu = getattr(machine, "cpu", machine)
+        cpu.load(ECHO)
+        reader = asyncio.StreamReader()
+        sink = Sink()
+        cpu.bus.attach(Stream(reader, sink), 0x00, 0x01)
+
+        async def host():
+            for chunk in (b"ab", b"c", b"de\x00"):
+                await asyncio.sleep(0.01)
+                reader.feed_data(chunk)
+
+        await asyncio.gather(run(machine, slice_cycles=100), host())
+        return cpu, sink.data
+
+    for machine in (CPU(), VM(), Translator(CPU())):
+        cpu, data = asyncio.run(echo(machine))
+        assert cpu.halt
+        assert data == b"abcde"
@@ -1,7 +1,13 @@
+import random
 import unittest
 
-from emulator import CPU
+import pytest
+
+from emulator import CPU, VM
+from emulator.cpu import BACKENDS
+from emulator.memory import ROM, IO
 from emulator.assembler import *
+from emulator.instructions import dispatch, generic
 
 def test_cpu():
     cpu = CPU()
@@ -93,3 +99,228 @@ def test_JZ():
     assert(
         cpu.A, cpu.B, cpu.Z
     ) == (0x00, 0xff, 1)
+
+def compare_handlers(*tables):
+    """ Run every opcode from random states through each table """
+    rnd = random.Random(8080)
+    mem = [rnd.randrange(256) for _ in range(1 << 16)]
+
+    for opc in range(256):
+        if opc == HLT:
+            continue
+        for _ in range(4):
+            regs = [rnd.randrange(256) for _ in range(8)]
+            flags = (rnd.randrange(256) & 0xd7) | 0x02
+            state = []
+            for table in tables:
+                cpu = CPU()
+                cpu.mem, cpu.regs, cpu.flags = bytearray(mem), list(regs), flags
+                cpu.sp, cpu.pc, cpu.ir = 0x8000, 0x0101, opc
+                table[opc](cpu, cpu.alu)
+                state.append((cpu.regs, cpu.flags, cpu.pc, cpu.sp, cpu.mem, cpu.cycles))
+            assert state[0] == state[1], dispatch[opc].__name__
+
+def test_specialized_dispatch_matches_generic():
+    compare_handlers(dispatch, generic)
+
+def test_vm_matches_generic():
+    # the VM table follows the generic layout, opcode for opcode
+    vm = VM()
+    compare_handlers(generic, [lambda cpu, alu, ins=ins: ins(cpu) for ins in vm.optable])
+    assert [ins.__name__ for ins in vm.optable] == [ins.__name__ for ins in generic]
+
+def test_specialized_handler_names():
+    assert dispatch[MOV_B_C].__name__ == "MOV_B_C"
+    assert dispatch[JZ].__name__ == "JZ"
+    assert dispatch[INX_SP].__name__ == "INX_SP"
+
+def test_rom_pages_ignore_writes():
+    cpu = CPU()
+    cpu.load([
+        MVI_A,  0x42,
+        STA,    0x00,   0x10,
+        STA,    0x00,   0x20,
+        HLT
+    ])
+    cpu.map(0x1000, 0x100, ROM)
+    cpu.run()
+    assert (cpu.mem[0x1000], cpu.mem[0x2000]) == (0x00, 0x42)
+
+def test_io_pages():
+    log = []
+    cpu = CPU()
+    cpu.map(0xff00, 0x100, IO, read=lambda addr: addr & 0xff, write=lambda addr, data: log.append((addr, data)))
+    cpu.load([
+        LDA,    0x34,   0xff,
+        STA,    0x00,   0xff,
+        HLT
+    ])
+    cpu.run()
+    assert cpu.A == 0x34
+    assert log == [(0xff00, 0x34)]
+    assert cpu.mem[0xff00] == 0x00
+
+def test_map_requires_page_alignment():
+    with pytest.raises(ValueError):
+        CPU().map(0x1010, 0x100, ROM)
+
+def test_load_at_address(tmp_path):
+    rom = bytes([MVI_B, 0x07, HLT])
+    path = tmp_path / "rom.bin"
+    path.write_bytes(rom)
+
+    cpu = CPU()
+    cpu.load(path, 0x0100)
+    with open(path, "rb") as f:
+        cpu.load(f, 0x0200)
+    cpu.load(rom, 0x0300)
+    assert cpu.mem[0x0100:0x0103] == cpu.mem[0x0200:0x0203] == cpu.mem[0x0300:0x0303] == rom
+
+    with pytest.raises(ValueError):
+        cpu.load(rom, 0xfffe)
+
+def test_map_rom(tmp_path):
+    path = tmp_path / "rom.bin"
+    path.write_bytes(bytes([
+        MVI_A,  0x55,
+        STA,    0x00,   0x00,       # write to ROM is ignored
+        LDA,    0x00,   0x00,
+        HLT
+    ]))
+
+    cpu = CPU()
+    rom = cpu.map_rom(path)
+    cpu.run()
+    assert cpu.A == MVI_A
+    assert cpu.mem[0x0000] == MVI_A
+    assert cpu.read(0x00ff) == 0xff
+
+    other = CPU()
+    other.map_rom(rom)
+    other.run()
+    assert other.A == MVI_A
+
+    path.write_bytes(b"")
+    with pytest.raises(ValueError, match="empty"):
+        CPU().map_rom(path)
+
+def test_cycles():
+    cpu = CPU()
+    cpu.load([
+        MVI_B,  0x01,               # 7
+        ADD_B,                      # 4
+        CNZ,    0x07,   0x00,       # 17, taken
+        HLT,                        # 7
+        NOP,                        # 4
+        RZ,                         # 5, not taken
+        RNZ                         # 11, taken
+    ])
+    cpu.sp = 0x8000
+    cpu.run()
+    assert cpu.cycles == 7 + 4 + 17 + 4 + 5 + 11 + 7
+
+def test_run_for():
+    cpu = CPU()
+    cpu.load([
+        NOP,                        # 4
+        JMP,    0x00,   0x00        # 10
+    ])
+    assert cpu.run_for(100) == 102
+    assert not cpu.halt
+    cpu.run(cpu.cycles + 4)
+    assert cpu.cycles == 112
+
+def test_step():
+    for machine in (CPU(), VM()):
+        cpu = getattr(machine, "cpu", machine)
+        cpu.load([
+            MVI_B,  0x03,
+            DCR_B,                  # 0x02
+            JNZ,    0x02,   0x00,
+            HLT
+        ])
+        machine.step()
+        assert (cpu.pc, cpu.B, cpu.cycles) == (0x0002, 0x03, 7)
+        assert machine.step_n(2) == 2
+        assert (cpu.pc, cpu.B) == (0x0002, 0x02)
+        assert machine.step_n(100) == 5
+        assert cpu.halt
+
+def test_run_until():
+    for machine in (CPU(), VM()):
+        cpu = getattr(machine, "cpu", machine)
+        cpu.load([
+            MVI_B,  0x10,
+            DCR_B,                  # 0x02
+            JNZ,    0x02,   0x00,
+            HLT                     # 0x06
+        ])
+        assert machine.run_until(predicate=lambda cpu: cpu.B == 0x0c) == 1 + 2 * 3 + 1
+        assert machine.run_until(cycles=cpu.cycles + 15) == 2      # JNZ, DCR B
+        assert cpu.B == 0x0b
+        machine.run_until(pc=0x0006)
+        assert (cpu.pc, cpu.B, cpu.halt) == (0x0006, 0x00, False)
+        assert machine.run_until() == 1 and cpu.halt
+
+        cpu.pc, cpu.B, cpu.halt = 0x0002, 0x04, False
+        assert machine.run_until(pc=0x0006, cycles=cpu.cycles + 15) == 2
+        assert machine.run_until(pc=0x0006, predicate=lambda cpu: cpu.B == 0) == 5
+        assert machine.run_until(pc=0x0006, cycles=cpu.cycles + 1000) == 1
+        assert cpu.pc == 0x0006
+
+def test_snapshot(tmp_path):
+    cpu = CPU()
+    cpu.load([
+        MVI_B,  0x10,
+        DCR_B,                  # 0x02
+        OUT,    0x05,
+        JNZ,    0x02,   0x00,
+        HLT
+    ])
+    cpu.run_until(predicate=lambda cpu: cpu.B == 0x08)
+    data = cpu.snapshot()
+    cpu.run()
+
+    warm = CPU()
+    warm.restore(data)
+    assert warm.snapshot() == data
+    warm.run()
+    assert warm.snapshot() == cpu.snapshot()
+
+    cpu.save(tmp_path / "state")
+    with open(tmp_path / "state", "rb") as f:
+        warm.restore(f)
+    assert warm.snapshot() == cpu.snapshot()
+
+    with pytest.raises(ValueError):
+        warm.restore(data[:-1])
+    with pytest.raises(ValueError):
+        warm.restore(b"XXXX" + data[4:])
+
+def test_backends():
+    from benchmarks.workloads import recursion, block_copy
+
+    for program in (recursion(), block_copy()):
+        states = []
+        for backend in BACKENDS:
+            cpu = CPU(backend)
+            cpu.load(program)
+            cpu.run()
+            states.append(cpu.snapshot())
+
+        cpu = CPU()
+        cpu.load(program)
+        VM(cpu).run()
+        states.append(cpu.snapshot())
+        assert states.count(states[0]) == len(states)
+
+    with pytest.raises(ValueError):
+        CPU("jit")
+
+def test_slots():
+    cpu = CPU()
+    assert not hasattr(cpu, "__dict__")
+    with pytest.raises(AttributeError):
+        cpu.accumulator = 0x00
+    cpu.HL = 0x1234
+    assert (cpu.H, cpu.L, cpu.regs[4], cpu.regs[5]) == (0x12, 0x34, 0x12, 0x34)
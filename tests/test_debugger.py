@@ -0,0 +1,132 @@
+from emulator import CPU, Translator
+from emulator.assembler import *
+from emulator.debugger import Debugger, Hit
+from emulator.instructions import dispatch, generic
+from emulator.memory import CODE, IO, BREAK
+
+
+# count B up five times, storing it at 0x2000
+COUNT = [
+    MVI_B,  0x00,
+    INR_B,                  # 0x02
+    MOV_A_B,
+    STA,    0x00,   0x20,
+    CPI,    0x05,
+    JNZ,    0x02,   0x00,
+    LDA,    0x00,   0x20,   # 0x0c
+    HLT
+]
+
+def machines():
+    for backend in ("reference", "specialized", "translated"):
+        cpu = CPU(backend)
+        cpu.load(COUNT)
+        yield cpu, cpu
+    cpu = CPU()
+    cpu.load(COUNT)
+    yield Translator(cpu), cpu
+
+def test_no_overhead():
+    for backend, table in (("reference", generic), ("specialized", dispatch)):
+        cpu = CPU(backend)
+        cpu.load(COUNT)
+        debugger = Debugger(cpu)
+        debugger.break_at(0x0002)
+        assert cpu.table is not table
+        debugger.clear(0x0002)
+        debugger.run()
+        assert cpu.table is table
+
+def test_breakpoint():
+    for machine, cpu in machines():
+        reference = CPU()
+        reference.load(COUNT)
+        debugger = Debugger(machine)
+        debugger.break_at(0x0003)
+        for count in range(1, 4):
+            hit = debugger.run()
+            reference.run_until(pc=0x0003)
+            assert hit == Hit("break", 0x0003, MOV_A_B)
+            assert (cpu.pc, cpu.B, cpu.cycles) == (0x0003, count, reference.cycles)
+            assert not cpu.halt
+            reference.step()
+        debugger.clear(0x0003)
+        assert debugger.run() is None
+        assert cpu.halt and cpu.A == 5
+
+def test_step():
+    cpu = CPU()
+    cpu.load(COUNT)
+    debugger = Debugger(cpu)
+    debugger.break_at(0x0002)
+    assert debugger.run() == Hit("break", 0x0002, INR_B)
+    assert debugger.step() is None
+    assert (cpu.pc, cpu.B) == (0x0003, 1)
+
+def test_watchpoints():
+    for machine, cpu in machines():
+        debugger = Debugger(machine)
+        debugger.watch(0x2000)
+        assert debugger.run() == Hit("write", 0x2000, 1)
+        assert cpu.mem[0x2000] == 1 and not cpu.halt
+        if machine is cpu and cpu.backend != "translated":
+            assert cpu.pc == 0x0007
+        assert debugger.run() == Hit("write", 0x2000, 2)
+
+        debugger.unwatch(0x2000)
+        debugger.watch(0x2000, read=True, write=False)
+        assert debugger.run() == Hit("read", 0x2000, 5)
+        assert debugger.run() is None
+        assert cpu.halt and cpu.A == 5
+        debugger.unwatch(0x2000)
+        assert cpu.pages[0x20] & ~CODE == 0
+        assert cpu.mem[0x2000] == 5
+
+def test_watched_code_page_is_translated():
+    cpu = CPU("translated")
+    cpu.load([
+        LDA,    0xf0,   0x00,   # polls 0x00f0 in the code page
+        ORA_A,
+        JZ,     0x00,   0x00,
+        HLT
+    ])
+    debugger = Debugger(cpu)
+    debugger.watch(0x00f0, read=True, write=False)
+    assert debugger.run(10000) == Hit("read", 0x00f0, 0)
+    assert cpu.cycles < 100
+    assert cpu.pages[0x00] & IO == 0
+    assert "read(0x00f0)" in cpu.translator.cache[0x0000].source
+
+def test_breakpoint_in_mapped_code():
+    for backend in ("reference", "specialized", "translated"):
+        cpu = CPU(backend)
+        cpu.map_rom(bytes(COUNT))
+        debugger = Debugger(cpu)
+        debugger.break_at(0x0003)
+        assert debugger.run() == Hit("break", 0x0003, MOV_A_B), backend
+        assert cpu.B == 1
+
+        cpu = CPU(backend)
+        cpu.map(0x0000, 0x100, IO, read=lambda addr: COUNT[addr] if addr < len(COUNT) else 0, write=lambda addr, data: None)
+        cpu.mem[0x2000] = 0
+        debugger = Debugger(cpu)
+        debugger.break_at(0x0003)
+        assert debugger.run() == Hit("break", 0x0003, MOV_A_B), backend
+
+def test_breakpoint_on_rewritten_code():
+    for backend in ("reference", "specialized", "translated"):
+        cpu = CPU(backend)
+        cpu.load([
+            MVI_A,  INR_B,
+            STA,    0x06,   0x00,   # store INR B over the NOP
+            NOP,
+            NOP,                    # 0x06
+            HLT
+        ])
+        debugger = Debugger(cpu)
+        debugger.break_at(0x0006)
+        assert debugger.run() == Hit("break", 0x0006, INR_B), backend
+        assert debugger.run() is None
+        assert cpu.B == 1
+        debugger.clear(0x0006)
+        assert cpu.pages[0x00] & BREAK == 0
@@ -0,0 +1,58 @@
+from emulator import CPU
+from emulator.asm import assemble
+from emulator.assembler import *
+from emulator.disassembler import Disassembler
+from emulator.instructions import CYCLES
+from emulator.memory import IO
+from emulator.opcodes import OPCODES
+
+
+def test_table():
+    assert [op.opcode for op in OPCODES] == list(range(256))
+    assert [op.cycles for op in OPCODES] == CYCLES
+    assert OPCODES[MOV_B_C][1:3] == ("MOV", ("B", "C"))
+    assert OPCODES[LXI_SP][1:5] == ("LXI", ("SP",), 3, "d16")
+    assert OPCODES[0xcb].mnemonic == "JMP"
+
+def test_round_trip():
+    # every opcode disassembles to text that assembles to the same
+    # instruction; undocumented aliases assemble to their documented twin
+    for opc in range(256):
+        mem = bytearray(1 << 16)
+        mem[0:3] = bytes([opc, 0xa5, 0xcb])
+        ins = Disassembler(mem).decode(0)
+        image = assemble(ins.text).image
+        twin = OPCODES[image[0]]
+        assert twin.mnemonic == OPCODES[opc].mnemonic
+        assert image[1:] == mem[1:ins.length], ins.text
+
+def test_stream():
+    cpu = CPU()
+    cpu.load([
+        MVI_A,  0xff,
+        CALL,   0x34,   0x12,
+        MOV_M_A,
+        HLT
+    ])
+    dis = Disassembler(cpu)
+    code = dis.stream()
+    assert [next(code).text for _ in range(4)] == [
+        "MVI  A,0FFH", "CALL 1234H", "MOV  M,A", "HLT"
+    ]
+    assert dis.listing(0, 5).splitlines() == ["0000  3E FF     MVI  A,0FFH", "0002  CD 34 12  CALL 1234H"]
+
+    first = dis.decode(0x0002)
+    assert dis.decode(0x0002) is first
+    cpu.mem[0x0004] = 0x00
+    assert dis.decode(0x0002).text == "CALL 0034H"
+
+def test_mapped_pages():
+    cpu = CPU()
+    cpu.map_rom(bytes([MVI_A, 0x42, HLT]))
+    code = [LXI_HL, 0x34, 0x12]
+    cpu.map(0x1000, 0x100, IO, read=lambda addr: code[addr & 0x03] if addr & 0xff < 3 else 0, write=lambda addr, data: None)
+    disassembler = Disassembler(cpu)
+    assert disassembler.decode(0x0000).text == "MVI  A,42H"
+    assert disassembler.decode(0x1000).text == "LXI  H,1234H"
+    code[1] = 0x78
+    assert disassembler.decode(0x1000).text == "LXI  H,1278H"
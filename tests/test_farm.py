@@ -0,0 +1,27 @@
+from emulator.assembler import *
+from emulator.farm import Farm, Job
+
+
+SUM = [
+    XRA_A,
+    ADD_B,                  # 0x01
+    DCR_B,
+    JNZ,    0x01,   0x00,
+    STA,    0x00,   0x01,
+    HLT
+]
+
+def test_farm():
+    jobs = [Job("sum", {"B": n}, output=[(0x0100, 1)]) for n in range(1, 40)]
+    with Farm({"sum": SUM}, max_workers=2) as farm:
+        results = farm.map(jobs, chunksize=8)
+        budget = list(farm.run([Job("sum", {"B": 200}, cycles=100)]))
+
+    assert [r.index for r in results] == list(range(39))
+    for n, result in zip(range(1, 40), results):
+        assert result.halt
+        assert result.memory == [bytes([n * (n + 1) // 2 & 0xff])]
+        assert result.regs[0] == 0
+
+    assert not budget[0].halt
+    assert 100 <= budget[0].cycles < 110
@@ -0,0 +1,83 @@
+import pytest
+
+from emulator import CPU
+from emulator.history import History
+from emulator.interrupts import Controller
+from benchmarks.workloads import recursion
+from test_replay import SUM, Noise
+
+
+def state(cpu):
+    return bytes(cpu.regs), cpu.flags, cpu.pc, cpu.sp, cpu.cycles, bytes(cpu.mem)
+
+def test_step_back():
+    program = recursion()
+    reference = CPU()
+    reference.load(program)
+    states = [state(reference)]
+    for _ in range(3000):
+        reference.step()
+        states.append(state(reference))
+
+    cpu = CPU()
+    cpu.load(program)
+    history = History(cpu, interval=500, limit=8)
+    history.run(reference.cycles)
+    assert history.count == 3000
+    assert len(history.checkpoints) <= 8
+    assert history.interval > 500
+
+    for n in (1, 7, 450, 1000):
+        history.seek(3000)
+        history.step_back(n)
+        assert state(cpu) == states[3000 - n]
+    with pytest.raises(ValueError):
+        history.step_back(5000)
+
+    history.run()
+    assert cpu.halt and cpu.HL == 2584
+
+def test_run_back():
+    cpu = CPU()
+    cpu.load(recursion())
+    history = History(cpu, interval=200, limit=4)
+    history.run(20000)
+    here = history.count
+    sp = cpu.sp
+
+    # the last time the stack was deeper than now
+    back = history.run_back(lambda cpu: cpu.sp < sp)
+    assert back is not None and cpu.sp < sp
+    assert history.count == here - back
+    history.step_back(0)
+    assert history.run_back(lambda cpu: cpu.sp == 0x1234) is None
+    assert history.count == here - back
+
+def test_input_and_interrupts():
+    cpu = CPU()
+    cpu.load(SUM)
+    noise = cpu.bus.attach(Noise(), 0x00)
+    history = History(cpu, interval=1000)
+    controller = Controller(history)
+    controller.recorder = history
+    controller.every(700, lambda cycle: controller.interrupt(7))
+    controller.run(20000)
+    end = cpu.cycles
+    final = state(cpu), cpu.ports[0]
+    draws = noise.rng.getstate()
+
+    history.step_back(500)
+    assert state(cpu) != final[0]
+    history.run(end)
+    assert (state(cpu), cpu.ports[0]) == final
+
+    # the last interrupt taken
+    history.run_back(lambda cpu: cpu.pc == 0x38)
+    assert (cpu.pc, cpu.B) == (0x38, 27)
+
+    # going back and forth reads nothing from the device
+    history.run_back(lambda cpu: cpu.B == 10)
+    assert cpu.B == 10
+    history.run(end)
+    assert (state(cpu), cpu.ports[0]) == final
+    assert noise.rng.getstate() == draws
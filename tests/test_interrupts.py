@@ -0,0 +1,145 @@
+from emulator import CPU, VM, Translator
+from emulator.assembler import *
+from emulator.interrupts import Controller, Scheduler
+
+
+# count RST 1 interrupts in B while idling in HLT
+VBLANK = [
+    LXI_SP, 0x00,   0x01,   # 0x00
+    EI,
+    HLT,                    # 0x04
+    JMP,    0x04,   0x00,
+    INR_B,                  # 0x08, RST 1
+    EI,
+    RET
+]
+
+def test_scheduler():
+    fired = []
+    events = Scheduler()
+    events.schedule(30, fired.append)
+    events.schedule(10, fired.append)
+    events.cancel(events.schedule(20, fired.append))
+    assert events.next() == 10
+    events.fire(25)
+    assert fired == [10]
+    assert events.next() == 30
+
+def test_periodic_interrupt():
+    for machine in (CPU(), VM(), Translator(CPU())):
+        cpu = getattr(machine, "cpu", machine)
+        cpu.load(VBLANK)
+        controller = Controller(machine)
+        ticks = []
+
+        def vblank(cycle):
+            ticks.append(cycle)
+            controller.interrupt(1)
+
+        timer = controller.every(1000, vblank)
+        controller.run(10500)
+        assert ticks == list(range(1000, 10001, 1000))
+        assert cpu.B == 10
+        assert cpu.halt
+        assert cpu.cycles == 10500
+
+        controller.cancel(timer)
+        controller.run()
+        assert cpu.B == 10
+
+def test_masked_interrupt():
+    cpu = CPU()
+    cpu.load([
+        LXI_SP, 0x00,   0x01,
+        MVI_A,  0x00,
+        INR_A,                  # 0x05
+        CPI,    0x20,
+        JNZ,    0x05,   0x00,
+        EI,
+        HLT,                    # 0x0c
+        NOP,
+        NOP,
+        NOP,
+        INR_B,                  # 0x10, RST 2
+        HLT
+    ])
+    controller = Controller(cpu)
+    controller.schedule(50, lambda cycle: controller.interrupt(2))
+    controller.run()
+    assert (cpu.A, cpu.B) == (0x20, 1)
+    # the HLT after EI runs before the interrupt is taken
+    assert cpu.read_16(cpu.sp) == 0x000d
+
+def test_idle_loop():
+    # JMP $ waiting for interrupts instead of HLT
+    results = []
+    for machine in (CPU(), Translator(CPU())):
+        cpu = getattr(machine, "cpu", machine)
+        cpu.load([
+            LXI_SP, 0x00,   0x01,
+            EI,
+            JMP,    0x04,   0x00,   # 0x04
+            NOP,
+            INR_B,                  # 0x08, RST 1
+            EI,
+            RET
+        ])
+        controller = Controller(machine)
+        controller.every(1000, lambda cycle: controller.interrupt(1))
+        controller.run(100500)
+        results.append((cpu.B, cpu.pc, cpu.sp, cpu.cycles))
+    assert results[0] == results[1]
+    assert results[0][0] == 100
+
+def test_no_interrupt_right_after_EI():
+    # a request raised inside the ISR waits for the RET after EI, so
+    # interrupts never nest and nothing is pushed below 0x00fe
+    rom = [
+        LXI_SP, 0x00,   0x01,
+        EI,
+        JMP,    0x04,   0x00,   # 0x04
+    ] + [NOP] * 49 + [
+        INR_B,                  # 0x38, RST 7
+        EI,
+        RET
+    ]
+    for make in (CPU, VM, lambda: Translator(CPU())):
+        for cycle in range(112, 140):
+            machine = make()
+            cpu = getattr(machine, "cpu", machine)
+            cpu.load(rom)
+            controller = Controller(machine)
+            controller.schedule(100, lambda cycle: controller.interrupt(7))
+            controller.schedule(cycle, lambda cycle: controller.interrupt(7))
+            controller.run(400)
+            assert cpu.B == 2
+            assert cpu.read_16(0x00fc) == 0x0000, cycle
+
+def test_snapshot_after_EI():
+    rom = [
+        LXI_SP, 0x00,   0x01,
+        EI,
+        MVI_B,  0x01,           # 0x04
+        HLT,
+    ] + [NOP] * 49 + [
+        MOV_C_B,                # 0x38, RST 7
+        HLT
+    ]
+    cpu = CPU()
+    cpu.load(rom)
+    cpu.run_until(pc=0x0004)
+    data = cpu.snapshot()
+    warm = CPU()
+    warm.restore(data)
+    assert warm.snapshot() == data
+
+    for machine in (cpu, warm):
+        controller = Controller(machine)
+        controller.interrupt(7)
+        controller.run()
+        assert machine.C == 0x01
+
+    # no EI in flight: a stale ei is not held against the restored CPU
+    warm.ei = cpu.cycles
+    warm.restore(cpu.snapshot())
+    assert warm.ei == -1
@@ -0,0 +1,36 @@
+from emulator import CPU, VM
+from emulator.assembler import *
+from emulator.profiler import Profiler
+
+
+LOOP = [
+    MVI_B,  0x64,
+    DCR_B,                  # 0x02
+    JNZ,    0x02,   0x00,
+    HLT
+]
+
+def test_profile():
+    for machine in (CPU(), VM()):
+        cpu = getattr(machine, "cpu", machine)
+        cpu.load(LOOP)
+        profiler = Profiler()
+        machine.run(profiler=profiler)
+        assert cpu.halt and cpu.B == 0
+        assert cpu.cycles == 7 + 100 * (5 + 10) + 7
+
+        addresses, opcodes = profiler.report(2)
+        assert addresses == [(0x0002, 100), (0x0003, 100)]
+        assert [op[:3] for op in opcodes] == [("DCR_B", DCR_B, 100), ("JNZ", JNZ, 100)]
+        assert profiler.opcodes[HLT] == 1
+
+def test_sampling():
+    cpu = CPU()
+    cpu.load(LOOP)
+    profiler = Profiler(sample=10)
+    cpu.run(profiler=profiler)
+    assert sum(profiler.opcodes) == (1 + 200 + 1) // 10
+    assert sum(profiler.addresses) == sum(profiler.opcodes)
+
+    profiler.reset()
+    assert not any(profiler.addresses)
@@ -0,0 +1,80 @@
+import io
+import random
+
+import pytest
+
+from emulator import CPU, VM, Translator
+from emulator.assembler import *
+from emulator.bus import Device
+from emulator.interrupts import Controller
+from emulator.replay import Recorder, Replay, Divergence, records, PORT, IRQ, END
+
+
+# sum port 0 into C while RST 7 counts timer ticks in B
+SUM = [
+    LXI_SP, 0x00,   0x01,
+    EI,
+    IN,     0x00,           # 0x04
+    ADD_C,
+    MOV_C_A,
+    JMP,    0x04,   0x00,
+] + [NOP] * 0x2d + [
+    INR_B,                  # 0x38, RST 7
+    EI,
+    RET
+]
+
+class Noise(Device):
+
+    def __init__(self):
+        self.rng = random.Random(8080)
+
+    def read(self, port):
+        return self.rng.randrange(256)
+
+def record(machine):
+    cpu = getattr(machine, "cpu", machine)
+    cpu.load(SUM)
+    cpu.bus.attach(Noise(), 0x00)
+    controller = Controller(machine)
+    controller.every(700, lambda cycle: controller.interrupt(7))
+    log = io.BytesIO()
+    with Recorder(machine, log, controller):
+        controller.run(20000)
+    return cpu, log.getvalue()
+
+def state(cpu):
+    return cpu.regs, cpu.flags, cpu.pc, cpu.sp, cpu.cycles, cpu.mem, cpu.ports
+
+def test_record():
+    cpu, log = record(CPU())
+    tags = [tag for tag, _, _ in records(log)]
+    assert tags.count(IRQ) == cpu.B == 28
+    assert tags.count(PORT) > 100
+    assert tags[-1] == END
+    assert records(log)[-1][1] == cpu.cycles
+
+def test_replay():
+    for recorded_on, replayed_on in (
+        (CPU, CPU), (CPU, VM), (Translator, Translator), (Translator, CPU)
+    ):
+        recorded, log = record(recorded_on(CPU()) if recorded_on is Translator else recorded_on())
+        machine = replayed_on(CPU()) if replayed_on is Translator else replayed_on()
+        cpu = getattr(machine, "cpu", machine)
+        cpu.load(SUM)
+        Replay(machine, log).run()
+        assert state(cpu) == state(recorded)
+
+def test_divergence():
+    _, log = record(CPU())
+    cpu = CPU()
+    cpu.load(SUM)
+    cpu.mem[0x05] = 0x01            # IN 0x01
+    with pytest.raises(Divergence):
+        Replay(cpu, log).run()
+
+def test_bad_log():
+    with pytest.raises(ValueError):
+        records(b"I80S\x01\x00")
+    with pytest.raises(ValueError):
+        records(b"I80R\x01\x00\x00\x80")
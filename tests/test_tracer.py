@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+from emulator import CPU, VM
+from emulator.bus import Blocked, Device
+from emulator.assembler import *
+from emulator.tracer import Tracer, read
+
+
+LOOP = [
+    MVI_B,  0x0a,
+    DCR_B,                  # 0x02
+    JNZ,    0x02,   0x00,
+    HLT
+]
+
+def test_ring():
+    for machine in (CPU(), VM()):
+        cpu = getattr(machine, "cpu", machine)
+        cpu.load(LOOP)
+        tracer = Tracer(size=8)
+        machine.run(tracer=tracer)
+        assert tracer.count == 1 + 2 * 10 + 1
+
+        last = tracer.last(3)
+        assert [(r.pc, r.opcode) for r in last] == [(0x02, DCR_B), (0x03, JNZ), (0x06, HLT)]
+        assert last[0].bc == 0x0000
+        assert last[-1].cycles == cpu.cycles
+        assert len(tracer.last()) == 8
+
+def test_stream(tmp_path):
+    cpu = CPU()
+    cpu.load(LOOP)
+    stream = io.BytesIO()
+    tracer = Tracer(size=8, stream=stream)
+    cpu.run(20, tracer=tracer)
+    cpu.run(tracer=tracer)
+    tracer.flush()
+
+    (tmp_path / "trace").write_bytes(stream.getvalue())
+    columns = read(tmp_path / "trace")
+    assert len(columns["pc"]) == tracer.count
+    assert list(columns["pc"][:4]) == [0x00, 0x02, 0x03, 0x02]
+    assert list(columns["bc"][:3]) == [0x0a00, 0x0900, 0x0900]
+    assert columns["opcode"][-1] == HLT
+    assert list(columns["opcode"][-8:]) == [r.opcode for r in tracer.last()]
+
+def test_blocked_keeps_trace():
+    class Waiting(Device):
+        def read(self, port):
+            return None
+
+    cpu = CPU()
+    cpu.load([MVI_B, 0x01, IN, 0x10, HLT])
+    cpu.bus.attach(Waiting(), 0x10)
+    tracer = Tracer(size=8)
+    with pytest.raises(Blocked):
+        cpu.run(tracer=tracer)
+    assert tracer.count == 1
+    assert [(r.pc, r.opcode) for r in tracer.last()] == [(0x00, MVI_B)]
@@ -0,0 +1,242 @@
+from emulator import CPU, Translator
+from emulator.translator import _interpret
+from emulator.memory import IO, ROM
+from emulator.assembler import *
+
+def run_both(rom):
+    cpus = []
+    for translate in (False, True):
+        cpu = CPU()
+        cpu.load(rom)
+        cpu.sp = 0x8000
+        if translate:
+            Translator(cpu).run()
+        else:
+            cpu.run()
+        cpus.append(cpu)
+    return cpus
+
+def assert_same(interpreted, translated):
+    assert (
+        interpreted.regs, interpreted.flags, interpreted.pc,
+        interpreted.sp, interpreted.cycles
+    ) == (
+        translated.regs, translated.flags, translated.pc,
+        translated.sp, translated.cycles
+    )
+    assert interpreted.mem == translated.mem
+
+def test_loop():
+    interpreted, translated = run_both([
+        MVI_B,  0x10,
+        XRA_A,
+        ADD_B,                      # 0x03
+        DCR_B,
+        JNZ,    0x03,   0x00,
+        HLT
+    ])
+    assert_same(interpreted, translated)
+    assert translated.A == 0x88
+
+def test_call_ret():
+    interpreted, translated = run_both([
+        LXI_HL, 0x00,   0x20,
+        CALL,   0x0a,   0x00,
+        CALL,   0x0a,   0x00,
+        HLT,
+        MVI_M,  0x5a,               # 0x0a
+        INX_HL,
+        RET
+    ])
+    assert_same(interpreted, translated)
+    assert translated.mem[0x2000:0x2002] == bytes([0x5a, 0x5a])
+
+def test_self_modifying_code():
+    interpreted, translated = run_both([
+        MVI_B,  0x01,               # 0x00
+        LDA,    0x01,   0x00,
+        INR_A,
+        STA,    0x01,   0x00,       # patch the MVI operand
+        MOV_A_B,
+        CPI,    0x03,
+        JNZ,    0x00,   0x00,
+        HLT
+    ])
+    assert_same(interpreted, translated)
+    assert (translated.B, translated.mem[0x01]) == (0x03, 0x04)
+
+def test_invalidate():
+    cpu = CPU()
+    cpu.load([NOP, NOP, HLT])
+    translator = Translator(cpu)
+    translator.run()
+    assert 0x0000 in translator.cache
+    cpu.write(0x0001, NOP)
+    assert 0x0000 not in translator.cache
+    assert not any(translator.marks)
+
+def test_flags_match_interpreter():
+    # straight-line runs mixing flag producers and consumers; the
+    # translator computes only the consumed flags but must end up with
+    # the same state as the interpreter
+    import random
+    rng = random.Random(8080)
+    registers = [opc for opc in range(0x40, 0x80) if opc & 0x07 != 6 and opc & 0x38 != 0x30]
+    alu = [opc for opc in range(0x80, 0xc0) if opc & 0x07 != 6]
+    counters = [opc for opc in range(0x04, 0x40) if opc & 0x06 == 0x04 and opc & 0x38 != 0x30]
+    single = [RLC, RRC, RAL, RAR, STC, CMC, CMA, DAD_BC, DAD_DE, DAD_HL, PUSH_PSW, POP_PSW]
+    for _ in range(200):
+        rom = [LXI_SP, 0x00, 0x80]
+        for reg in (MVI_B, MVI_C, MVI_D, MVI_E, MVI_H, MVI_L, MVI_A):
+            rom += [reg, rng.randrange(256)]
+        for _ in range(40):
+            kind = rng.randrange(6)
+            if kind == 0:
+                rom.append(rng.choice(registers))
+            elif kind == 1:
+                rom.append(rng.choice(alu))
+            elif kind == 2:
+                rom += [rng.choice([ADI, ACI, SUI, SBI, ANI, XRI, ORI, CPI]), rng.randrange(256)]
+            elif kind == 3:
+                rom.append(rng.choice(counters))
+            elif kind == 4:
+                rom.append(rng.choice(single))
+            else:
+                # both ways lead to the next instruction
+                nxt = len(rom) + 3
+                rom += [rng.choice([JNZ, JZ, JNC, JC, JPO, JPE, JP, JM]), nxt & 0xff, nxt >> 8]
+        rom.append(HLT)
+        interpreted, translated = run_both(rom)
+        assert_same(interpreted, translated)
+
+DELAYS = [
+    MVI_B,  0x00,
+    DCR_B,                      # 0x02, 256 times
+    JNZ,    0x02,   0x00,
+    MVI_C,  0x05,
+    NOP,                        # 0x08
+    DCR_C,
+    JNZ,    0x08,   0x00,
+    LXI_DE, 0x34,   0x12,
+    DCX_DE,                     # 0x10
+    MOV_A_D,
+    ORA_E,
+    JNZ,    0x10,   0x00,
+    HLT
+]
+
+def run_blocks(cpu, max_cycles):
+    # run the interpreter on to the jump ending the block a translator
+    # would have stopped after
+    cpu.run(max_cycles)
+    cpu.run_until(predicate=lambda cpu: cpu.ir in (JNZ, JZ))
+
+def test_delay_loops():
+    interpreted, translated = run_both(DELAYS)
+    assert_same(interpreted, translated)
+    translator = Translator(translated)
+    for start in (0x02, 0x08, 0x10):
+        assert "translator.limit" in translator.translate(start).source
+
+    for max_cycles in (1, 100, 3590, 3601, 5000, 200000):
+        interpreted, translated = CPU(), CPU()
+        for cpu in (interpreted, translated):
+            cpu.load(DELAYS)
+        run_blocks(interpreted, max_cycles)
+        Translator(translated).run(max_cycles)
+        assert_same(interpreted, translated)
+
+def test_polling_loop():
+    poll = [
+        LDA,    0x00,   0x20,   # 0x00
+        ORA_A,
+        JZ,     0x00,   0x00,
+        HLT
+    ]
+    for io in (False, True):
+        interpreted, translated = CPU(), CPU()
+        for cpu in (interpreted, translated):
+            cpu.load(poll)
+            if io:
+                cpu.map(0x3000, 0x100, IO, lambda addr: 0, lambda addr, data: None)
+        translator = Translator(translated)
+        for max_cycles in (1000, 100001):
+            run_blocks(interpreted, max_cycles)
+            translator.run(max_cycles)
+            assert_same(interpreted, translated)
+        assert translator.cache[0x0000].__name__ == "poll"
+        for cpu in (interpreted, translated):
+            cpu.mem[0x2000] = 0x01
+        interpreted.run()
+        translator.run()
+        assert_same(interpreted, translated)
+        assert translated.halt
+
+def test_remap_drops_blocks():
+    for backend in ("specialized", "translated"):
+        cpu = CPU(backend)
+        cpu.load([MVI_A, 0x01, HLT])
+        cpu.run()
+        rom = bytes([MVI_A, 0x02, HLT])
+        cpu.map(0x0000, 0x100, IO | ROM, read=lambda addr: rom[addr] if addr < 3 else 0, write=lambda addr, data: None)
+        cpu.pc, cpu.halt = 0x0000, False
+        cpu.run()
+        assert cpu.A == 0x02, backend
+
+def test_map_rom_is_translated():
+    cpu = CPU("translated")
+    cpu.map_rom(bytes([
+        MVI_B,  0x10,
+        DCR_B,                      # 0x02
+        JNZ,    0x02,   0x00,
+        HLT
+    ]))
+    cpu.run()
+    assert (cpu.B, cpu.halt) == (0x00, True)
+    assert cpu.translator.cache[0x0002] is not _interpret
+
+def test_io_code_is_cached():
+    cpu = CPU("translated")
+    rom = bytes([NOP, NOP, HLT])
+    cpu.map(0x0000, 0x100, IO, read=lambda addr: rom[addr] if addr < 3 else 0, write=lambda addr, data: None)
+    cpu.run()
+    assert cpu.translator.cache[0x0001] is _interpret
+    cpu.map(0x0000, 0x100)
+    assert not cpu.translator.cache
+
+def test_cycle_budget_in_rom_and_io_code():
+    rom = bytes([JMP, 0x00, 0x00])
+    cpu = CPU("translated")
+    cpu.map_rom(rom)
+    cpu.run(1000)
+    assert 1000 <= cpu.cycles < 1010
+
+    interpreted, translated = CPU(), CPU("translated")
+    for cpu in (interpreted, translated):
+        cpu.map(0x0000, 0x100, IO, read=lambda addr: rom[addr] if addr < 3 else 0, write=lambda addr, data: None)
+        cpu.run(1000)
+    assert translated.cycles == interpreted.cycles == 1000
+
+def test_polling_checks_only_pages_read():
+    reads = []
+
+    def status(addr):
+        reads.append(addr)
+        return 0
+
+    cpu = CPU()
+    cpu.load([
+        LXI_HL, 0x00,   0x30,
+        MOV_A_M,                # 0x03
+        ORA_A,
+        JZ,     0x03,   0x00,
+        HLT
+    ])
+    cpu.map(0x4000, 0x100, IO, status, lambda addr, data: None)
+    translator = Translator(cpu)
+    translator.run(10 ** 9)                 # skipped: IO elsewhere
+    assert cpu.cycles >= 10 ** 9
+
+    cpu.map(0x3000, 0x100, IO, status, lambda addr, data: None)
+    translator.run(cpu.cycles + 2000)       # polled: every read goes to the device
+    assert len(reads) > 50